@@ -12,36 +12,42 @@
 # Also flags non-25FPS video (Useful for Lightworks editing!)
 #
 
-# specialised, non-standard lib imports:
-# library for the stills EXIF data
-try:
-    import exifread
-except:
-    print ("exifread was not found in the same directory as this program")
-    #Todo: Exit code 101 => Exifread not found
-    exit(101)
+# specialised, non-standard libs - none are loaded at startup, so scripted runs start quickly:
+# exifread (stills EXIF) is only loaded by exifFast for files its own reader can't do
+# tkinter is only loaded for the folder dialogs (see askDirectory)
 
 # for video metadata
-try:
-    from MediaInfoDLL3 import *
-except :
-    print ("MediaInfo library not found in the same directory as this program\n Video wont work")
-    #Currently MI only works with a 64bit Python
-    # die without media info
-    # TODO: be more elegant - spew a URL?
-    # Todo: Exit code 102 => MediaInfo not found
-    exit(102)
+# MediaInfo is optional: MP4/MOV/MTS headers are read directly by videoProbe,
+# MediaInfoDLL3 is only used (via metaExtract) for files that can't be read that way
 
 # standard Python imports
 import traceback
 import os
 import time
 from datetime import datetime, timedelta
-import tkinter as tk
-from tkinter import filedialog
-import shutil
 import re
+import queue
+import threading
+import sys
+import argparse
 from operator import attrgetter
+from concurrent.futures import ThreadPoolExecutor
+
+# local modules, in the same dir as this program
+import metaExtract
+import exifFast
+import copyScheduler
+import copyEngine
+import importLedger
+import transferJournal
+import importManifest
+import runMetrics
+import transferProgress
+import burstIndex
+import renameEngine
+import dedupIndex
+import destIndex
+import cardWatcher
 
 # only handle known types
 # TODO: Sort out casing
@@ -59,6 +65,9 @@ class CTError(Exception):
 
 #class for managing sequences of images in the same second
 class processedName():
+    # no per instance __dict__ - a big folder has a lot of these
+    __slots__ = ('origName', 'dateTime', 'origSeq', 'type', 'seq', 'newName')
+
     def __init__(self,origName= "",dateTime= "",seq= -1,type= ""):
         self.origName = origName
         self.dateTime = dateTime    #exif date-time
@@ -71,9 +80,18 @@ class processedName():
         return str( self.origName) + '\t' + str(self.dateTime)  + '\t'+ str(self.origSeq)  + \
                '\t' + str(self.type) + '\tseq:' + str(self.seq)+ '\tnN:' + str(self.newName)
 
+# the date of an item with no metadata yet - one shared (immutable) object, not one per item
+NO_DATE = datetime(1,1,1)
+
 #class for managing sequences of images in the same second
 # design itteration from processedName, with adds for renaming.
 class mediaItem():
+    # Kept small for archives of several 100k files: __slots__ instead of a __dict__ per item, and
+    # the strings many items share but each work out anew (file types, day folders, suffixes) are
+    # interned, so each is held once. The scan already gives each folder's files one origPath string
+    __slots__ = ('origPath', 'origName', 'fileType', 'dateTime', 'subSec', 'StillVideo', 'size', 'mtimeNs',
+                 'scanIdx', 'source', 'hash', 'origSeq', 'seq', 'newPath', 'newName', 'namePrefix', 'nameSuffix')
+
     def __init__(self,origPath = "",origName= "",StillVideo = "",fileType= ""):
         '''
             setup a new mediaItem instance.
@@ -82,11 +100,12 @@ class mediaItem():
         self.origPath = origPath
         self.origName = origName
         if fileType != "":              # file type origName[origName.rfind('.')+1:]
-            self.fileType = fileType    #explicitly set
+            self.fileType = sys.intern(fileType)    #explicitly set
         else:                           #extract it
-            self.fileType = origName[origName.rfind('.')+1:]
+            self.fileType = sys.intern(origName[origName.rfind('.')+1:])
 
-        self.dateTime = datetime(1,1,1)              #Metadata (exif) date-time - as a pure date for sorting & processing
+        self.dateTime = NO_DATE         #Metadata (exif) date-time - as a pure date for sorting & processing
+        self.subSec = ""                # EXIF sub-second time digits, to order shots within one second
         # is this still or video media type ('S' or 'V']
         if self.fileType in INCLUDED_STILL_TYPES:
             self.StillVideo = 'S'
@@ -95,7 +114,11 @@ class mediaItem():
         else:
             self.StillVideo = 'U'   # unknown for now
 
-        self.size = 0                   # size on disk (nice for updating progress)
+        self.size = 0                   # size on disk, from the scan (progress totals, free space check)
+        self.mtimeNs = 0                # mod time (ns) from the dir scan, 0 if not known
+        self.scanIdx = 0                # position in the source scan, to keep ordering stable
+        self.source = 0                 # which source (card) it came from, when ingesting several
+        self.hash = ""                  # checksum of the data, taken while copying
         # try to grab a sequence number from the file NAME (takes the first contiguous number string)
         try:
             self.origSeq = int(re.findall(r'\d+',origName)[0])
@@ -114,43 +137,37 @@ class mediaItem():
             '\t fileType<' + str(self.fileType) + '>\tseq:' + str(self.seq)+ \
             '\n new Path:' + str(self.newPath) + '\t newN:' + str(self.newName)
 
-    def updateMediaTags(self):
+    def updateMediaTags(self, tags = None):
         ''' open the file via os, mediaInfo or exifread to get tags
             Based on getModTime() and getEXIFTime() ideas
             Sets newName to its default value
             Sets dateTime,and FPS check for Vid
+            :param tags: raw tags already read by metaExtract (eg from a worker pool).
+                    If None, the file is opened and read here
         '''
 
+        if tags is None:
+            tags = metaExtract.readMediaTagsCached(self.origPath+self.origName, self.StillVideo)
+
         if self.StillVideo == 'S':
             # use exif data
-            f = open(self.origPath+self.origName,'rb')
-            try:
-                tags = exifread.process_file(f, stop_tag='EXIF DateTimeOriginal', details=False)
-                # print(tags['EXIF DateTimeOriginal'])
-            except:
-                # the error will be caught in the tag processing
-                pass
-
-            try:
+            EXIFDateTime = tags['DateTimeOriginal']
+            self.subSec = sys.intern(tags.get('SubSecTimeOriginal', ""))
+            if EXIFDateTime != "":
                 # get the exif version date time
-                EXIFDateTime = str(tags['EXIF DateTimeOriginal'])
                 # print("EXIFDateTime ="+EXIFDateTime)
                 self.newName = EXIFDateTime.replace(':','-')
-            except:
+            else:
                 # else use the file modified date (Creation gets changed on copy)
                 print ("Couldn't read EXIF date on " + self.origPath+self.origName + "\nUsing mod time")
+                runMetrics.getMetrics().count('stillModTime')
                 self.newName = getModTime(self.origPath+self.origName)
 
             self.dateTime = datetime.strptime(self.newName, "%Y-%m-%d %H-%M-%S")
-            f.close()
 
         elif self.StillVideo == 'V':
             # use MediaInfo
-            MI = MediaInfo()
-            MI.Open(self.origPath+self.origName)
-            # print("Info for ", srcname)
-
-            encodedDate = MI.Get(Stream.General, 0, "Encoded_Date")
+            encodedDate = tags["Encoded_Date"]
 
             # HACK! MI ALWAYS includes "UTC" on encoded time, even if it's actually local :(
             # Also remove the "20" since it takes space on the timeline/ bin  in LWKS
@@ -162,12 +179,13 @@ class mediaItem():
             if encodedDate == "":
                 # this uses the datetime library, which handles all the midnight/ end of month type issues
                 # https://docs.python.org/3/library/datetime.html
-                fileModDate = MI.Get(Stream.General, 0, "File_Modified_Date")
+                runMetrics.getMetrics().count('videoModTime')
+                fileModDate = tags["File_Modified_Date"]
                 #convert this to a datetime format
                 fDT = datetime.strptime(fileModDate, "%Z %Y-%m-%d %H:%M:%S.%f")
 
                 # convert the duration from millseonds to a datetime object
-                fileDuration = timedelta(0, float( MI.Get(Stream.General, 0, "Duration") )/1000 )
+                fileDuration = timedelta(0, float( tags["Duration"] )/1000 )
 
                 # print("Mod:  " + fileModDate + " duration (s) " + str(fileDuration))
                 # reverse back to the start time of the clip, and correct for TImezone
@@ -181,12 +199,10 @@ class mediaItem():
 
             # To track non-25fps movies for later transcoding
             # embed a "-##FPS" before the filetype for non-25FPS files
-            # print("FrameRate :",MI.Get(Stream.General, 0, "FrameRate"))
-            FPS = float(MI.Get(Stream.General, 0, "FrameRate"))
+            # print("FrameRate :",tags["FrameRate"])
+            FPS = float(tags["FrameRate"])
             if FPS != 25:
-                self.nameSuffix += "_%dFPS"%FPS
-
-            MI.Close()
+                self.nameSuffix = sys.intern(self.nameSuffix + "_%dFPS"%FPS)
 
     def getDate(self):
         """ return the YYYY_MM_DD a file was created """
@@ -199,7 +215,10 @@ def createSequencedNames(dirName):
         :return: a list of processedName objects with correctly sequenced names
     '''
 
-    dirList=os.listdir(dirName)
+    metrics = runMetrics.getMetrics()
+    with metrics.phase('scan'):
+        with os.scandir(dirName) as entries:
+            dirList = [e.name for e in entries if e.is_file()]
     print('%3d files found to process' % len(dirList))
 
     # a list of processedNames
@@ -209,7 +228,8 @@ def createSequencedNames(dirName):
         # set full name and extract type (no path)
         p = processedName(origName,"",0,origName[origName.rfind('.')+1:])
         if p.type in INCLUDED_STILL_TYPES:  #only try to get date from EXIF compliant files
-            p.dateTime = getEXIFTime(dirName + '/'+ origName)
+            with metrics.phase('metadata'), metrics.timeFile('metadata'):
+                p.dateTime = getEXIFTime(dirName + '/'+ origName)
             # try to grab a sequence number from the file NAME
             try:
                 p.origSeq = int(re.findall(r'\d+',origName)[0])
@@ -217,27 +237,20 @@ def createSequencedNames(dirName):
                 p.origSeq = 0
         newNames.append(p)
 
-    #find sequences in same file types
-    prevDateTime = ""  # dateTime is always set, thus this will work for 1st iteration.
-    prevType = ""
-    seqTrack = 0
-
-    #sort by type to find same-second sequences
-    newNames.sort(key = attrgetter('type', 'origSeq'))
-
-    # uses indexing to deal with the 'previous' element in a sequence
-    for i in range(len(newNames)):
-        if newNames[i].dateTime == prevDateTime and newNames[i].type == prevType:
-            if seqTrack == 0: # on the first one of a seq, go back and fix the previous
-                newNames[i-1].seq = seqTrack
-                seqTrack += 1
-            newNames[i].seq = seqTrack
-            seqTrack += 1
-        else:
-            seqTrack = 0
+    with metrics.phase('sequence'):
+        sequenceNames(newNames)
+    return newNames
 
-        prevDateTime = newNames[i].dateTime
-        prevType = newNames[i].type
+def sequenceNames(newNames):
+    '''
+        number the same-second shots of each file type, and build the new names
+        :param newNames: list of processedNames with dateTime & origSeq set
+    '''
+
+    #find sequences in same file types - only the stills have a dateTime
+    stills = [n for n in newNames if n.type in INCLUDED_STILL_TYPES]
+    burstIndex.sequenceBursts(stills, attrgetter('dateTime'), attrgetter('type'), attrgetter('origSeq'),
+                              nameOf = attrgetter('origName'))
 
     #sequencing sorted, now build the file names
     for n in newNames:
@@ -248,7 +261,6 @@ def createSequencedNames(dirName):
                 n.newName = n.dateTime + '.'+ n.type
         else:
             n.newName = n.origName
-    return newNames
 
 def getModTime(srcname):
     # get the file MODIFIED time
@@ -263,28 +275,18 @@ def getModTime(srcname):
 def getEXIFTime(srcname):
     # get the image time based on EXIF metadata, esle use mod time
     newName = ""
-    f = open(srcname,'rb')
-    try:
-        # tags = exifread.process_file(f)
-        tags = exifread.process_file(f, stop_tag='EXIF DateTimeOriginal')
-        # tags = exifread.process_file(f,stop_tag='EXIF DateTime')
-        # print(tags['EXIF DateTimeOriginal'])
-    except:
-        # the error will be caught in the tag processing
-        pass
+    tags = metaExtract.readMediaTagsCached(srcname, 'S')
 
-    try:
+    if tags['DateTimeOriginal'] != "":
         # get the exif version date time
-        EXIFDateTime = str(tags['EXIF DateTimeOriginal'])
         # print("EXIFDateTime ="+EXIFDateTime)
-        newName = EXIFDateTime.replace(':','-')
-    except:
+        newName = tags['DateTimeOriginal'].replace(':','-')
+    else:
         # else use the file modified date (Creation gets changed on copy)
         print ("Couldn't read EXIF date on " + srcname + "\nUsing mod time")
+        runMetrics.getMetrics().count('stillModTime')
         newName = getModTime(srcname)
 
-    f.close()
-
     return newName
 
 def get_sec(s):
@@ -306,20 +308,18 @@ def getMItime(srcname):
         mediainfo.dll & py mus tbe in the same dir
     '''
 
-    MI = MediaInfo()
-    MI.Open(srcname)
-    # print("Info for ", srcname)
+    tags = metaExtract.readMediaTagsCached(srcname, 'V')
 
     # To track non-25fps movies for later transcoding
     # embed a "-##FPS" before the filetype for non-25FPS files
-    # print("FrameRate :",MI.Get(Stream.General, 0, "FrameRate"))
-    FPS = float(MI.Get(Stream.General, 0, "FrameRate"))
+    # print("FrameRate :",tags["FrameRate"])
+    FPS = float(tags["FrameRate"])
     if FPS == 25:
         FPSMod = ""
     else:
         FPSMod = "_%dFPS"%FPS
 
-    encodedDate = MI.Get(Stream.General, 0, "Encoded_Date")
+    encodedDate = tags["Encoded_Date"]
     # TODO: Proper datetime restructure, since MI returns colons in time!!
 
     # HACK! MI ALWAYS includes "UTC" on encoded time, even if it's actually local :(
@@ -331,12 +331,13 @@ def getMItime(srcname):
     if encodedDate == "":
         # this uses the datetime library, which handles all the midnight/ end of month type issues
         # https://docs.python.org/3/library/datetime.html
-        fileModDate = MI.Get(Stream.General, 0, "File_Modified_Date")
+        runMetrics.getMetrics().count('videoModTime')
+        fileModDate = tags["File_Modified_Date"]
         #convert this to a datetime format
         fDT = datetime.strptime(fileModDate, "%Z %Y-%m-%d %H:%M:%S.%f")
 
         # convert the duration from millseonds to a datetime object
-        fileDuration = timedelta(0, float( MI.Get(Stream.General, 0, "Duration") )/1000 )
+        fileDuration = timedelta(0, float( tags["Duration"] )/1000 )
 
         # print("Mod:  " + fileModDate + " duration (s) " + str(fileDuration))
         # reverse back to the start time of the clip, and correct for TImezone
@@ -350,14 +351,12 @@ def getMItime(srcname):
     encodedDate += FPSMod
     # print("new encoded time: " + encodedDate)
 
-    MI.Close()
-
     return encodedDate
 
 def renameVideoFolder(dirName):
     """
     Rename all the Video image files in dirName to M####-yy-mm-dd-hh-mm-sswhere #### is a sequence num.
-    :returns number of files written
+    :returns (number of files written, number of errors)
     """
     '''
         should be re-runable - if newname = oldname, happily do nothing
@@ -365,36 +364,41 @@ def renameVideoFolder(dirName):
         handle duplicates on HDD during rename
     '''
 
-    dirList=os.listdir(dirName)
+    metrics = runMetrics.getMetrics()
+    with metrics.phase('scan'):
+        with os.scandir(dirName) as entries:
+            dirList = [e.name for e in entries if e.is_file()]
 
     errorCount = 0
     # a sequence counter for aiding NLE timeline clip ID
     seqCount = 0
+    # all the new names are worked out first, then renamed in one go (see renameEngine)
+    pairs = []
 
     for shortName in dirList:
         fname = dirName + '/' + shortName
         # print ("File name is " + fname)
-        if os.path.isfile(fname):
-            if fname[fname.rfind('.')+1:] in INCLUDED_VIDEO_TYPES:
-                #print ("File name is " + fname)
-                try:
-                    # note the prepended "V%d" MAY cause sort-by-name to not equal sort by mod date??? May need to sort the names first???
-                    # solved in copy version (using mediaItem class) by having a proper prefix field
-                    newName = dirName + '/' + "V%d_" % seqCount + getMItime(fname) + '.'+fname[fname.rfind('.')+1:]
-                    seqCount += 1
-                    # TODO: if the file exists, this is an error (for now)  Check about re-runs, etc
-                    # if not os.path.exists(newName):
-                    # print("Rename " + fname[-30:] + " to "+ newName[-30:])
-                    print('.',end='')
-                    os.rename(fname,newName)
-
-                except Exception as e:
-                    errorCount += 1
-                    print ("Oh no. Rename " + fname + " failed")
-                    print(traceback.format_exc())
+        if fname[fname.rfind('.')+1:] in INCLUDED_VIDEO_TYPES:
+            #print ("File name is " + fname)
+            try:
+                # note the prepended "V%d" MAY cause sort-by-name to not equal sort by mod date??? May need to sort the names first???
+                # solved in copy version (using mediaItem class) by having a proper prefix field
+                with metrics.phase('metadata'), metrics.timeFile('metadata'):
+                    newName = "V%d_" % seqCount + getMItime(fname) + '.'+fname[fname.rfind('.')+1:]
+                seqCount += 1
+                pairs.append((shortName, newName))
+
+            except Exception:
+                errorCount += 1
+                print ("Oh no. Reading " + fname + " failed")
+                print(traceback.format_exc())
+
+    with metrics.phase('rename'):
+        _, renameErrors = renameEngine.renameFolder(dirName, pairs, dirList)
+    errorCount += renameErrors
 
     if errorCount : print("There were %2d errors" % errorCount)
-    return seqCount
+    return seqCount, errorCount
 
 def renameStillsFolder(dirName,newNameList):
     """
@@ -403,292 +407,1435 @@ def renameStillsFolder(dirName,newNameList):
     :param newNameList - list of processedName objects, ready to be applied to HDD
     """
 
-    errorCount = 0
-
-    #for shortName in dirList:
-    for n in newNameList:
-        fname = dirName + '/' + n.origName
-
-        if os.path.isfile(fname):
-            if n.type in INCLUDED_STILL_TYPES:
-                #print ("File name is " + fname)
-                try:
-                    newName = dirName + '/' + n.newName
-                    # print("Rename " + fname[-30:] + " to "+ newName[-30:])
-                    print('.',end='')
-                    os.rename(fname,newName)
+    metrics = runMetrics.getMetrics()
 
-                except Exception as e:
-                    errorCount += 1
-                    print ("Oh no. Rename " + fname + " failed")
-                    print(traceback.format_exc())
+    # renamed in one go, so a new name still held by another file in the list is moved out of the way first
+    pairs = [(n.origName, n.newName) for n in newNameList if n.type in INCLUDED_STILL_TYPES]
+    with metrics.phase('rename'):
+        _, errorCount = renameEngine.renameFolder(dirName, pairs, [n.origName for n in newNameList])
 
-    print()
     if errorCount : print("There were %2d errors" % errorCount)
     return errorCount
 
-def setupStillsRename():
+def askDirectory(title, initialdir):
+    '''
+    ask for a folder with the tkinter dialog. tkinter is only loaded here, so runs given
+    their folders (eg from the command line) don't need it
+    :return: the folder, "" on cancel
+    '''
+    from tkinter import filedialog
+    return filedialog.askdirectory(title = title, initialdir = initialdir)
+
+def setupStillsRename(profile = False, traceMemory = False, reportDir = None, stillsPath = None):
     '''
     get the folder name for processing
+    :param profile, traceMemory: profile the run (cProfile)/ trace its memory (tracemalloc) - see runMetrics
+    :param reportDir: folder for the run report, default runMetrics.defaultReportDir()
+    :param stillsPath: folder to rename. None asks for one
+    :return: number of errors
     '''
-    stillsPath = filedialog.askdirectory(
-                title = "Directory in which to rename jpg & ARW & CR2 & Tif files ",
-                initialdir = "C:/Users/grant/Documents/scratch/sonySDStructure/DCIM/10060708"
-                )
+    if stillsPath is None:
+        stillsPath = askDirectory("Directory in which to rename jpg & ARW & CR2 & Tif files ",
+                                  "C:/Users/grant/Documents/scratch/sonySDStructure/DCIM/10060708")
 
     print(stillsPath)
     # Exit on cancel!
-    if stillsPath == "" : return
+    if stillsPath == "" : return 0
+
+    # an interrupted rename is finished from its journal first
+    if not renameEngine.recoverBeforeRename(stillsPath): return 1
 
     start_time=time.time()
+    metrics = runMetrics.startRun('renameStills', profile, traceMemory)
 
-    #renameStillsFolder(stillsPath)
     newNames = createSequencedNames(stillsPath)
-    # for n in newNames:
-    #     print(n)
-    renameStillsFolder(stillsPath,newNames)
+    errorCount = renameStillsFolder(stillsPath,newNames)
+    reportName = metrics.finish(reportDir, {'source': stillsPath, 'files': len(newNames), 'errors': errorCount})
+    print ('Run report written to ' + reportName)
     print ('Done. Execution took {:0.3f} seconds'.format((time.time() - start_time)))
+    return errorCount
 
-    # TODO Double check what happens to sequence numbers on renaming renamed files. Seems to be dependent on natural order?
-    # maybe sort by EXIF date if seq is the same for the whole folder (since it defaults to year in this case)
-
-def setupVideoRename():
+def setupVideoRename(profile = False, traceMemory = False, reportDir = None, videoPath = None):
     '''
     get the folder name for processing
     Ultimately, this will be called by a GUI button?
+    :param profile, traceMemory: profile the run (cProfile)/ trace its memory (tracemalloc) - see runMetrics
+    :param reportDir: folder for the run report, default runMetrics.defaultReportDir()
+    :param videoPath: folder to rename. None asks for one
+    :return: number of errors
     '''
-    videoPath = filedialog.askdirectory(
-                title = "Directory in which to rename jpg & ARW & CR2 & Tif files ",
-                initialdir = "C:/Users/grant/Documents/scratch/sonySDStructure/DCIM/10060708"
-                )
+    if videoPath is None:
+        videoPath = askDirectory("Directory in which to rename jpg & ARW & CR2 & Tif files ",
+                                 "C:/Users/grant/Documents/scratch/sonySDStructure/DCIM/10060708")
 
     print(videoPath)
     # Exit on cancel!
-    if videoPath == "" : return
+    if videoPath == "" : return 0
+
+    # an interrupted rename is finished from its journal first
+    if not renameEngine.recoverBeforeRename(videoPath): return 1
 
     start_time=time.time()
+    metrics = runMetrics.startRun('renameVideo', profile, traceMemory)
 
-    # for n in newNames:
-    #     print(n)
-    print("renameVid output:"+ str(renameVideoFolder(videoPath)))
+    renamed, errorCount = renameVideoFolder(videoPath)
+    print("renameVid output:"+ str(renamed))
 
+    reportName = metrics.finish(reportDir, {'source': videoPath, 'files': renamed, 'errors': errorCount})
+    print ('Run report written to ' + reportName)
     print ('Done. Execution took {:0.3f} seconds'.format((time.time() - start_time)))
+    return errorCount
 
-def traverseMediaTree(mediaSource):
+def scanMediaTree(mediaSource):
     '''
-    create two lists of mediaItems (stills & video) of the media in mediaSource to
+    generator of mediaItems (stills & video) for the media in mediaSource
 
     Must deal with media at all levels, from root and down,
        traverse any sub-dirs found (ala Sony), or deal with mixed contents (ala Canon)
-        Largely based on
+    Walks with os.scandir and an explicit stack (no recursion), in the same depth-first order as
+    os.listdir would give. size & mtimeNs come from the DirEntry, so there is no extra stat per file.
+    Items are yielded as they are found, so the caller can start work before the walk is done.
+        Originally based on
         http://stackoverflow.com/users/1126776/dmytro
         http://stackoverflow.com/questions/22078621/python-how-to-copy-files-fast
         removed the symlink stuff - will only work on 'real'  dirs
     '''
 
-    # any FILES at root level
-    names = os.listdir(mediaSource)
-    errors = []
-    for name in names:
-        srcname = mediaSource + '/' +name
-        #try:
-        if os.path.isdir(srcname):
-            traverseMediaTree(srcname)
-        else:
-            newMI = mediaItem(srcname[:srcname.rfind('/')+1],srcname[srcname.rfind('/')+1:] )
-            if newMI.StillVideo == 'S':
-                stillsList.append(newMI)
-            if newMI.StillVideo == 'V':
-                videoList.append(newMI)
-            # print(srcname)
-            
-        #except:
+    # stack of (dir path with trailing '/', open scandir iterator)
+    stack = [(mediaSource.rstrip('/') + '/', os.scandir(mediaSource))]
+    try:
+        while stack:
+            dirPath, entries = stack[-1]
+            entry = next(entries, None)
+            if entry is None:
+                entries.close()
+                stack.pop()
+                continue
+
+            if entry.is_dir():
+                # go down first, and come back to the rest of this dir later
+                stack.append((dirPath + entry.name + '/', os.scandir(entry.path)))
+            else:
+                newMI = mediaItem(dirPath, entry.name)
+                if newMI.StillVideo in ('S', 'V'):
+                    statbuf = entry.stat()
+                    newMI.size = statbuf.st_size
+                    newMI.mtimeNs = statbuf.st_mtime_ns
+                    yield newMI
+    finally:
+        # if the caller stops early
+        for dirPath, entries in stack:
+            entries.close()
 
-    if errors:
-        raise CTError(errors)
+def traverseMediaTree(mediaSource):
+    '''
+    create two lists of mediaItems (stills & video) of the media in mediaSource
+    :return: (stillsList, videoList)
+    '''
+    stillsList = []
+    videoList = []
+    for newMI in scanMediaTree(mediaSource):
+        if newMI.StillVideo == 'S':
+            stillsList.append(newMI)
+        else:
+            videoList.append(newMI)
 
+    return stillsList, videoList
 
-def setupDirCopy():
+def nameStills(stillsList, stillRootDestination):
     '''
-    Setup the dirs - a shim to interface with the GUI when it comes
-    Copy and rename all the media from a user-selected dir to a stills and a video dir, each day getting it's own folder
-    Must traverse any sub-dirs found (ala Sony), or deal with mixed contents (ala Canon)
+    build the final newName & newPath of every still, once all their metadata is in
+    stills - sequences don't last longer than one second. Shots of the same type in the same second
+    are numbered -00, -01 ... in shooting order (see burstIndex) - per camera, where the cards have a
+    camera ID (its name prefix), as their names differ anyway
+    :return: the day folder names, in date order
+    '''
+    days = burstIndex.sequenceBursts(stillsList, attrgetter('dateTime'), attrgetter('namePrefix', 'fileType'),
+                                     attrgetter('origSeq'), attrgetter('subSec'),
+                                     lambda s: s.origPath + s.origName, mediaItem.getDate)
+    #
+    #sequencing sorted, now build the file names
+    for sd in stillsList:
+        if sd.seq != -1:
+            sd.nameSuffix = sys.intern("-%02d" % sd.seq)
+        sd.newName = sd.namePrefix + sd.newName + sd.nameSuffix + '.' + sd.fileType
+        sd.newPath = sys.intern(stillRootDestination + sd.getDate() + '/')
+    return days
 
-    Some of this could be in objectified variously. NExt phase ...
+def nameVideos(videoList, videoRootDestination, seqCount = 0):
+    '''
+    build the final newName & newPath of every video, once all their metadata is in
+    This requires the complete meta in place, since the prefix numbers run in time order
+    :param seqCount: the first V## number - where the last batch of the same import left off
+    :return: the next V## number
     '''
+    videoList.sort(key = lambda v:v.dateTime)
 
-    # Get the source
-    mediaSourcePath = filedialog.askdirectory(
-            title = "SOURCE of media (eg SD Card root) ",
-            initialdir = "C:/Users/grant/Documents/scratch/sonySDStructure/"
-            )
+    # for this version, simply let seq run across all videos in the dir - from every card in the run.
+    # A camera ID already in the prefix goes after the number, so sorting by name is still by time
+    for vd in videoList:
+        # TODO: prefix may get generalised in the GUI
+        vd.namePrefix = "V%d_" % seqCount + vd.namePrefix
+        seqCount += 1
+        vd.newName = vd.namePrefix + vd.newName + vd.nameSuffix + '.' + vd.fileType
+        vd.newPath = sys.intern(videoRootDestination + vd.getDate() + '/')
 
-    # Root of the destinations. Currently hardcoded. Ultimately will be in the GUI option setter
-    # add in a subdir for each day in the dir-walk
-    # stillRootDestination = "C:/Users/grant/Pictures/2016/"
-    # videoRootDestination = "C:/Users/grant/Videos/2016/"
-    # test values:
-    stillRootDestination = "C:/Users/grant/Documents/scratch/P2016/"
-    videoRootDestination = "C:/Users/grant/Documents/scratch/V2016/"
+        # print('nv:' + str(vd))
+    return seqCount
 
-    if not os.path.isdir(stillRootDestination):
-        os.mkdir(stillRootDestination)
+# number of items each queue between the ingest stages can hold
+PIPELINE_QUEUE_SIZE = 256
 
-    if not os.path.isdir(videoRootDestination):
-        os.mkdir(videoRootDestination)
+# max number of files handed to the metadata readers in one go
+META_BATCH = 32
 
-    copyCount = 0
+# files are copied to this (hidden) name in their day folder, until their final name is known
+TEMP_COPY_PREFIX = ".ptcopy-"
 
-    start_time=time.time()
-    # DONE: use an extension of processedName, Add attribs: still/video; abs src dir; abs dest dir; size; Date
-    # Recursively traverse mediaSource, and get out all the INCLUDED* files into twolists - stillsSrc, videoSrc. Include srcDir
-    # these could be parameters, but it will get confusing.
-    global stillsList
-    stillsList= []
+# RAW previews go in this sub-folder of each day folder (unless given a folder of their own)
+PREVIEW_FOLDER = "_previews"
 
-    global videoList
-    videoList = []
+# threads writing RAW previews
+PREVIEW_WORKERS = 2
 
-    traverseMediaTree(mediaSourcePath)
-    #
-    # STILLS
-    # now get all the metadata
-    for s in stillsList:
-        s.updateMediaTags()
-        # print(s)
-
-    # create a list of stillsDests and videoDests, and mark which files must go where
-    stillsList.sort(key = lambda v:v.dateTime)
-    stillsDirs = []
-    for s in stillsList:
-        d = s.getDate() # s.dateTime.strftime("%Y_%m_%d")
-        if d not in stillsDirs:
-            stillsDirs.append(d)
-
-    # stills - sequences don't last longer than one second, so the old sequence naming code is fine
-
-    #find sequences in same file types
-    prevDateTime = ""  # dateTime is always set, thus this will work for 1st iteration.
-    prevfileType = ""
-    seqTrack = 0
-    #
-    #sort by type to find same-second sequences
-    stillsList.sort(key = attrgetter('fileType', 'origSeq'))
-
-    # uses indexing to deal with the 'previous' element in a sequence
-    for i in range(len(stillsList)):
-        if stillsList[i].dateTime == prevDateTime and stillsList[i].fileType == prevfileType:
-            if seqTrack == 0: # on the first one of a seq, go back and fix the previous
-                stillsList[i-1].seq = seqTrack
-                seqTrack += 1
-            stillsList[i].seq = seqTrack
-            seqTrack += 1
-        else:
-            seqTrack = 0
-    
-        prevDateTime = stillsList[i].dateTime
-        prevfileType = stillsList[i].fileType
-    #
-    #sequencing sorted, now build the file names
-    for sd in stillsList:
-        if sd.seq != -1:
-            sd.nameSuffix = "-%02d" % sd.seq
-        sd.newName = sd.namePrefix + sd.newName + sd.nameSuffix + '.' + sd.fileType
-        sd.newPath = stillRootDestination + sd.getDate() + '/'
+# threads hashing files for the duplicate check (see dedupIndex.hashAhead)
+DEDUP_WORKERS = 4
 
-    # create all the stiils dirs
-    # List of failed folders
-    stillFolderErr = []
-    for s in stillsDirs:
+class cardSource():
+    '''
+    one of the cards (or folders) being ingested
+    '''
+    def __init__(self, index, path, cameraId = ""):
+        '''
+            :param index: its place in the list of sources (mediaItem.source)
+            :param cameraId: optional ID for the camera body, put in front of its files' names
+        '''
+        self.index = index
+        self.path = path
+        self.root = path.rstrip('/') + '/'
+        self.prefix = cameraId + '_' if cameraId else ""
+        self.card = None            # importLedger.cardIdentity, with a ledger or journal
+        self.items = []             # to import, from the scan
+        self.scanned = 0            # files found, including those skipped
+        self.skipped = 0
+
+class ingestPipeline():
+    '''
+    copy one or more cards as a stream:  scan -> metadata -> copy -> name
+    The cards are walked first, all at once (names & sizes only, no file is opened), so the total
+    bytes are known for the progress ETA, and checked against the free space before anything is copied.
+    Then each stage runs in its own thread, with bounded queues in between, so the card is being
+    read for copying while later files are still being parsed. Files are fed on from each card in
+    turn, so with several readers every one of them is kept busy.
+    The day folder is known as soon as a file's metadata is in, so the file is copied
+    straight into it under a temporary name. The final names (still sequences within one second,
+    video V## prefixes in time order) need every file's metadata, so they are applied at the end
+    by renaming within each day folder - no data is held back for them. The naming is one pass
+    over the files from every card, so two cards from the same shoot don't get clashing names.
+    What's already in the day folders is listed once per folder and kept in memory (see destIndex),
+    so a name that's taken there is never overwritten: the same file is left as it is, another one
+    gets the next free -NN name.
+    run() does all that for one import. A card watched after it's imported (see copySession) is one
+    import too: open() it, importItems(scanSources()), then importItems(scanPaths(...)) for each lot of
+    files that turns up on it - the video numbers run on from one lot to the next - and writeManifests()
+    at the end.
+    '''
+    def __init__(self, stillRootDestination, videoRootDestination,
+                 metaWorkers = metaExtract.META_WORKERS, metaSerial = False,
+                 copyWorkers = copyScheduler.COPY_WORKERS, deviceLimits = None, ledger = None,
+                 hashAlgo = None, progress = None, checkSpace = True, journal = None, dedup = None,
+                 transferMode = 'copy', previews = False, previewDir = None):
+        '''
+            :param ledger: an importLedger - files it has seen from this card before are skipped,
+                    and newly copied ones are added to it. None copies everything
+            :param hashAlgo: hash each file as it is copied (see importManifest.HASH_ALGOS), and write
+                    a manifest into each destination root. None skips this
+            :param progress: a transferProgress to report to (subscribe observers to it first).
+                    None makes one without observers
+            :param checkSpace: don't start copying if a destination doesn't have room for it all
+            :param journal: a transferJournal - copies an earlier, interrupted run of this card finished
+                    are kept, and big files it checkpointed are carried on from there. None starts afresh
+            :param dedup: what to do with a file whose content is already in its day folder, or
+                    earlier in this import (see dedupIndex): 'skip' it, 'link' its new name to the
+                    file already there (hardlink), or just 'report' it and copy it anyway. None doesn't look
+            :param transferMode: for files already on the same file system as their day folder (eg
+                    re-organising an old dump on the archive disk): 'reflink' them (falling back to a
+                    copy), hardlink ('link') them, or 'move' them - no data is copied, so they aren't
+                    hashed for the manifest. 'copy' copies them like any other (see copyEngine.shareFile)
+            :param previews: pull the JPEG preview out of each RAW (ARW, CR2) as it's read for its date,
+                    and write it next to the copy, named after it (see exifFast.findPreview). Nothing is decoded
+            :param previewDir: a folder for the previews (with a folder per day in it). None puts them in
+                    a PREVIEW_FOLDER in each day folder
+        '''
+        self.destRoot = {'S': stillRootDestination, 'V': videoRootDestination}
+        self.metaWorkers = metaWorkers
+        self.metaSerial = metaSerial
+        self.copyWorkers = copyWorkers
+        self.deviceLimits = deviceLimits
+        self.copier = None
+        self.ledger = ledger
+        self.journal = journal
+        self.hashAlgo = hashAlgo
+        self.manifests = []
+        # cardSources, and the number of devices they are on - set by run()
+        self.sources = []
+        self.readers = 1
+        self.skipCount = 0
+        # files kept/ carried on from an interrupted run (appended from the copy threads)
+        self.resumed = []
+        self.destIdx = destIndex.destIndex()
+        self.dedup = dedup
+        self.dedupIdx = None
+        if dedup is not None:
+            self.dedupIdx = dedupIndex.dedupIndex(hashAlgo or 'blake2b', TEMP_COPY_PREFIX[0], self.destIdx)
+        # (item, path of the file with the same content, True if that's in the library)
+        self.duplicates = []
+        # (item, source path of the file earlier in this import with the same content) - only
+        # duplicates once that file's copy has worked (see copyHeldBack)
+        self.heldBack = []
+        # started by run(), with dedup
+        self.hashPool = None
+        # scanIdx: library file, for items hardlinked rather than copied
+        self.linkTo = {}
+        self.transferMode = transferMode
+        # (item, mode used) for files given their new name without copying (appended from the copy threads)
+        self.shared = []
+        # (item, path) for files already in the library under their final name
+        self.identical = []
+        # files given another -NN name, as theirs was taken
+        self.renumbered = 0
+        self.wantPreviews = previews
+        self.previewDir = previewDir
+        # started by run()
+        self.previewPool = None
+        # scanIdx: temporary name of the item's preview (set from the preview threads)
+        self.previews = {}
+        self.previewDirs = set()
+        self.previewCount = 0
+        self.progress = progress or transferProgress.transferProgress()
+        self.checkSpace = checkSpace
+        # (folder, bytes needed, bytes free) for destinations too full to start
+        self.spaceErr = []
+
+        self.stillsList = []
+        self.videoList = []
+        # day folders made so far, per media type
+        self.dirs = {'S': [], 'V': []}
+        self.dirsSeen = set()
+        self.badDirs = set()
+        # errors, as in the old phased version: failed folders & source files
+        self.stillFolderErr = []
+        self.vidFolderErr = []
+        self.stillsFileErr = []
+        self.vidFileErr = []
+        # stage failures (eg the card disappearing mid scan)
+        self.stageErr = []
+
+        self.copyCount = 0
+        self.scanQ = queue.Queue(PIPELINE_QUEUE_SIZE)
+        self.copyQ = queue.Queue(PIPELINE_QUEUE_SIZE)
+
+        # carried from one lot of files to the next, in an import that's added to (see scanPaths):
+        # the next scanIdx and V## number, source path: final path of every file imported,
+        # duplicates already in the ledger, and the manifest entries per media type
+        self.nextScanIdx = 0
+        self.videoSeq = 0
+        self.finalPaths = {}
+        self.duplicatesRecorded = 0
+        self.manifestEntries = {'S': [], 'V': []}
+
+    def relPath(self, item):
+        '''
+        :return: the item's path relative to the card root, for the import ledger
+        '''
+        return item.origPath[len(self.sources[item.source].root):] + item.origName
+
+    def journalKey(self, item):
+        '''
+        :return: the item's key in the transfer journal
+        '''
+        return (self.sources[item.source].card, self.relPath(item), item.size, item.mtimeNs)
+
+    def fileErrors(self, item):
+        if item.StillVideo == 'S':
+            return self.stillsFileErr
+        return self.vidFileErr
+
+    def scanAll(self, source):
+        '''
+        walk one card, leaving out files already imported, and total up the bytes to copy
+        Sets source.items to the mediaItems to import. Runs in a thread per card
+        '''
+        items = []
+        source.scanned = 0
+        source.skipped = 0
         try:
-            # print(stillRootDestination+s)
-            if not os.path.isdir(stillRootDestination+s):
-                os.mkdir(stillRootDestination+s)
+            with runMetrics.getMetrics().phase('scan'):
+                for i, item in enumerate(scanMediaTree(source.path)):
+                    item.scanIdx = i
+                    item.source = source.index
+                    item.namePrefix = source.prefix
+                    source.scanned = i + 1
+                    # already ingested from this card? Checked before any metadata is read
+                    if self.ledger is not None and self.ledger.isImported(source.card, self.relPath(item),
+                                                                          item.size, item.mtimeNs):
+                        source.skipped += 1
+                        continue
+                    items.append(item)
+                    self.progress.addTotal(item.size)
         except:
             print(traceback.format_exc())
-            # track folders errors
-            stillFolderErr.append(stillRootDestination+s)
-            #Todo: Exit(103) with message
+            self.stageErr.append(source.path)
+        source.items = items
 
-    # now copy the stills files
-    stillsFileErr = [ ]
-    for sd in stillsList:
+    def interleave(self):
+        '''
+        :return: the items from every card, taken from each in turn
+        '''
+        items = []
+        lists = [source.items for source in self.sources]
+        for i in range(max((len(l) for l in lists), default = 0)):
+            for l in lists:
+                if i < len(l):
+                    items.append(l[i])
+        return items
+
+    def freeSpace(self, items):
+        '''
+        :return: list of (folder, bytes needed, bytes free) for destinations without room for items
+        '''
+        needs = {self.destRoot['S']: 0, self.destRoot['V']: 0}
+        # files on the same file system as their destination take no space, unless they're copied
+        sameDevice = set()
+        if self.transferMode != 'copy':
+            for source in self.sources:
+                for SV, root in self.destRoot.items():
+                    try:
+                        if os.stat(source.path).st_dev == os.stat(root).st_dev:
+                            sameDevice.add((source.index, SV))
+                    except OSError:
+                        pass
+        for item in items:
+            if (item.source, item.StillVideo) not in sameDevice:
+                needs[self.destRoot[item.StillVideo]] += item.size
+        return transferProgress.freeSpaceShortfall(needs)
+
+    def scanStage(self, items):
+        '''
+        feed the scanned items to the metadata stage
+        '''
         try:
-            # note shutil.copy2 preserves more OS level metadata
-            # currently will overwrite if already exists
-            # TODO: add a 'overwrite' all check
-            shutil.copy2(sd.origPath + sd.origName , sd.newPath + sd.newName)
-            copyCount += 1
-            print('.',end='')
+            for item in items:
+                self.scanQ.put(item)
+        finally:
+            self.scanQ.put(None)
+
+    def metadataStage(self):
+        '''
+        read tags in small batches as items arrive, make the day folders, and pass items on to be copied
+        '''
+        metrics = runMetrics.getMetrics()
+        try:
+            with metaExtract.tagExtractor(self.metaWorkers, self.metaSerial,
+                                          previews = self.previewPool is not None) as extractor:
+                done = False
+                while not done:
+                    # wait for one item, then take whatever else is already queued
+                    batch = [self.scanQ.get()]
+                    while batch[-1] is not None and len(batch) < META_BATCH:
+                        try:
+                            batch.append(self.scanQ.get_nowait())
+                        except queue.Empty:
+                            break
+                    if batch[-1] is None:
+                        done = True
+                        batch.pop()
+
+                    jobs = [(m.origPath + m.origName, m.StillVideo, m.size, m.mtimeNs or None) for m in batch]
+                    with metrics.phase('metadata'):
+                        allTags = extractor.extract(jobs)
+                    ready = []
+                    for item, tags in zip(batch, allTags):
+                        try:
+                            if tags is None:
+                                raise RuntimeError("No metadata for " + item.origPath + item.origName)
+                            with metrics.phase('metadata'):
+                                item.updateMediaTags(tags)
+                        except:
+                            print(traceback.format_exc())
+                            self.fileErrors(item).append(item.origPath + item.origName)
+                            self.progress.skip(item.size)
+                            continue
+                        if self.makeDayDir(item):
+                            ready.append((item, tags))
+                        else:
+                            self.progress.skip(item.size)
+
+                    known = {}
+                    if self.dedupIdx is not None and ready:
+                        known = self.hashAhead([item for item, tags in ready])
+                    for item, tags in ready:
+                        if self.dedupIdx is None or not self.isDuplicate(item, known.get(item.origPath + item.origName)):
+                            self.copyQ.put(item)
+                            if self.previewPool is not None and exifFast.hasPreview(item.origName):
+                                self.previewPool.submit(self.extractPreview, item, tags.get('Preview', False))
         except:
             print(traceback.format_exc())
-            stillsFileErr.append(sd.origPath + sd.origName)
-            # Todo: Exit(104) with message
+            self.stageErr.append('metadata')
+        finally:
+            self.copyQ.put(None)
 
-    # VIDEO
+    def makeDayDir(self, item):
+        '''
+        set the item's newPath and make sure its day folder exists
+        :return: False if the folder couldn't be made
+        '''
+        root = self.destRoot[item.StillVideo]
+        d = item.getDate() # s.dateTime.strftime("%Y_%m_%d")
+        item.newPath = sys.intern(root + d + '/')
+        if (root, d) not in self.dirsSeen:
+            self.dirsSeen.add((root, d))
+            self.dirs[item.StillVideo].append(d)
+            try:
+                with runMetrics.getMetrics().phase('mkdir'):
+                    if not os.path.isdir(root + d):
+                        os.mkdir(root + d)
+            except:
+                print(traceback.format_exc())
+                # track folders errors
+                self.badDirs.add(root + d)
+                if item.StillVideo == 'S':
+                    self.stillFolderErr.append(root + d)
+                else:
+                    self.vidFolderErr.append(root + d)
+                #Todo: Exit(103) with message
+        return root + d not in self.badDirs
+
+    def hashAhead(self, items):
+        '''
+        hash the files of a batch the duplicate check will compare, on the hash pool's threads
+        :return: {source path: dedupCandidate} for isDuplicate
+        '''
+        try:
+            with runMetrics.getMetrics().phase('dedup'):
+                return self.dedupIdx.hashAhead([(item.origPath + item.origName, item.size, item.newPath)
+                                                for item in items], self.hashPool)
+        except OSError:
+            # eg a day folder that can't be listed - isDuplicate finds out for each file
+            print(traceback.format_exc())
+            return {}
 
-    # Do sequence renaming
-    for v in videoList:
-        # update meta data
-        v.updateMediaTags()
+    def isDuplicate(self, item, known = None):
+        '''
+        look for the item's content in its day folder, and among the files before it in this import
+        :param known: the item's dedupCandidate from hashAhead, if it's been hashed
+        :return: True if it's been dealt with (skipped, to be linked, or held back), False to copy it
+        '''
+        src = item.origPath + item.origName
+        metrics = runMetrics.getMetrics()
+        try:
+            with metrics.phase('dedup'):
+                match = self.dedupIdx.check(src, item.size, item.newPath, known)
+        except OSError:
+            # can't tell - copy it
+            print(traceback.format_exc())
+            return False
+        if match is None:
+            return False
+        if not match.inLibrary and self.dedup != 'report':
+            # if the copy of the file it's the same as fails, this one is copied instead (see copyHeldBack)
+            self.heldBack.append((item, match.path))
+            return True
+        self.duplicates.append((item, match.path, match.inLibrary))
+        metrics.count('duplicates')
+        if self.dedup == 'report':
+            return False
+        self.progress.skip(item.size)
+        if self.dedup == 'link' and match.inLibrary:
+            # named with the rest, then linked to the file already there - nothing is copied
+            self.linkTo[item.scanIdx] = match.path
+            item.hash = match.full if self.hashAlgo is not None else ""
+            if item.StillVideo == 'S':
+                self.stillsList.append(item)
+            else:
+                self.videoList.append(item)
+        return True
 
-    videoList.sort(key = lambda v:v.dateTime)
-    videoDirs = []
-    for v in videoList:
-        d = v.getDate() #v.dateTime.strftime("%Y_%m_%d")
-        if d not in videoDirs:
-            videoDirs.append(d)
+    def previewFolder(self, item):
+        '''
+        :return: the folder for the item's preview, made if need be
+        '''
+        if self.previewDir is None:
+            folder = item.newPath + PREVIEW_FOLDER + '/'
+        else:
+            folder = os.path.join(self.previewDir, item.getDate(), '')
+        if folder not in self.previewDirs:
+            os.makedirs(folder, exist_ok = True)
+            self.previewDirs.add(folder)
+        return folder
 
-    # create the new names for all the files.
-    # This requires the complete meta in place, so can't be done in the previous loop!
-    # for this version, simply let seq run across all videos in the dir
+    def extractPreview(self, item, location):
+        '''
+        write a RAW's embedded JPEG preview, under a temporary name until the RAW's final name is known.
+        Runs in a preview thread
+        :param location: [offset, length] from the metadata, None if it hasn't got one, or
+                False if that wasn't looked for (eg tags cached by an older version)
+        '''
+        src = item.origPath + item.origName
+        metrics = runMetrics.getMetrics()
+        try:
+            with metrics.timeFile('preview', workerCpu = True):
+                if location is False:
+                    location = exifFast.findPreview(src)
+                if not location:
+                    metrics.count('noPreview')
+                    return
+                dst = self.previewFolder(item) + self.tempName(item) + '.jpg'
+                data = exifFast.readPreview(src, location)
+                with open(dst, 'wb') as f:
+                    f.write(data)
+            self.previews[item.scanIdx] = dst
+        except:
+            # only a preview - the copy carries on without it
+            print(traceback.format_exc())
 
-    seqCount = 0
-    for vd in videoList:
-        # TODO: prefix may get generalised in the GUI for camera ID, etc
-        vd.namePrefix = "V%d_" % seqCount
-        seqCount += 1
-        vd.newName = vd.namePrefix + vd.newName + vd.nameSuffix + '.' + vd.fileType
-        vd.newPath = videoRootDestination + vd.getDate() + '/'
+    def finalPreview(self, item, keep):
+        '''
+        give the item's preview its final name, from the item's - or remove it, if the item wasn't kept
+        '''
+        temp = self.previews.pop(item.scanIdx, None)
+        if temp is None:
+            return
+        try:
+            if keep:
+                os.replace(temp, os.path.join(os.path.dirname(temp), item.newName + '.jpg'))
+                self.previewCount += 1
+            else:
+                os.remove(temp)
+        except OSError:
+            print(traceback.format_exc())
 
-        # print('nv:' + str(vd))
+    def tempName(self, item):
+        '''
+        :return: the temporary name an item is copied to. Unique per source file,
+                 since two card folders can both have a DSC00001.JPG
+        '''
+        return TEMP_COPY_PREFIX + str(item.scanIdx) + '-' + item.origName
 
-    # create all the video dirs
-    # List of failed folders
-    vidFolderErr = []
-    #Todo: DAMP over DRY - refactor v to vidItem
-    for v in videoDirs:
+    def copyStage(self):
+        '''
+        hand each item to the copy scheduler, which runs several copies at once
+        The copy phase's wall time is from the first copy starting to the last finishing,
+        its CPU is that of the copy threads
+        If the stage itself fails, the rest of the queue is still taken (as file errors), so the
+        metadata stage is never left waiting on a full queue
+        '''
+        wall = None
         try:
-            # print(videoRootDestination+v)
-            if not os.path.isdir(videoRootDestination+v):
-                os.mkdir(videoRootDestination+v)
+            # enough copies to keep every card reader going
+            workers = max(self.copyWorkers, copyScheduler.COPY_PER_SOURCE_DEVICE * self.readers)
+            self.copier = copyScheduler.copyScheduler(workers, deviceLimits = self.deviceLimits)
+            while True:
+                item = self.copyQ.get()
+                if item is None:
+                    return
+                if wall is None:
+                    wall = time.perf_counter()
+                try:
+                    # note copyFile keeps the same OS level metadata as shutil.copy2
+                    self.copier.submit(item.origPath + item.origName, item.newPath + self.tempName(item),
+                                       item.size, lambda job, error, item = item: self.copyDone(item, job, error),
+                                       lambda src, dst, item = item: self.copyOne(item, src, dst))
+                except:
+                    # eg the card was pulled - its folder can't be looked at any more
+                    print(traceback.format_exc())
+                    self.fileErrors(item).append(item.origPath + item.origName)
+                    self.progress.skip(item.size)
         except:
             print(traceback.format_exc())
-            # track folders errors
-            vidFolderErr.append(videoRootDestination+v)
+            self.stageErr.append('copy')
+            item = self.copyQ.get()
+            while item is not None:
+                self.fileErrors(item).append(item.origPath + item.origName)
+                self.progress.skip(item.size)
+                item = self.copyQ.get()
+        finally:
+            if self.copier is not None:
+                self.copier.close()
+            if wall is not None:
+                runMetrics.getMetrics().addPhase('copy', time.perf_counter() - wall, 0.0)
+
+    def copyHeldBack(self):
+        '''
+        once the copy stage is done: files held back as the same as one earlier in the import are
+        duplicates of it if its copy worked. If it failed, one of them is copied in its place (the
+        rest wait on that copy in turn), so the content still gets into the library
+        '''
+        metrics = runMetrics.getMetrics()
+        heldBack = self.heldBack
+        while heldBack:
+            copied = {item.origPath + item.origName for item in self.stillsList + self.videoList
+                      if item.scanIdx not in self.linkTo}
+            copied.update(self.finalPaths)
+            retry = []
+            # source path of a failed copy: the file copied in its place
+            standIn = {}
+            waiting = []
+            for item, match in heldBack:
+                if match in copied:
+                    self.duplicates.append((item, match, False))
+                    metrics.count('duplicates')
+                    self.progress.skip(item.size)
+                elif match in standIn:
+                    waiting.append((item, standIn[match]))
+                else:
+                    standIn[match] = item.origPath + item.origName
+                    retry.append(item)
+            if retry:
+                # a copy stage of their own, keeping the main one's scheduler for its stats
+                copier = self.copier
+                copyQ = self.copyQ
+                self.copyQ = queue.Queue()
+                for item in retry:
+                    self.copyQ.put(item)
+                    if self.previewPool is not None and exifFast.hasPreview(item.origName):
+                        self.previewPool.submit(self.extractPreview, item, False)
+                self.copyQ.put(None)
+                self.copyStage()
+                self.copier = copier
+                self.copyQ = copyQ
+            heldBack = waiting
+        self.heldBack = []
+
+    def resumePoint(self, entry, src, dst):
+        '''
+        check what an earlier run left of a copy, from its transfer journal entry
+        :return: how much of dst can be kept - the whole file, up to a checkpoint, or 0 to copy it afresh
+        '''
+        try:
+            if entry.dest != dst and os.path.isfile(entry.dest):
+                # temporary names go by scan order, which moves if files were added to the card
+                os.replace(entry.dest, dst)
+            with open(dst, 'rb') as fDst, open(src, 'rb') as fSrc:
+                size = os.fstat(fDst.fileno()).st_size
+                if size < entry.offset or (entry.state == transferJournal.COPIED and size != entry.offset):
+                    return 0
+                # the copy must still be what was written, and the card what was read
+                if copyEngine.tailDigest(fDst.fileno(), entry.offset) == entry.tail == \
+                        copyEngine.tailDigest(fSrc.fileno(), entry.offset):
+                    return entry.offset
+        except OSError:
+            pass
+        return 0
+
+    def copyOne(self, item, src, dst):
+        '''
+        copy one file, hashing it on the way if asked to, and reporting each chunk to the progress
+        With a transfer journal, a copy finished by an earlier run is kept, and one it checkpointed
+        is carried on from the checkpoint
+        :return: the hex digest, or "" without hashing
+        '''
+        if self.transferMode != 'copy' and \
+                self.copier.dirDevice(os.path.dirname(src)) == self.copier.dirDevice(os.path.dirname(dst)):
+            used = self.shareOne(item, src, dst)
+            if used is not None:
+                return ""
+
+        copied = []
+        def chunk(n):
+            copied.append(n)
+            self.progress.advance(n)
+
+        hasher = None
+        if self.hashAlgo is not None:
+            hasher = importManifest.newHasher(self.hashAlgo)
+
+        resumeFrom = 0
+        checkpoint = None
+        if self.journal is not None:
+            key = self.journalKey(item)
+            entry = self.journal.lookup(*key)
+            if entry is not None:
+                resumeFrom = self.resumePoint(entry, src, dst)
+            if resumeFrom:
+                metrics = runMetrics.getMetrics()
+                metrics.count('resumedFiles')
+                metrics.count('resumedBytes', resumeFrom)
+                self.resumed.append(src)
+                self.progress.skip(resumeFrom, files = 0)
+                if entry.state == transferJournal.COPIED:
+                    if hasher is None:
+                        return ""
+                    return entry.digest or importManifest.hashFile(dst, self.hashAlgo)
+                if hasher is not None:
+                    # the checksum covers the part already copied too - read back from the copy
+                    importManifest.updateFromFile(hasher, dst, resumeFrom)
+            checkpoint = lambda offset, tail: self.journal.checkpoint(key, dst, offset, tail)
 
-    # now copy videos
-    vidFileErr = []
-    for vd in videoList:
         try:
-            # note shutil.copy2 preserves more OS level metadata
-            #currently will overwrite if already exists
-            # TODO: add a 'overwrite' all check
-            shutil.copy2(vd.origPath + vd.origName , vd.newPath + vd.newName)
-            copyCount += 1
-            print('.',end='')
+            copyEngine.copyFile(src, dst, progress = chunk, hasher = hasher,
+                                resumeFrom = resumeFrom, checkpoint = checkpoint)
         except:
-            print(traceback.format_exc())
-            vidFileErr.append(vd.origPath + vd.origName)
+            # copyDone skips the whole file
+            self.progress.retract(sum(copied))
+            self.progress.skip(-resumeFrom, files = 0)
+            raise
+        digest = ""
+        if hasher is not None:
+            digest = hasher.hexdigest()
+        if self.journal is not None:
+            with open(dst, 'rb') as f:
+                tail = copyEngine.tailDigest(f.fileno(), item.size)
+            self.journal.copied(key, dst, tail, digest)
+        return digest
+
+    def shareOne(self, item, src, dst):
+        '''
+        give a file on the same file system as its day folder its temporary name there without
+        copying the data. A file being moved keeps its card name too (a hardlink), until it has its final name
+        :return: the mode used, or None if it has to be copied after all
+        '''
+        if os.path.lexists(dst):
+            # left by an interrupted run
+            os.remove(dst)
+        with runMetrics.getMetrics().phase('share'):
+            used = copyEngine.shareFile(src, dst, self.transferMode)
+        if used is not None:
+            self.shared.append((item, used))
+            self.progress.advance(item.size)
+        return used
+
+    def copyDone(self, item, job, error):
+        '''
+        called from a copy thread when an item's copy has finished (error is None) or failed
+        '''
+        item.hash = job.result or ""
+        if error is not None:
+            self.fileErrors(item).append(item.origPath + item.origName)
+            self.progress.skip(item.size)
+            return
+        self.progress.fileDone()
+        if item.StillVideo == 'S':
+            self.stillsList.append(item)
+        else:
+            self.videoList.append(item)
 
+    def sameFile(self, item, existing):
+        '''
+        :param existing: (size, mtimeNs) of the file already on the item's final name
+        :return: True if that file is this one, imported before: the same size and hash - or with no
+                 hash, the same size & mod time (copies keep the mod time)
+        '''
+        size, mtimeNs = existing
+        if size != item.size:
+            return False
+        if item.hash:
+            return importManifest.hashFile(item.newPath + item.newName, self.hashAlgo) == item.hash
+        return item.mtimeNs != 0 and mtimeNs == item.mtimeNs
+
+    def placeName(self, item):
+        '''
+        check the item's final name against its day folder's listing. If another file has it, the
+        item moves on to the next free -NN name - a still in a burst carries on the burst's numbers,
+        anything else gets -01 on
+        :return: True if this same file is already there, under item.newName
+        '''
+        existing = self.destIdx.stat(item.newPath, item.newName)
+        if existing is None:
+            return False
+        stem, ext = os.path.splitext(item.newName)
+        n = 1
+        if item.StillVideo == 'S' and item.seq != -1:
+            stem = stem[:-len(item.nameSuffix)]
+            n = item.seq + 1
+        while not self.sameFile(item, existing):
+            item.newName = stem + "-%02d" % n + ext
+            existing = self.destIdx.stat(item.newPath, item.newName)
+            if existing is None:
+                self.renumbered += 1
+                return False
+            n += 1
+        return True
+
+    def finalNames(self):
+        '''
+        once everything is copied, work out the final names and rename the temporary copies
+        Done for each lot of files imported, so the lists are emptied for the next one
+        '''
+        # copies finish in any order - put the lists back in card order, so names don't depend on timing
+        self.stillsList.sort(key = attrgetter('scanIdx'))
+        self.videoList.sort(key = attrgetter('scanIdx'))
+        imported = []
+        importedItems = []
+        identicalBefore = len(self.identical)
+        metrics = runMetrics.getMetrics()
+        # moves done as a hardlink: the card's name goes once the file has its final one
+        moving = set()
+        if self.transferMode == 'move':
+            moving = {item.scanIdx for item, used in self.shared if used == 'link'}
+        with metrics.phase('sequence'):
+            nameStills(self.stillsList, self.destRoot['S'])
+            self.videoSeq = nameVideos(self.videoList, self.destRoot['V'], self.videoSeq)
+
+        identical = []
+        for item in self.stillsList + self.videoList:
+            try:
+                link = self.linkTo.get(item.scanIdx)
+                # is the name taken already? Checked against the day folder's listing, not the disk
+                if (link is None or os.path.abspath(link) != os.path.abspath(item.newPath + item.newName)) \
+                        and self.placeName(item):
+                    # imported before - keep that one
+                    if link is None:
+                        with metrics.phase('rename'):
+                            os.remove(item.newPath + self.tempName(item))
+                    self.finalPreview(item, False)
+                    self.identical.append((item, item.newPath + item.newName))
+                    identical.append((self.sources[item.source].card, self.relPath(item), item.size,
+                                      item.mtimeNs, os.path.abspath(item.newPath + item.newName)))
+                    continue
+                with metrics.phase('rename'):
+                    if link is None:
+                        os.replace(item.newPath + self.tempName(item), item.newPath + item.newName)
+                    elif os.path.abspath(link) != os.path.abspath(item.newPath + item.newName):
+                        os.link(link, item.newPath + item.newName)
+                    if item.scanIdx in moving:
+                        os.remove(item.origPath + item.origName)
+                self.destIdx.add(item.newPath, item.newName, item.size, item.mtimeNs)
+                self.finalPreview(item, True)
+                self.copyCount += 1
+                if not self.progress.observers:
+                    # a dot per file, unless a progress bar (or GUI) is showing the run
+                    print('.',end='')
+            except:
+                print(traceback.format_exc())
+                self.fileErrors(item).append(item.origPath + item.origName)
+                # Todo: Exit(104) with message
+                continue
+            imported.append((self.sources[item.source].card, self.relPath(item), item.size, item.mtimeNs,
+                             os.path.abspath(item.newPath + item.newName)))
+            importedItems.append(item)
+
+        # previews of files that weren't copied in the end
+        for temp in self.previews.values():
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+        self.previews = {}
+
+        # skipped duplicates go in the ledger too, against the copy already in the library - or the one
+        # made of the file they're the same as, in this lot or an earlier one
+        for item, (card, rel, size, mtimeNs, dest) in zip(importedItems, imported):
+            self.finalPaths[item.origPath + item.origName] = dest
+        for item, path in self.identical[identicalBefore:]:
+            self.finalPaths[item.origPath + item.origName] = os.path.abspath(path)
+        for item, match, inLibrary in self.duplicates[self.duplicatesRecorded:]:
+            if self.dedup == 'skip' or (self.dedup == 'link' and not inLibrary):
+                dest = os.path.abspath(match) if inLibrary else self.finalPaths.get(match)
+                if dest is not None:
+                    imported.append((self.sources[item.source].card, self.relPath(item), item.size,
+                                     item.mtimeNs, dest))
+        self.duplicatesRecorded = len(self.duplicates)
+        imported += identical
+
+        if self.ledger is not None:
+            self.ledger.recordMany(imported)
+        if self.journal is not None:
+            # in their final place now - nothing left to resume
+            self.journal.finished([self.journalKey(item) for item in importedItems] +
+                                  [self.journalKey(item) for item, path in self.identical[identicalBefore:]])
+
+        # for the manifests, written once the import is done (see writeManifests). Files linked/ moved
+        # rather than copied have no hash - their data wasn't copied
+        for item, (card, rel, size, mtimeNs, dest) in zip(importedItems, imported):
+            if item.hash:
+                self.manifestEntries[item.StillVideo].append((dest, size, item.hash, item.origPath + item.origName))
+        self.stillsList = []
+        self.videoList = []
+
+    def writeManifests(self):
+        '''
+        write the checksums of everything the import copied into a manifest per destination root,
+        next to its day folders
+        '''
+        if self.hashAlgo is None:
+            return
+        for SV, root in self.destRoot.items():
+            manifestName = importManifest.writeManifest(root, self.manifestEntries[SV], self.hashAlgo,
+                                                        ', '.join(source.root for source in self.sources))
+            if manifestName is not None:
+                self.manifests.append(manifestName)
+
+    def run(self, mediaSources, cameraIds = None):
+        '''
+        run all the stages over the sources, and wait for them to finish
+        :param mediaSources: a card/ folder, or a list of them (eg several card readers) - copied
+                as one import, with one naming pass over them all
+        :param cameraIds: optional {source: camera ID}, put in front of the names of that source's files
+        :return: number of files copied. 0 without copying anything if a destination is too full (see spaceErr)
+        '''
+        self.open(mediaSources, cameraIds)
+        copied = self.importItems(self.scanSources())
+        self.writeManifests()
+        return copied
 
-    print ('There were '+ str(len(vidFileErr)) + ' file and ' + str(len(vidFolderErr)) + ' folder errors' )
-    print ('Done. copied ' + str(copyCount) + ' files in ' + str((time.time() - start_time)) + 'seconds' )
-    return
+    def open(self, mediaSources, cameraIds = None):
+        '''
+        set up the sources of an import (see run)
+        '''
+        if isinstance(mediaSources, str):
+            mediaSources = [mediaSources]
+        cameraIds = cameraIds or {}
+        self.sources = [cardSource(i, path, cameraIds.get(path, "")) for i, path in enumerate(mediaSources)]
+        if self.ledger is not None or self.journal is not None:
+            for source in self.sources:
+                source.card = importLedger.cardIdentity(source.path)
+
+    def scanSources(self):
+        '''
+        walk every source at once
+        :return: the items to import, taken from each source in turn
+        '''
+        self.nextLot()
+        metrics = runMetrics.getMetrics()
+        scans = [threading.Thread(target = metrics.profiled(self.scanAll), args = (source,),
+                                  name = 'scan%d' % source.index) for source in self.sources]
+        for t in scans:
+            t.start()
+        for t in scans:
+            t.join()
+        # scanIdx runs on from one card to the next, in the order given, so names don't depend on
+        # which card was walked first
+        offset = self.nextScanIdx
+        for source in self.sources:
+            for item in source.items:
+                item.scanIdx += offset
+            offset += source.scanned
+            self.skipCount += source.skipped
+        self.nextScanIdx = offset
+        items = self.interleave()
+        readers = set()
+        for source in self.sources:
+            source.items = []
+            try:
+                readers.add(os.stat(source.path).st_dev)
+            except OSError:
+                pass
+        self.readers = len(readers)
+        return items
 
-def main():
+    def nextLot(self):
+        '''
+        a progress of its own for each lot of files imported, once the last one's has finished
+        '''
+        if self.progress.finished:
+            observers = self.progress.observers
+            self.progress = transferProgress.transferProgress()
+            self.progress.observers = observers
+
+    def scanPaths(self, paths):
+        '''
+        the files to import from paths on the (first) source - files that have turned up on a card since
+        it was imported, and folders to walk for them. Those gone again, or already imported, are left out
+        :return: the items to import
+        '''
+        source = self.sources[0]
+        self.nextLot()
+        items = []
+        seen = set()
+        with runMetrics.getMetrics().phase('scan'):
+            for path in sorted(paths):
+                if os.path.isdir(path):
+                    found = scanMediaTree(path)
+                else:
+                    item = mediaItem(os.path.dirname(path) + '/', os.path.basename(path))
+                    if item.StillVideo not in ('S', 'V'):
+                        continue
+                    try:
+                        statbuf = os.stat(path)
+                    except OSError:
+                        # gone again
+                        continue
+                    item.size = statbuf.st_size
+                    item.mtimeNs = statbuf.st_mtime_ns
+                    found = [item]
+                for item in found:
+                    if item.origPath + item.origName in seen:
+                        continue
+                    seen.add(item.origPath + item.origName)
+                    item.scanIdx = self.nextScanIdx
+                    self.nextScanIdx += 1
+                    item.source = source.index
+                    item.namePrefix = source.prefix
+                    if self.ledger is not None and self.ledger.isImported(source.card, self.relPath(item),
+                                                                          item.size, item.mtimeNs):
+                        self.skipCount += 1
+                        continue
+                    items.append(item)
+                    self.progress.addTotal(item.size)
+        return items
+
+    def importItems(self, items):
+        '''
+        run the metadata, copy and naming stages over items, and wait for them to finish
+        :return: number of files copied. 0 without copying anything if a destination is too full (see spaceErr)
+        '''
+        metrics = runMetrics.getMetrics()
+        copied = self.copyCount
+        if self.checkSpace:
+            spaceErr = self.freeSpace(items)
+            if spaceErr:
+                self.spaceErr += spaceErr
+                return 0
+
+        if self.wantPreviews:
+            self.previewPool = ThreadPoolExecutor(max_workers = PREVIEW_WORKERS)
+        if self.dedupIdx is not None:
+            self.hashPool = ThreadPoolExecutor(max_workers = DEDUP_WORKERS)
+        stages = [threading.Thread(target = metrics.profiled(self.scanStage), args = (items,), name = 'scan'),
+                  threading.Thread(target = metrics.profiled(self.metadataStage), name = 'metadata'),
+                  threading.Thread(target = metrics.profiled(self.copyStage), name = 'copy')]
+        for t in stages:
+            t.start()
+        for t in stages:
+            t.join()
+        if self.hashPool is not None:
+            self.hashPool.shutdown()
+        self.copyHeldBack()
+        if self.previewPool is not None:
+            self.previewPool.shutdown()
+        self.progress.finish()
+
+        self.finalNames()
+        return self.copyCount - copied
+
+class copySession():
+    '''
+    one import by setupDirCopy: its ingestPipeline, ledger & journal, and the run's metrics. It can be
+    kept open after the sources are copied (see the main script's watch command), and the files that turn
+    up on them added to it - named on from the ones before, and in the same manifests & run report
+    '''
+    def __init__(self, ingest, ledger, journal, metrics, reportDir = None, console = None):
+        '''
+        :param console: the transferProgress.consoleProgress drawing the run's bar, if there is one -
+                anything printed while files are imported goes through its line, so it isn't tacked onto the bar
+        '''
+        self.ingest = ingest
+        self.ledger = ledger
+        self.journal = journal
+        self.metrics = metrics
+        self.reportDir = reportDir
+        self.console = console
+        self.copyCount = 0
+        self.startTime = time.time()
+
+    def start(self, mediaSources, cameraIds = None):
+        '''
+        copy everything on the sources (see ingestPipeline.run)
+        :return: number of files copied
+        '''
+        runMetrics.useRun(self.metrics)
+        self.ingest.open(mediaSources, cameraIds)
+        return self.importItems(self.ingest.scanSources())
 
+    def add(self, paths = None):
+        '''
+        copy files that have turned up on the (first) source since
+        :param paths: the new files, and folders to walk for them. None to walk the sources again
+        :return: number of files copied
+        '''
+        runMetrics.useRun(self.metrics)
+        if paths is None:
+            items = self.ingest.scanSources()
+        else:
+            items = self.ingest.scanPaths(paths)
+        return self.importItems(items)
+
+    def importItems(self, items):
+        '''
+        import items (see ingestPipeline.importItems), with sys.stdout through the console bar's line meanwhile
+        - and put back however the import ends
+        :return: number of files copied
+        '''
+        out = sys.stdout
+        if self.console is not None:
+            sys.stdout = self.console.line
+        try:
+            copied = self.ingest.importItems(items)
+        finally:
+            sys.stdout = out
+            if self.console is not None:
+                self.console.line.endBar()
+        self.copyCount += copied
+        return copied
+
+    def close(self):
+        '''
+        write the manifests, print the summary and the run report
+        :return: number of errors (files, folders, stages & destinations without room)
+        '''
+        ingest = self.ingest
+        runMetrics.useRun(self.metrics)
+        ingest.writeManifests()
+        if self.ledger is not None:
+            self.ledger.close()
+        if self.journal is not None:
+            self.journal.close()
+
+        for folder, needed, free in ingest.spaceErr:
+            print ('Not enough space on ' + folder + ': %0.1f MB needed, %0.1f MB free. Nothing was copied'
+                   % (needed / 1e6, free / 1e6))
+            #Todo: Exit(105) with message
+        print ()
+        print ('There were '+ str(len(ingest.stillsFileErr) + len(ingest.vidFileErr)) + ' file and ' +
+               str(len(ingest.stillFolderErr) + len(ingest.vidFolderErr)) + ' folder errors' )
+        if ingest.copier is not None:
+            print (str(ingest.copier))
+        for manifestName in ingest.manifests:
+            print ('Checksums written to ' + manifestName)
+        if ingest.skipCount:
+            print ('Skipped ' + str(ingest.skipCount) + ' files already imported from this card')
+        if ingest.resumed:
+            print ('Resumed ' + str(len(ingest.resumed)) + ' files from an interrupted run')
+        if ingest.previewCount:
+            print (str(ingest.previewCount) + ' RAW previews written')
+        if ingest.identical:
+            print (str(len(ingest.identical)) + ' files were already there under the same name - left as they were')
+        if ingest.renumbered:
+            print (str(ingest.renumbered) + ' files given the next free -NN name, as theirs was taken by another file')
+        if ingest.shared:
+            print (str(len(ingest.shared)) + ' files ' + {'reflink': 'reflinked', 'link': 'hardlinked',
+                                                            'move': 'moved'}[ingest.transferMode] + ' - no data copied')
+        for item, match, inLibrary in ingest.duplicates:
+            print (item.origPath + item.origName + ' is the same as ' + match)
+        if ingest.duplicates:
+            print (str(len(ingest.duplicates)) + ' duplicates ' +
+                   {'skip': 'skipped', 'link': 'linked or skipped', 'report': 'found (copied anyway)'}[ingest.dedup])
+        reportName = self.metrics.finish(self.reportDir, {'source': ', '.join(source.path for source in ingest.sources),
+                                                          'copied': self.copyCount,
+                                                          'skipped': ingest.skipCount,
+                                                          'resumed': len(ingest.resumed),
+                                                          'duplicates': [(item.origPath + item.origName, match)
+                                                                         for item, match, inLibrary in ingest.duplicates],
+                                                          'identical': [path for item, path in ingest.identical],
+                                                          'renumbered': ingest.renumbered,
+                                                          'transferMode': ingest.transferMode,
+                                                          'previews': ingest.previewCount,
+                                                          'shared': len(ingest.shared),
+                                                          'fileErrors': ingest.stillsFileErr + ingest.vidFileErr,
+                                                          'folderErrors': ingest.stillFolderErr + ingest.vidFolderErr,
+                                                          'stageErrors': ingest.stageErr,
+                                                          'spaceErrors': ingest.spaceErr,
+                                                          'manifests': ingest.manifests})
+        print ('Run report written to ' + reportName)
+        print ('Done. copied ' + str(self.copyCount) + ' files in ' + str((time.time() - self.startTime)) + 'seconds' )
+        return (len(ingest.stillsFileErr) + len(ingest.vidFileErr) + len(ingest.stillFolderErr) + len(ingest.vidFolderErr)
+                + len(ingest.stageErr) + len(ingest.spaceErr))
+
+def setupDirCopy(metaWorkers = metaExtract.META_WORKERS, metaSerial = False,
+                 copyWorkers = copyScheduler.COPY_WORKERS, deviceLimits = None, incremental = True,
+                 hashAlgo = importManifest.defaultAlgo(), profile = False, traceMemory = False, reportDir = None,
+                 progress = transferProgress.consoleProgress, checkSpace = True, resumable = True,
+                 mediaSources = None, cameraIds = None, stillRootDestination = None, videoRootDestination = None,
+                 dedup = 'skip', transferMode = 'copy', previews = False, previewDir = None, keepOpen = False):
+    '''
+    Setup the dirs - a shim to interface with the GUI when it comes
+    Copy and rename all the media from a user-selected dir to a stills and a video dir, each day getting it's own folder
+    Must traverse any sub-dirs found (ala Sony), or deal with mixed contents (ala Canon)
+
+    Some of this could be in objectified variously. NExt phase ...
+
+    :param metaWorkers: max number of parallel metadata readers
+    :param metaSerial: read metadata one file at a time (for debugging)
+    :param copyWorkers: max number of copies running at once
+    :param deviceLimits: optional {path: max copies} for particular source/ destination devices
+    :param incremental: skip files already copied from this card on an earlier run (see importLedger)
+    :param hashAlgo: checksum to take while copying, written to a manifest per destination root
+            (check later with: python importManifest.py verify <root>). None for no checksums
+    :param profile: profile the run with cProfile, saved next to the run report (see runMetrics)
+    :param traceMemory: trace memory use with tracemalloc, the peak & top lines go in the run report
+    :param reportDir: folder for the JSON run report, default runMetrics.defaultReportDir()
+    :param progress: observer for the byte-weighted progress & ETA, called with a transferProgress.progressState,
+            or a class to make one from for the run (default: a console bar). None for no progress output
+    :param checkSpace: check the destinations have room for everything before copying anything
+    :param resumable: keep a transfer journal, so a run that's cut short carries on where it stopped
+            next time, rather than copying everything again (see transferJournal)
+    :param mediaSources: list of cards/ folders to copy together (eg one per card reader). They are
+            scanned and copied at the same time, and named in one pass - so video V## numbers run on
+            across them. None asks for one
+    :param cameraIds: optional {source: camera ID} - the ID goes in front of that card's still names,
+            and after the V## of its videos
+    :param stillRootDestination, videoRootDestination: where the day folders go. None for the defaults
+    :param dedup: files already in their day folder, or twice in this import (same content, whatever
+            the name): 'skip', 'link' (hardlink the new name to the copy already there), 'report' (copy
+            them anyway) or None to not look (see dedupIndex)
+    :param transferMode: when a source is on the same file system as the destination (eg re-organising an
+            old dump on the archive disk into day folders): 'reflink', 'link' (hardlink) or 'move' its files
+            rather than copying the data - seconds, and no extra space. 'copy' always copies
+    :param previews: write the JPEG preview embedded in each RAW (ARW, CR2), named after it, for a quick
+            look through the shoot - into a _previews folder in each day folder, or previewDir (a folder
+            per day in it). Just the preview's bytes are copied, nothing is decoded
+    :param keepOpen: leave the import open once the sources are copied, so files that turn up on them
+            later can be added to it (eg a card being watched), and return its copySession. close() it
+            for the summary, manifests & run report
+    :return: number of errors (files, folders, stages & destinations without room)
+    '''
+
+    # Get the source
+    if mediaSources is None:
+        mediaSources = [askDirectory("SOURCE of media (eg SD Card root) ",
+                                     "C:/Users/grant/Documents/scratch/sonySDStructure/")]
+
+    # Root of the destinations. Currently hardcoded. Ultimately will be in the GUI option setter
+    # add in a subdir for each day in the dir-walk
+    # stillRootDestination = "C:/Users/grant/Pictures/2016/"
+    # videoRootDestination = "C:/Users/grant/Videos/2016/"
+    # test values:
+    if stillRootDestination is None:
+        stillRootDestination = "C:/Users/grant/Documents/scratch/P2016/"
+    if videoRootDestination is None:
+        videoRootDestination = "C:/Users/grant/Documents/scratch/V2016/"
+    # the day folders are added straight on the end
+    stillRootDestination = os.path.join(stillRootDestination, '')
+    videoRootDestination = os.path.join(videoRootDestination, '')
+
+    os.makedirs(stillRootDestination, exist_ok = True)
+    os.makedirs(videoRootDestination, exist_ok = True)
+
+    metrics = runMetrics.startRun('copy', profile, traceMemory)
+    # DONE: use an extension of processedName, Add attribs: still/video; abs src dir; abs dest dir; size; Date
+    # scan, read metadata and copy as one pipeline - see ingestPipeline
+    ledger = None
+    if incremental:
+        ledger = importLedger.importLedger()
+    journal = None
+    if resumable:
+        journal = transferJournal.transferJournal()
+    transfer = transferProgress.transferProgress()
+    if isinstance(progress, type):
+        progress = progress()
+    if progress is not None:
+        transfer.subscribe(progress)
+    ingest = ingestPipeline(stillRootDestination, videoRootDestination, metaWorkers, metaSerial,
+                            copyWorkers, deviceLimits, ledger, hashAlgo, transfer, checkSpace, journal, dedup,
+                            transferMode, previews, previewDir)
+    console = progress if isinstance(progress, transferProgress.consoleProgress) else None
+    session = copySession(ingest, ledger, journal, metrics, reportDir, console)
+    session.start(mediaSources, cameraIds)
+    if keepOpen:
+        return session
+    return session.close()
+
+def parseArgs(argv = None):
+    '''
+    the command line. No command runs the copy with dialogs, as before
+    '''
+    parser = argparse.ArgumentParser(description = "Copy media off cards into a folder per day, named by their "
+                                     "metadata dates - or rename a folder of stills or video in place. "
+                                     "With no command, dialogs ask for the card")
+    # options every command has
+    common = argparse.ArgumentParser(add_help = False)
+    common.add_argument('--profile', action = 'store_true', help = "profile the run (cProfile), saved next to the run report")
+    common.add_argument('--trace-memory', action = 'store_true', help = "trace memory (tracemalloc), into the run report")
+    common.add_argument('--report-dir', help = "folder for the run report (default: %s)" % runMetrics.defaultReportDir())
+    # options for copying, by hand or in watch mode
+    cp = argparse.ArgumentParser(add_help = False)
+    cp.add_argument('--stills', required = True, help = "root folder for the stills (a folder per day is made in it)")
+    cp.add_argument('--video', required = True, help = "root folder for the video")
+    cp.add_argument('--camera', action = 'append', default = [], metavar = 'SOURCE=ID',
+                    help = "camera ID to put in the names of a source's files (repeat for each source)")
+    cp.add_argument('--copy-workers', type = int, default = copyScheduler.COPY_WORKERS,
+                    help = "max copies at once (default: %(default)s)")
+    cp.add_argument('--meta-workers', type = int, default = metaExtract.META_WORKERS,
+                    help = "max parallel metadata reads (default: %(default)s)")
+    cp.add_argument('--hash', choices = importManifest.HASH_ALGOS + ['none'], default = importManifest.defaultAlgo(),
+                    help = "checksum taken while copying, for the manifests (default: %(default)s)")
+    cp.add_argument('--all', action = 'store_true', help = "copy files already imported from these cards too")
+    cp.add_argument('--no-resume', action = 'store_true', help = "don't carry on from an interrupted copy")
+    cp.add_argument('--dedup', choices = ['skip', 'link', 'report', 'off'], default = 'skip',
+                    help = "files already in the library or twice on the cards: skip them, hardlink the new "
+                    "name to the copy there, or just report them (default: %(default)s)")
+    cp.add_argument('--transfer', choices = copyEngine.TRANSFER_MODES, default = 'copy',
+                    help = "for sources on the same file system as the destination: reflink, hardlink or move "
+                    "the files instead of copying their data (default: %(default)s)")
+    cp.add_argument('--previews', action = 'store_true',
+                    help = "write the JPEG preview out of each RAW (ARW, CR2), to a _previews folder per day")
+    cp.add_argument('--preview-dir', help = "put the previews here instead (a folder per day in it)")
+    cp.add_argument('--no-space-check', action = 'store_true', help = "don't check the destinations have room first")
+    cp.add_argument('--quiet', action = 'store_true', help = "no progress bar")
+    sub = parser.add_subparsers(dest = 'command')
+
+    copy = sub.add_parser('copy', parents = [common, cp], help = "copy & name everything on one or more cards")
+    copy.add_argument('sources', nargs = '+', help = "card roots/ folders to copy from - several are copied at once")
+
+    watch = sub.add_parser('watch', parents = [common, cp],
+                           help = "copy each card as it's mounted, and new files on it as they're added")
+    watch.add_argument('root', nargs = '?', default = os.path.join('/media', os.environ.get('USER', '')),
+                       help = "folder the cards are mounted in (default: %(default)s) - any folder of folders will do")
+    watch.add_argument('--settle', type = float, default = cardWatcher.WATCH_SETTLE,
+                       help = "seconds without a change on a card before copying it (default: %(default)s)")
+    watch.add_argument('--poll', action = 'store_true', help = "poll the folders, rather than use inotify")
+
+    rs = sub.add_parser('rename-stills', parents = [common], help = "rename the stills in a folder to their EXIF date")
+    rs.add_argument('folder')
+    rv = sub.add_parser('rename-video', parents = [common], help = "rename the video in a folder to V##_ + start time")
+    rv.add_argument('folder')
+    return parser.parse_args(argv)
+
+def main(argv = None):
+    '''
+    :return: exit status - 0 if there were no errors
+    '''
+    args = parseArgs(argv)
+
+    if args.command in ('copy', 'watch'):
+        cameraIds = {}
+        for camera in args.camera:
+            source, sep, cameraId = camera.rpartition('=')
+            if not sep:
+                print ("--camera needs SOURCE=ID, not " + camera)
+                return 2
+            cameraIds[source] = cameraId
+
+        def copy(sources, keepOpen = False):
+            return setupDirCopy(args.meta_workers, copyWorkers = args.copy_workers, incremental = not args.all,
+                                hashAlgo = None if args.hash == 'none' else args.hash, profile = args.profile,
+                                traceMemory = args.trace_memory, reportDir = args.report_dir,
+                                progress = None if args.quiet else transferProgress.consoleProgress,
+                                checkSpace = not args.no_space_check, resumable = not args.no_resume,
+                                mediaSources = sources, cameraIds = cameraIds,
+                                stillRootDestination = args.stills, videoRootDestination = args.video,
+                                dedup = None if args.dedup == 'off' else args.dedup, transferMode = args.transfer,
+                                previews = args.previews or args.preview_dir is not None,
+                                previewDir = args.preview_dir, keepOpen = keepOpen)
+
+        if args.command == 'watch':
+            # one import per card while it's in: files that turn up on it later are added to it, and its
+            # summary, manifests & run report are written once it's gone
+            sessions = {}
+
+            def ingest(volume, paths):
+                if volume not in sessions:
+                    sessions[volume] = copy([volume], keepOpen = True)
+                else:
+                    sessions[volume].add(paths)
+
+            def done(volume):
+                session = sessions.pop(volume, None)
+                if session is not None:
+                    session.close()
+
+            cardWatcher.cardWatcher(args.root, ingest, args.settle, args.poll, done).run()
+            return 0
+        return 1 if copy(args.sources) else 0
+    elif args.command == 'rename-stills':
+        return 1 if setupStillsRename(args.profile, args.trace_memory, args.report_dir, args.folder) else 0
+    elif args.command == 'rename-video':
+        return 1 if setupVideoRename(args.profile, args.trace_memory, args.report_dir, args.folder) else 0
+
+    # no command: the interactive version
     #launch and close the root window
+    import tkinter as tk
     root = tk.Tk()
     root.withdraw()
 
@@ -711,11 +1858,11 @@ def main():
 
 
     #
-    setupDirCopy()
+    return 1 if setupDirCopy() else 0
 
     # if srcname != "" :
     #     print('\n'+srcname + ' becomes ' + getEXIFTime(srcname))
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    sys.exit(main())
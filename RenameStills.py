@@ -8,28 +8,33 @@
 #Rename jpg & ARW's as yyyy-mm-dd-hh-mm-ss-#### where #### is the existing sequence no
 # using EXIF data
 
-# library for the EXIF data
-try:
-    import exifread
-except:
-    print ("exifread was not found in the same directory as exifmover.py")
-
+# library for the EXIF data: exifread, loaded by exifFast only for files its own reader can't do
+# (the reading is shared with Rename&TransferMedia.py, in metaExtract)
 
 import traceback
 import os
+import sys
 import time
-import tkinter as tk
-from tkinter import filedialog
+import argparse
 
 import re
 from operator import attrgetter
 
+# local modules, in the same dir as this program
+import metaCache
+import metaExtract
+import burstIndex
+import renameEngine
+
 # only handle known types
 includedTypes = [ "JPG" , "jpg" , "ARW" , "arw" , "CR2" , "cr2" , "TIF" , "tif" ]
 
 
 #class for managing sequences of images in the same second
 class processedName():
+    # no per instance __dict__ - a big folder has a lot of these
+    __slots__ = ('origName', 'dateTime', 'origSeq', 'type', 'seq', 'newName')
+
     def __init__(self,origName= "",dateTime= "",seq= -1,type= ""):
         self.origName = origName
         self.dateTime = dateTime    #exif date-time
@@ -49,7 +54,8 @@ def createSequencedNames(dirName):
         :return: a list of processedName objects with correctly sequenced names
     '''
 
-    dirList=os.listdir(dirName)
+    with os.scandir(dirName) as entries:
+        dirList = [e.name for e in entries if e.is_file()]
     print('%3d files found to process' % len(dirList))
 
     # a list of processedNames
@@ -67,27 +73,10 @@ def createSequencedNames(dirName):
                 p.origSeq = 0
         newNames.append(p)
 
-    #find sequences in same file types
-    prevDateTime = ""  # dateTime is always set, thus this will work for 1st iteration.
-    prevType = ""
-    seqTrack = 0
-
-    #sort by type to find same-second sequences
-    newNames.sort(key = attrgetter('type', 'origSeq'))
-
-    # uses indexing to deal with the 'previous' element in a sequence
-    for i in range(len(newNames)):
-        if newNames[i].dateTime == prevDateTime and newNames[i].type == prevType:
-            if seqTrack == 0: # on the first one of a seq, go back and fix the previous
-                newNames[i-1].seq = seqTrack
-                seqTrack += 1
-            newNames[i].seq = seqTrack
-            seqTrack += 1
-        else:
-            seqTrack = 0
-
-        prevDateTime = newNames[i].dateTime
-        prevType = newNames[i].type
+    #find sequences in same file types - only the stills have a dateTime
+    stills = [n for n in newNames if n.type in includedTypes]
+    burstIndex.sequenceBursts(stills, attrgetter('dateTime'), attrgetter('type'), attrgetter('origSeq'),
+                              nameOf = attrgetter('origName'))
 
     #sequencing sorted, now build the file names
     for n in newNames:
@@ -112,31 +101,21 @@ def getModTime(fileName):
 
 def getEXIFTime(fileName):
     # get the image time based on EXIF metadata, esle use mod time
+    # files seen on a previous run (same size & mod time) come from the cache, without parsing
     newName = ""
-    f = open(fileName,'rb')
-    try:
-        # tags = exifread.process_file(f)
-        tags = exifread.process_file(f, stop_tag='EXIF DateTimeOriginal', details=False)
-        # tags = exifread.process_file(f,stop_tag='EXIF DateTime')
-        # print(tags['EXIF DateTimeOriginal'])
-    except:
-        # the error will be caught in the tag processing
-        pass
-
-    try:
+    tags = metaCache.cachedRead(fileName, metaExtract.readStillTags)
+
+    if tags['DateTimeOriginal'] != "":
         # get the exif version date time
-        EXIFDateTime = str(tags['EXIF DateTimeOriginal'])
         # print("EXIFDateTime ="+EXIFDateTime)
         #exclude filetype
-        newName = EXIFDateTime.replace(':','-') #+"."+fileName[-3:]
-    except:
+        newName = tags['DateTimeOriginal'].replace(':','-') #+"."+fileName[-3:]
+    else:
         # else use the file modified date (Creation gets changed on copy)
         print ("Couldn't read EXIF date on " + fileName + "\nUsing mod time")
         # exclude filetype
         newName = getModTime(fileName) # + "."+fileName[-3:]
 
-    f.close()
-
     return newName
 
 def renameStillsFolderOLD(dirName):
@@ -187,7 +166,7 @@ def renameStillsFolderOLD(dirName):
                     #print("Rename " + fname[-25:] + " to "+ newName[-25:])
                     os.rename(fname,newName)
 
-                except Exception as e:
+                except Exception:
                     errorCount += 1
                     print ("Oh no. Rename " + fname + " failed")
                     print(traceback.format_exc())
@@ -203,28 +182,10 @@ def renameStillsFolder(dirName,newNameList):
     :param newNameList - list of processedName objects, ready to be applied to HDD
     """
 
-    errorCount = 0
-
-    #for shortName in dirList:
-    for n in newNameList:
-        fname = dirName + '/' + n.origName
-
-        if os.path.isfile(fname):
-            if n.type in includedTypes:
-                #print ("File name is " + fname)
-                try:
-                    newName = dirName + '/' + n.newName
-                    #
-                    # print("Rename " + fname[-30:] + " to "+ newName[-30:])
-                    print('.',end='')
-                    os.rename(fname,newName)
-
-                except Exception as e:
-                    errorCount += 1
-                    print ("Oh no. Rename " + fname + " failed")
-                    print(traceback.format_exc())
+    # renamed in one go, so a new name still held by another file in the list is moved out of the way first
+    pairs = [(n.origName, n.newName) for n in newNameList if n.type in includedTypes]
+    _, errorCount = renameEngine.renameFolder(dirName, pairs, [n.origName for n in newNameList])
 
-    print()
     if errorCount : print("There were %2d errors" % errorCount)
     return errorCount
 
@@ -240,32 +201,42 @@ def main():
     # if fileName != "" :
     #     print('\n'+fileName + ' becomes ' + getEXIFTime(fileName))
 
-    #close the root window
-    root = tk.Tk()
-    root.withdraw()
+    parser = argparse.ArgumentParser(description = "Rename the stills in a folder to their EXIF date & time")
+    parser.add_argument('folder', nargs = '?', help = "folder to rename. Without it, a dialog asks for one")
+    args = parser.parse_args()
+
+    stillsPath = args.folder
+    if stillsPath is None:
+        # tkinter is only loaded for the dialog, so scripted runs don't need it
+        import tkinter as tk
+        from tkinter import filedialog
+
+        #close the root window
+        root = tk.Tk()
+        root.withdraw()
 
-    stillsPath = filedialog.askdirectory(
-                title = "Directory in which to rename jpg & ARW & CR2 & Tif files ",
-                initialdir = "C:/Users/grant/Documents/scratch/sonySDStructure/DCIM/10060708"
-                )
+        stillsPath = filedialog.askdirectory(
+                    title = "Directory in which to rename jpg & ARW & CR2 & Tif files ",
+                    initialdir = "C:/Users/grant/Documents/scratch/sonySDStructure/DCIM/10060708"
+                    )
 
     print(stillsPath)
     # Exit on cancel!
-    if stillsPath == "" : return
+    if stillsPath == "" : return 0
+
+    # an interrupted rename is finished from its journal first
+    if not renameEngine.recoverBeforeRename(stillsPath): return 1
 
     start_time=time.time()
 
-    #renameStillsFolder(stillsPath)
     newNames = createSequencedNames(stillsPath)
-    renameStillsFolder(stillsPath,newNames)
+    errorCount = renameStillsFolder(stillsPath,newNames)
 
     # Double check what happens to sequence numbers on renaming renamed files. Seems to be dependent on natural order?
     # maybe sort by EXIF date if seq is the same for the whole folder (since it defaults to year in this case)
 
     print ('Done. Execution took {:0.3f} seconds'.format((time.time() - start_time)))
-
-    # for n in newNames:
-    #     print(n)
+    return errorCount
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    sys.exit(1 if main() else 0)
\ No newline at end of file
@@ -0,0 +1,32 @@
+# Name: benchmarks/__init__.py
+#
+# Purpose:
+# Shared bits for the benchmark scripts: the path to the program's modules, and a way to
+# load Rename&TransferMedia.py (its name can't be imported the normal way).
+#
+
+# standard Python imports
+import os
+import sys
+import importlib.util
+
+# the folder holding the program and its helper modules
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MAIN_SCRIPT = "Rename&TransferMedia.py"
+
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+_mainModule = None
+
+def loadMain():
+    '''
+    :return: Rename&TransferMedia.py loaded as a module (once per run)
+    '''
+    global _mainModule
+    if _mainModule is None:
+        spec = importlib.util.spec_from_file_location("renameTransferMedia", os.path.join(REPO_DIR, MAIN_SCRIPT))
+        _mainModule = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(_mainModule)
+    return _mainModule
@@ -0,0 +1,85 @@
+# Name: benchExifFast.py
+#
+# Purpose:
+# Time exifFast.readDateTimeOriginal() against exifread on a folder of real camera files,
+# and check they agree on every file.
+#
+# Usage:
+#   python -m benchmarks.benchExifFast <dir with JPG/ARW/CR2/TIF files> [--repeat N] [--json out.json]
+#
+
+# standard Python imports
+import os
+import json
+import time
+import argparse
+
+from benchmarks import loadMain
+
+import exifFast
+
+try:
+    import exifread
+except ImportError:
+    exifread = None
+
+
+def exifreadDateTime(fileName):
+    # what metaExtract did before the fast path
+    with open(fileName, 'rb') as f:
+        tags = exifread.process_file(f, stop_tag='EXIF SubSecTimeOriginal', details=False)
+    return str(tags.get('EXIF DateTimeOriginal', "")), str(tags.get('EXIF SubSecTimeOriginal', ""))
+
+def timeReader(reader, files, repeat):
+    '''
+    :return: (best time over repeat runs in seconds, results of the last run)
+    '''
+    best = None
+    for r in range(repeat):
+        start = time.perf_counter()
+        results = [reader(f) for f in files]
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, results
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark exifFast against exifread")
+    parser.add_argument('folder', help = "dir of still images (searched recursively)")
+    parser.add_argument('--repeat', type = int, default = 3, help = "runs per reader, the best is kept")
+    parser.add_argument('--json', help = "also write the results to this file")
+    args = parser.parse_args()
+
+    stillTypes = loadMain().INCLUDED_STILL_TYPES
+    files = sorted(os.path.join(d, n) for d, dirs, names in os.walk(args.folder) for n in names
+                   if n[n.rfind('.')+1:] in stillTypes)
+    if not files:
+        print("No still images found in " + args.folder)
+        return
+
+    report = {'files': len(files)}
+    fastTime, fastResults = timeReader(exifFast.readDateTimeOriginal, files, args.repeat)
+    report['exifFast_s'] = fastTime
+    report['exifFast_misses'] = sum(1 for r in fastResults if r is None)
+    print('exifFast: %d files in %0.3f s (%0.1f us/file), %d fell back' %
+          (len(files), fastTime, fastTime / len(files) * 1e6, report['exifFast_misses']))
+
+    if exifread is None:
+        print("exifread not found - only timed the fast path")
+    else:
+        slowTime, slowResults = timeReader(exifreadDateTime, files, args.repeat)
+        report['exifread_s'] = slowTime
+        report['speedup'] = slowTime / fastTime if fastTime else None
+        mismatches = [f for f, a, b in zip(files, fastResults, slowResults) if a is not None and a != b]
+        report['mismatches'] = mismatches
+        print('exifread: %d files in %0.3f s (%0.1f us/file)' % (len(files), slowTime, slowTime / len(files) * 1e6))
+        print('speedup x%0.1f, %d files disagree' % (report['speedup'] or 0, len(mismatches)))
+        for f in mismatches:
+            print('  ' + f)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent = 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+# Name: benchMemory.py
+#
+# Purpose:
+# Bytes per item for the mediaItem/ processedName lists, at archive scale.
+# Builds N items the way an ingest does (card style folders & names, tags applied, final names built)
+# and measures them with tracemalloc. The same is done with a plain (__dict__ backed) copy of each
+# class, for comparison with how they used to be stored, and with sys.intern turned off, to show
+# what interning the shared strings saves.
+#
+# Usage:
+#   python -m benchmarks.benchMemory [--items 100000] [--json out.json]
+#
+
+# standard Python imports
+import gc
+import sys
+import json
+import argparse
+import tracemalloc
+from datetime import datetime, timedelta
+
+from benchmarks import loadMain
+
+# files per card style folder (DCIM/100MSDCF ...)
+FILES_PER_FOLDER = 1000
+
+
+def dictBacked(cls):
+    '''
+    :return: a copy of a __slots__ class, with a __dict__ per instance instead
+    '''
+    members = {k: v for k, v in cls.__dict__.items() if k not in cls.__slots__ and k not in ('__slots__',)}
+    return type(cls.__name__ + 'Dict', (), members)
+
+class noIntern():
+    '''
+    stands in for the sys module in Rename&TransferMedia.py, with intern() giving back its string as it is
+    '''
+    def __init__(self, sysModule):
+        self.sysModule = sysModule
+
+    def __getattr__(self, name):
+        return getattr(self.sysModule, name)
+
+    @staticmethod
+    def intern(s):
+        return s
+
+def buildMediaItems(main, itemClass, n):
+    '''
+    make n stills in itemClass, with tags & final names, as an ingest would
+    '''
+    start = datetime(2016, 5, 4, 9, 0, 0)
+    items = []
+    for i in range(n):
+        # one folder string per folder, as the dir scan gives them
+        if i % FILES_PER_FOLDER == 0:
+            folder = '/media/card/DCIM/%dMSDCF/' % (100 + i // FILES_PER_FOLDER)
+        item = itemClass(folder, 'DSC%05d.%s' % (i % 10000, 'JPG' if i % 2 else 'ARW'))
+        item.size = 20000000 + i
+        item.mtimeNs = 1462352400000000000 + i * 1000000000
+        item.scanIdx = i
+        shot = start + timedelta(seconds = i // 4)
+        item.updateMediaTags({'DateTimeOriginal': shot.strftime("%Y:%m:%d %H:%M:%S"),
+                              'SubSecTimeOriginal': '%02d' % (i % 4 * 25)})
+        item.hash = '%016x' % (i * 2654435761)
+        items.append(item)
+    main.nameStills(items, '/archive/photos/')
+    return items
+
+def buildProcessedNames(main, itemClass, n):
+    start = datetime(2016, 5, 4, 9, 0, 0)
+    names = []
+    for i in range(n):
+        p = itemClass('DSC%05d.JPG' % (i % 10000), "", i % 10000, 'JPG')
+        p.dateTime = (start + timedelta(seconds = i // 4)).strftime("%Y-%m-%d %H-%M-%S")
+        names.append(p)
+    main.sequenceNames(names)
+    return names
+
+def measure(build, main, *args, intern = True):
+    '''
+    :param intern: False to build with sys.intern turned off in main
+    :return: bytes allocated (and still held) by build(main, *args)
+    '''
+    mainSys = main.sys
+    if not intern:
+        main.sys = noIntern(mainSys)
+    try:
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        result = build(main, *args)
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    finally:
+        main.sys = mainSys
+    del result
+    return after - before
+
+def main():
+    parser = argparse.ArgumentParser(description = "Measure bytes per mediaItem/ processedName")
+    parser.add_argument('--items', type = int, default = 100000)
+    parser.add_argument('--json', help = "write the results here")
+    args = parser.parse_args()
+
+    main = loadMain()
+    # (name, build, class, interned)
+    runs = [('mediaItem', buildMediaItems, main.mediaItem, True),
+            ('mediaItem (dict)', buildMediaItems, dictBacked(main.mediaItem), True),
+            ('mediaItem (not interned)', buildMediaItems, main.mediaItem, False),
+            ('processedName', buildProcessedNames, main.processedName, True),
+            ('processedName (dict)', buildProcessedNames, dictBacked(main.processedName), True)]
+
+    results = {'python': sys.version.split()[0], 'items': args.items, 'bytesPerItem': {}}
+    for name, build, itemClass, interned in runs:
+        perItem = measure(build, main, itemClass, args.items, intern = interned) / args.items
+        results['bytesPerItem'][name] = perItem
+        print('%-28s %8.1f bytes/item  %8.1f MB per %d' % (name, perItem, perItem * args.items / 1e6, args.items))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent = 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# Name: benchStartup.py
+#
+# Purpose:
+# How long the scripts take to start, for scripted/ scheduled runs where that's paid every time.
+#   - wall time of `<script> --help` in a fresh interpreter (best & median of N), for each script
+#   - the slowest imports (python -X importtime, cumulative)
+#   - which of the heavy, only-sometimes-needed modules got loaded anyway - there should be none:
+#     exifread, MediaInfo, tkinter, multiprocessing and the profiler are all loaded on first use
+#
+# Usage:
+#   python -m benchmarks.benchStartup [--runs 10] [--top 15] [--json out.json]
+#
+
+# standard Python imports
+import sys
+import json
+import argparse
+import subprocess
+
+from benchmarks import REPO_DIR, MAIN_SCRIPT
+
+SCRIPTS = [MAIN_SCRIPT, "RenameStills.py"]
+
+# modules that should only be loaded once a run needs them
+LAZY_MODULES = ['exifread', 'MediaInfoDLL3', 'tkinter', 'multiprocessing', 'cProfile', 'pstats', 'tracemalloc']
+
+# prints the LAZY_MODULES loaded by importing the main script
+_CHECK_LOADED = '''
+import sys, json
+from benchmarks import loadMain
+loadMain()
+print(json.dumps([m for m in %r if m in sys.modules]))
+''' % (LAZY_MODULES,)
+
+
+def timeStartup(script, runs):
+    '''
+    :return: list of wall times (s) for `python script --help`
+    '''
+    times = []
+    for i in range(runs):
+        out = subprocess.run([sys.executable, '-c',
+                              'import time, subprocess, sys; t = time.perf_counter(); '
+                              'subprocess.run([sys.executable, %r, "--help"], stdout = subprocess.DEVNULL, check = True); '
+                              'print(time.perf_counter() - t)' % script],
+                             cwd = REPO_DIR, capture_output = True, text = True, check = True)
+        times.append(float(out.stdout))
+    return times
+
+def slowestImports(top):
+    '''
+    :return: [(cumulative microseconds, module)] for the top slowest imports of the main script
+    '''
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'from benchmarks import loadMain; loadMain()'],
+                         cwd = REPO_DIR, capture_output = True, text = True, check = True)
+    imports = []
+    for line in out.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = line.split('|')
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            imports.append((int(fields[1]), fields[2].strip()))
+    return sorted(imports, reverse = True)[:top]
+
+def lazyLoaded():
+    out = subprocess.run([sys.executable, '-c', _CHECK_LOADED], cwd = REPO_DIR, capture_output = True,
+                         text = True, check = True)
+    return json.loads(out.stdout.splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description = "Measure how long the scripts take to start")
+    parser.add_argument('--runs', type = int, default = 10)
+    parser.add_argument('--top', type = int, default = 15, help = "slowest imports to list")
+    parser.add_argument('--json', help = "write the results here")
+    args = parser.parse_args()
+
+    results = {'python': sys.version.split()[0], 'startup': {}}
+    for script in SCRIPTS:
+        times = sorted(timeStartup(script, args.runs))
+        results['startup'][script] = {'best': times[0], 'median': times[len(times) // 2]}
+        print('%-26s best %6.1f ms  median %6.1f ms' % (script, times[0] * 1000, times[len(times) // 2] * 1000))
+
+    results['slowestImports'] = slowestImports(args.top)
+    print('\nSlowest imports (cumulative):')
+    for us, module in results['slowestImports']:
+        print('%8.1f ms  %s' % (us / 1000, module))
+
+    results['lazyLoaded'] = lazyLoaded()
+    print('\nLoaded at startup but only needed sometimes: ' + (', '.join(results['lazyLoaded']) or 'none'))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent = 1)
+
+if __name__ == '__main__':
+    main()
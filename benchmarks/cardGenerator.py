@@ -0,0 +1,297 @@
+# Name: cardGenerator.py
+#
+# Purpose:
+# Make a synthetic camera card on disk, for benchmarking without real cards.
+#   layouts:
+#     sony  - DCIM/100MSDCF/DSC0####.JPG + .ARW pairs, video in PRIVATE/M4ROOT/CLIP/C####.MP4
+#             and AVCHD PRIVATE/AVCHD/BDMV/STREAM/#####.MTS
+#     canon - DCIM/100CANON/IMG_####.JPG + .CR2 and MVI_####.MOV all mixed in together
+#     mixed - both of the above on one card (two bodies), plus some TIFs
+#   stills carry real EXIF (DateTimeOriginal, SubSecTimeOriginal) in JPEG APP1 / TIFF IFDs,
+#     with bursts of several shots in the same second, and file counters that wrap 9999 -> 0001
+#   raws can carry an embedded JPEG preview (ARW: JPEGInterchangeFormat, CR2: a JPEG strip in IFD0),
+#     followed by the 'sensor data' as a lossless JPEG strip in IFD1
+#   videos are stubs with valid headers (MP4/MOV moov atoms, MTS transport stream PES timestamps)
+# Everything is driven by a seed, so the same arguments always give the same card.
+#
+# Usage:
+#   python -m benchmarks.cardGenerator <dest dir> [--files N] [--layout sony|canon|mixed] [--seed S]
+#
+
+# standard Python imports
+import os
+import struct
+import random
+import argparse
+from datetime import datetime, timedelta
+
+LAYOUTS = ['sony', 'canon', 'mixed']
+
+# one video per this many stills
+STILLS_PER_VIDEO = 15
+
+# chance that a shot starts a burst, and the longest burst
+BURST_CHANCE = 0.1
+MAX_BURST = 8
+
+# first file counter used - close to 9999 so bigger cards wrap
+FIRST_COUNTER = 9000
+
+#
+# EXIF/ TIFF
+#
+def _ifd(endian, entries, offset, nextIFD = 0):
+    '''
+    build one IFD at offset
+    :param entries: list of (tag, type, count, value bytes) - values over 4 bytes go after the IFD
+    :return: bytes of the IFD and its out of line values
+    '''
+    entries = sorted(entries)
+    dataOffset = offset + 2 + 12 * len(entries) + 4
+    head = struct.pack(endian + 'H', len(entries))
+    data = b''
+    for tag, fieldType, count, value in entries:
+        if len(value) <= 4:
+            head += struct.pack(endian + 'HHI', tag, fieldType, count) + value.ljust(4, b'\0')
+        else:
+            head += struct.pack(endian + 'HHII', tag, fieldType, count, dataOffset + len(data))
+            data += value
+            if len(data) % 2:
+                data += b'\0'
+    return head + struct.pack(endian + 'I', nextIFD) + data
+
+def tiffBlock(dateTime, subSec, endian = '<', headerExtra = b'', make = b'SYNTH', ifd0Extra = (), nextIFD = 0):
+    '''
+    :param headerExtra: bytes after the 8 byte TIFF header, before IFD0 (eg the CR2 'CR' marker)
+    :param ifd0Extra: more IFD0 entries, as for _ifd - with values of 4 bytes or less, so the
+            length of the block doesn't depend on them
+    :param nextIFD: offset of IFD1
+    :return: a TIFF structure: IFD0 (Make, Exif IFD pointer) -> Exif IFD (DateTimeOriginal, SubSecTimeOriginal)
+    '''
+    dt = dateTime.strftime("%Y:%m:%d %H:%M:%S").encode() + b'\0'
+    ss = subSec.encode() + b'\0'
+    ifd0Offset = 8 + len(headerExtra)
+    makeValue = make + b'\0'
+    # the Exif IFD goes straight after IFD0 and the Make string
+    exifOffset = ifd0Offset + 2 + 12 * (2 + len(ifd0Extra)) + 4 + len(makeValue) + len(makeValue) % 2
+    ifd0 = _ifd(endian, [(0x010F, 2, len(makeValue), makeValue),
+                         (0x8769, 4, 1, struct.pack(endian + 'I', exifOffset))] + list(ifd0Extra), ifd0Offset, nextIFD)
+    exif = _ifd(endian, [(0x9003, 2, len(dt), dt), (0x9291, 2, len(ss), ss)], exifOffset)
+    order = b'II' if endian == '<' else b'MM'
+    return order + struct.pack(endian + 'HI', 42, ifd0Offset) + headerExtra + ifd0 + exif
+
+def jpegFile(dateTime, subSec, size):
+    '''
+    :return: a JPEG-shaped file: SOI, APP1 Exif, filler scan data, EOI
+    '''
+    app1 = b'Exif\0\0' + tiffBlock(dateTime, subSec)
+    head = b'\xff\xd8' + b'\xff\xe1' + struct.pack('>H', len(app1) + 2) + app1 + b'\xff\xda\x00\x02'
+    return head + b'\0' * max(0, size - len(head) - 2) + b'\xff\xd9'
+
+def previewJpeg(size, sof = 0xFFC0):
+    '''
+    :param sof: the frame type - baseline, or eg 0xFFC3 for the lossless JPEG a CR2 keeps its sensor data in
+    :return: a JPEG-shaped image: SOI, a 160x120 frame header, filler scan data, EOI
+    '''
+    head = b'\xff\xd8' + struct.pack('>HHBHHB', sof, 11, 8, 120, 160, 1) + b'\x01\x11\x00' + b'\xff\xda\x00\x02'
+    return head + b'\0' * max(0, size - len(head) - 2) + b'\xff\xd9'
+
+def rawFile(dateTime, subSec, size, fileType, previewBytes = 0):
+    '''
+    :param previewBytes: size of the embedded JPEG preview (ARW and CR2 only). 0 for none
+    :return: a TIFF based raw (ARW, CR2) or TIF, padded to size
+    '''
+    if fileType == 'CR2':
+        endian, headerExtra, make = '<', b'CR\x02\x00\x00\x00\x00\x00', b'Canon'
+    elif fileType == 'TIF':
+        endian, headerExtra, make = '>', b'', b'SYNTH'
+    else:
+        endian, headerExtra, make = '<', b'', b'SONY'
+    if not previewBytes or fileType == 'TIF':
+        block = tiffBlock(dateTime, subSec, endian, headerExtra, make)
+        return block + b'\0' * max(0, size - len(block))
+
+    def long(n):
+        return struct.pack(endian + 'I', n)
+    def previewEntries(offset, length):
+        if fileType == 'CR2':
+            # a full size JPEG, as the one strip of IFD0
+            return [(0x0103, 3, 1, struct.pack(endian + 'H', 6)), (0x0111, 4, 1, long(offset)), (0x0117, 4, 1, long(length))]
+        return [(0x0201, 4, 1, long(offset)), (0x0202, 4, 1, long(length))]
+
+    preview = previewJpeg(previewBytes)
+    blockLength = len(tiffBlock(dateTime, subSec, endian, headerExtra, make, previewEntries(0, 0)))
+    # IFD1: the sensor data, as a lossless JPEG strip
+    ifd1Offset = blockLength + len(preview)
+    ifd1Length = 2 + 12 * 3 + 4
+    sensor = previewJpeg(max(64, size - ifd1Offset - ifd1Length), 0xFFC3)
+    ifd1 = _ifd(endian, [(0x0103, 3, 1, struct.pack(endian + 'H', 6)), (0x0111, 4, 1, long(ifd1Offset + ifd1Length)),
+                         (0x0117, 4, 1, long(len(sensor)))], ifd1Offset)
+    block = tiffBlock(dateTime, subSec, endian, headerExtra, make, previewEntries(blockLength, len(preview)), ifd1Offset)
+    return block + preview + ifd1 + sensor
+
+#
+# video
+#
+def _atom(atomType, payload):
+    return struct.pack('>I4s', 8 + len(payload), atomType) + payload
+
+def mp4File(start, seconds, fps, size):
+    '''
+    :return: an MP4/MOV with ftyp, mdat filler and a moov (mvhd + one video trak) at the end, like most cameras
+    '''
+    created = int((start - datetime(1904, 1, 1)).total_seconds())
+    timescale, delta = (30000, 1001) if fps == 29.97 else (int(fps) * 1000, 1000)
+    frames = int(seconds * fps)
+    mvhd = _atom(b'mvhd', b'\0\0\0\0' + struct.pack('>IIII', created, created, 1000, int(seconds * 1000)) + b'\0' * 80)
+    mdhd = _atom(b'mdhd', b'\0\0\0\0' + struct.pack('>IIII', created, created, timescale, frames * delta) + b'\0' * 4)
+    hdlr = _atom(b'hdlr', b'\0' * 8 + b'vide' + b'\0' * 13)
+    stts = _atom(b'stts', b'\0\0\0\0' + struct.pack('>III', 1, frames, delta))
+    moov = _atom(b'moov', mvhd + _atom(b'trak', _atom(b'mdia', mdhd + hdlr + _atom(b'minf', _atom(b'stbl', stts)))))
+    ftyp = _atom(b'ftyp', b'isom\0\0\0\0isom')
+    mdat = _atom(b'mdat', b'\0' * max(0, size - len(ftyp) - len(moov) - 8))
+    return ftyp + mdat + moov
+
+def _tsPacket(pid, pts, video):
+    # one 192 byte AVCHD packet (4 byte timecode + 188 byte TS packet) starting a PES with a PTS
+    sid = 0xE0 if video else 0xC0
+    ptsBytes = bytes([0x21 | ((pts >> 29) & 0x0E), (pts >> 22) & 0xFF, ((pts >> 14) & 0xFE) | 1,
+                      (pts >> 7) & 0xFF, ((pts << 1) & 0xFE) | 1])
+    ts = bytes([0x47, 0x40 | (pid >> 8), pid & 0xFF, 0x10]) + b'\0\0\1' + bytes([sid]) + b'\0\0\x80\x80\x05' + ptsBytes
+    return b'\0\0\0\0' + ts.ljust(188, b'\xff')
+
+def mtsFile(seconds, fps, size):
+    '''
+    :return: an AVCHD style MTS: 192 byte packets, a video PES per frame (in I P B B order) and
+             audio PES, padded with null packets to roughly size
+    '''
+    tick = int(90000 / fps)
+    frames = int(seconds * fps)
+    nullPacket = b'\0\0\0\0' + bytes([0x47, 0x1F, 0xFF, 0x10]) + b'\0' * 184
+    fill = max(0, size // 192 // max(frames, 1) - 2)
+    out = bytearray()
+    startPTS = 900000
+    for i in range(frames):
+        order = (0, 3, 1, 2)[i % 4]
+        out += _tsPacket(0x1011, startPTS + (i - i % 4 + order) * tick, True)
+        out += _tsPacket(0x1100, startPTS + i * tick, False)
+        out += nullPacket * fill
+    return bytes(out)
+
+#
+# the card
+#
+class cardSpec():
+    def __init__(self, files = 1000, layout = 'sony', seed = 1, stillBytes = 20 * 1024, videoBytes = 1024 * 1024,
+                 start = datetime(2016, 5, 4, 9, 0, 0), days = 3, previewBytes = 0):
+        '''
+            what to put on a synthetic card
+            :param files: total number of media files (stills + video, a JPG + raw pair is 2)
+            :param stillBytes, videoBytes: size of each file (the contents are mostly filler)
+            :param days: the shots are spread over this many days from start
+            :param previewBytes: size of the JPEG preview in each ARW/ CR2 - 0 for none
+        '''
+        self.files = files
+        self.layout = layout
+        self.seed = seed
+        self.stillBytes = stillBytes
+        self.videoBytes = videoBytes
+        self.start = start
+        self.days = days
+        self.previewBytes = previewBytes
+
+def _counterName(prefix, counter, fileType):
+    return '%s%04d.%s' % (prefix, counter, fileType)
+
+def generateCard(dest, spec):
+    '''
+    write a synthetic card into dest (which should be empty/ not exist)
+    :return: dict of what was written: {'stills': n, 'videos': n, 'bytes': n}
+    '''
+    rnd = random.Random(spec.seed)
+    bodies = {'sony': ['sony'], 'canon': ['canon'], 'mixed': ['sony', 'canon']}[spec.layout]
+    written = {'stills': 0, 'videos': 0, 'bytes': 0}
+
+    def write(relPath, data):
+        fileName = os.path.join(dest, relPath)
+        os.makedirs(os.path.dirname(fileName), exist_ok = True)
+        with open(fileName, 'wb') as f:
+            f.write(data)
+        written['bytes'] += len(data)
+
+    # spread the shots evenly over the days, in order, with bursts in the same second
+    span = timedelta(days = spec.days) - timedelta(hours = 12)
+    step = span / max(spec.files, 1)
+    counters = {b: FIRST_COUNTER for b in bodies}
+    clipNo = {b: 0 for b in bodies}
+    shotsSinceVideo = 0
+    shot = 0
+    when = spec.start
+    while written['stills'] + written['videos'] < spec.files:
+        body = bodies[shot % len(bodies)]
+        shot += 1
+        if shotsSinceVideo >= STILLS_PER_VIDEO:
+            shotsSinceVideo = 0
+            seconds = rnd.randint(2, 20)
+            fps = rnd.choice([25, 25, 25, 50, 29.97])
+            if body == 'sony' and clipNo[body] % 3 == 2:
+                write('PRIVATE/AVCHD/BDMV/STREAM/%05d.MTS' % clipNo[body], mtsFile(seconds, fps, spec.videoBytes))
+            elif body == 'sony':
+                write('PRIVATE/M4ROOT/CLIP/C%04d.MP4' % clipNo[body], mp4File(when, seconds, fps, spec.videoBytes))
+            else:
+                counters[body] = counters[body] % 9999 + 1
+                write('DCIM/%dCANON/%s' % (100 + counters[body] // 1000, _counterName('MVI_', counters[body], 'MOV')),
+                      mp4File(when, seconds, fps, spec.videoBytes))
+            clipNo[body] += 1
+            written['videos'] += 1
+            when += max(step, timedelta(seconds = seconds + 1))
+            continue
+
+        burst = 1
+        if rnd.random() < BURST_CHANCE:
+            burst = rnd.randint(2, MAX_BURST)
+        for b in range(burst):
+            if written['stills'] + written['videos'] >= spec.files:
+                break
+            # the counter wraps 9999 -> 0001, the folder number follows the thousands
+            counters[body] = counters[body] % 9999 + 1
+            counter = counters[body]
+            subSec = '%02d' % (b * 10 % 100)
+            if body == 'sony':
+                folder = 'DCIM/%dMSDCF/' % (100 + counter // 1000)
+                prefix, rawType = 'DSC0', 'ARW'
+            else:
+                folder = 'DCIM/%dCANON/' % (100 + counter // 1000)
+                prefix = 'IMG_'
+                rawType = 'TIF' if spec.layout == 'mixed' and counter % 10 == 0 else 'CR2'
+            # JPG + raw pair
+            write(folder + _counterName(prefix, counter, 'JPG'), jpegFile(when, subSec, spec.stillBytes))
+            written['stills'] += 1
+            if written['stills'] + written['videos'] < spec.files:
+                write(folder + _counterName(prefix, counter, rawType),
+                      rawFile(when, subSec, spec.stillBytes * 2, rawType, spec.previewBytes))
+                written['stills'] += 1
+            shotsSinceVideo += 1
+        when += max(step * burst * 2, timedelta(seconds = 1))
+
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description = "Write a synthetic camera card for benchmarking")
+    parser.add_argument('dest', help = "dir to create the card in")
+    parser.add_argument('--files', type = int, default = 1000, help = "number of still + video files")
+    parser.add_argument('--layout', choices = LAYOUTS, default = 'sony')
+    parser.add_argument('--seed', type = int, default = 1)
+    parser.add_argument('--still-kb', type = int, default = 20, help = "size of each JPG (raws are twice this)")
+    parser.add_argument('--video-mb', type = float, default = 1, help = "size of each clip")
+    parser.add_argument('--preview-kb', type = int, default = 0, help = "size of the JPEG preview in each raw (0: none)")
+    args = parser.parse_args()
+
+    spec = cardSpec(args.files, args.layout, args.seed, args.still_kb * 1024, int(args.video_mb * 1024 * 1024),
+                    previewBytes = args.preview_kb * 1024)
+    written = generateCard(args.dest, spec)
+    print('Wrote %d stills and %d clips, %0.1f MB to %s' %
+          (written['stills'], written['videos'], written['bytes'] / 1e6, args.dest))
+
+if __name__ == '__main__':
+    main()
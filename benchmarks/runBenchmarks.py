@@ -0,0 +1,206 @@
+# Name: runBenchmarks.py
+#
+# Purpose:
+# Reproducible timings for the ingest, on synthetic cards (see cardGenerator.py), so a change
+# can be measured against the commit before it.
+# For each card size, a card is generated and copied by setupDirCopy with its defaults (checksums,
+# ledger, journal, dedup, space check - everything but the progress bar), in a fresh process with
+# an empty metadata cache, ledger and journal each time. Its run report (see runMetrics) gives the
+# wall clock and CPU of the whole ingest and of each phase:
+#   scan      - walk the card
+#   metadata  - read EXIF/ video tags (summed over the reader threads)
+#   dedup     - look for the files already in the day folders/ twice in the import
+#   sequence  - build the final names
+#   mkdir     - make the day folders
+#   copy      - copy every file, while the stages before it are still going
+#   rename    - give the copies their final names
+# The stages run at the same time, so the phases add up to more than the total.
+# The results go to a JSON report with the git commit, so runs on two commits can be compared.
+# Note the card is read from the page cache after it's generated - these are CPU/ syscall
+# timings, not card reader timings.
+#
+# Usage:
+#   python -m benchmarks.runBenchmarks [--sizes 100,1000,10000] [--layout sony|canon|mixed]
+#                                      [--repeat N] [--json out.json] [--work dir] [--keep]
+#   python -m benchmarks.runBenchmarks --compare before.json after.json
+#
+
+# standard Python imports
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+
+from benchmarks import REPO_DIR
+from benchmarks import cardGenerator
+
+PHASES = ['scan', 'metadata', 'dedup', 'sequence', 'mkdir', 'copy', 'rename']
+
+# run in a fresh process by timeIngest: setupDirCopy with its defaults, bar the paths and the progress bar
+# argv: card, stills root, video root, report folder
+INGEST_SCRIPT = '''
+import sys
+from benchmarks import loadMain
+sys.exit(loadMain().setupDirCopy(mediaSources = [sys.argv[1]], stillRootDestination = sys.argv[2],
+                                 videoRootDestination = sys.argv[3], reportDir = sys.argv[4], progress = None))
+'''
+
+DEFAULT_SIZES = "100,1000,10000"
+
+
+def gitCommit():
+    '''
+    :return: the short hash of the checked out commit, with a + if there are local changes, or ""
+    '''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd = REPO_DIR,
+                                capture_output = True, text = True, check = True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd = REPO_DIR,
+                               capture_output = True, text = True).stdout.strip()
+        return commit + ('+' if dirty else '')
+    except:
+        return ""
+
+def timeIngest(card, dest):
+    '''
+    copy card into dest with setupDirCopy, in a fresh process with its own (empty) metadata cache,
+    ledger and journal under dest
+    :return: {'total': {'wall': s, 'cpu': s}, 'phases': {phase: {'wall': s, 'cpu': s}}, 'MBps': MB copied/ total wall}
+    '''
+    reportDir = os.path.join(dest, 'reports')
+    env = dict(os.environ)
+    for name in ('XDG_CACHE_HOME', 'LOCALAPPDATA'):
+        env[name] = os.path.join(dest, 'cache')
+    for name in ('XDG_DATA_HOME', 'APPDATA'):
+        env[name] = os.path.join(dest, 'data')
+    subprocess.run([sys.executable, '-c', INGEST_SCRIPT, card, os.path.join(dest, 'P'), os.path.join(dest, 'V'),
+                    reportDir], cwd = REPO_DIR, env = env, stdout = subprocess.DEVNULL, check = True)
+
+    report = readReport(glob.glob(os.path.join(reportDir, '*.report.json'))[0])
+    phases = {p: {'wall': t['wall'], 'cpu': t['cpu']} for p, t in report['phases'].items()}
+    copied = sum(d['bytes'] for d in report['devices'] if d['role'] == 'dest')
+    return {'total': {'wall': report['wall'], 'cpu': report['cpu']}, 'phases': phases,
+            'MBps': copied / 1e6 / report['wall'] if report['wall'] > 0 else 0.0}
+
+def benchSize(files, args):
+    '''
+    generate a card of files media files and time args.repeat ingests of it, keeping the fastest
+    :return: a run dict for the report
+    '''
+    card = os.path.join(args.work, 'card-%d' % files)
+    if os.path.exists(card):
+        shutil.rmtree(card)
+    spec = cardGenerator.cardSpec(files, args.layout, args.seed, args.still_kb * 1024, args.video_kb * 1024)
+    start = time.perf_counter()
+    written = cardGenerator.generateCard(card, spec)
+    generateTime = time.perf_counter() - start
+
+    best = None
+    for r in range(args.repeat):
+        dest = os.path.join(args.work, 'dest-%d' % files)
+        if os.path.exists(dest):
+            shutil.rmtree(dest)
+        timed = timeIngest(card, dest)
+        if best is None or timed['total']['wall'] < best['total']['wall']:
+            best = timed
+
+    if not args.keep:
+        shutil.rmtree(card)
+        shutil.rmtree(dest)
+
+    run = {'files': files, 'layout': args.layout, 'seed': args.seed,
+           'stills': written['stills'], 'videos': written['videos'], 'bytes': written['bytes'],
+           'generate': generateTime, 'phases': best['phases'], 'total': best['total'], 'MBps': best['MBps']}
+    return run
+
+def printRun(run):
+    print('%d files (%d stills, %d videos, %0.1f MB), %s layout, %0.1f MB/s:' %
+          (run['files'], run['stills'], run['videos'], run['bytes'] / 1e6, run['layout'], run['MBps']))
+    for p in PHASES + ['total']:
+        t = run['phases'].get(p) or run.get(p)
+        if t is None:
+            continue
+        perFile = t['wall'] / max(run['files'], 1) * 1e6
+        print('  %-9s wall %8.3f s  cpu %8.3f s  %9.1f us/file' % (p, t['wall'], t['cpu'], perFile))
+
+def compareReports(before, after):
+    '''
+    print the phase timings of two reports side by side, for the card sizes in both
+    '''
+    a = readReport(before)
+    b = readReport(after)
+    print('before: %s  %s' % (a.get('commit', ''), before))
+    print('after:  %s  %s' % (b.get('commit', ''), after))
+    runsA = {(r['layout'], r['files']): r for r in a['runs']}
+    for runB in b['runs']:
+        runA = runsA.get((runB['layout'], runB['files']))
+        if runA is None:
+            continue
+        print('%d files, %s layout:' % (runB['files'], runB['layout']))
+        for p in PHASES + ['total']:
+            # reports from before a phase was timed don't have it
+            tA = runA['phases'].get(p) or runA.get(p)
+            tB = runB['phases'].get(p) or runB.get(p)
+            if tA is None or tB is None:
+                continue
+            tA = tA['wall']
+            tB = tB['wall']
+            ratio = tA / tB if tB > 0 else 0.0
+            print('  %-9s %8.3f s -> %8.3f s  x%0.2f' % (p, tA, tB, ratio))
+
+def readReport(fileName):
+    with open(fileName) as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description = "Time each phase of an ingest on synthetic cards")
+    parser.add_argument('--sizes', default = DEFAULT_SIZES,
+                        help = "comma separated card sizes, in media files (default " + DEFAULT_SIZES + ")")
+    parser.add_argument('--layout', choices = cardGenerator.LAYOUTS, default = 'mixed')
+    parser.add_argument('--seed', type = int, default = 1)
+    parser.add_argument('--still-kb', type = int, default = 20, help = "size of each JPG (raws are double)")
+    parser.add_argument('--video-kb', type = int, default = 1024, help = "size of each clip")
+    parser.add_argument('--repeat', type = int, default = 1, help = "ingests per size, the fastest is kept")
+    parser.add_argument('--work', help = "folder for the cards and copies (default: a temp folder)")
+    parser.add_argument('--keep', action = 'store_true', help = "don't delete the cards and copies")
+    parser.add_argument('--json', help = "write the report here")
+    parser.add_argument('--compare', nargs = 2, metavar = ('BEFORE', 'AFTER'),
+                        help = "compare two reports instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compareReports(*args.compare)
+        return
+
+    madeWork = args.work is None
+    if madeWork:
+        args.work = tempfile.mkdtemp(prefix = 'ptbench-')
+
+    report = {'commit': gitCommit(),
+              'created': time.strftime("%Y-%m-%d %H:%M:%S"),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'cpus': os.cpu_count(),
+              'runs': []}
+    try:
+        for files in [int(s) for s in args.sizes.split(',')]:
+            run = benchSize(files, args)
+            printRun(run)
+            report['runs'].append(run)
+    finally:
+        if madeWork and not args.keep:
+            shutil.rmtree(args.work, ignore_errors = True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent = 1)
+        print('Report written to ' + args.json)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# Name: burstIndex.py
+#
+# Purpose:
+# Number the stills shot in the same second (bursts), per file type (and camera ID, where the
+# caller has them), for the -NN name suffix, and collect the day folders on the way. Shared by Rename&TransferMedia.py and RenameStills.py.
+#   - one sort of the whole list by (second, file type) - the day is the front of the second -
+#     then one walk over the groups of equal keys. O(n log n) overall, so a 100k image archive
+#     costs about the same per image as a card
+#   - order within a burst: the EXIF sub-second time if every shot in it has one, else the
+#     file counter (DSC0####), unwrapped if it rolled over 9999 -> 0001 during the burst,
+#     then the file path, so shots from two camera bodies with no ID in the same second still get
+#     distinct, repeatable numbers
+#
+
+# the file counter in camera file names runs 0001 - 9999, then wraps
+COUNTER_MODULUS = 10000
+
+# seq for a still that's the only one in its second
+NO_SEQ = -1
+
+
+def _subSecFraction(subSec):
+    '''
+    :param subSec: EXIF SubSecTime string - the digits after the decimal point ("05" is 0.05s)
+    :return: fraction of a second, or None if there isn't one
+    '''
+    subSec = (subSec or "").strip()
+    if not subSec.isdigit():
+        return None
+    return int(subSec) / 10 ** len(subSec)
+
+def _unwrapCounters(counters):
+    '''
+    :return: the counters, with those past a wrap moved up by COUNTER_MODULUS.
+             A burst spanning the wrap has counters near both ends (eg 9998, 9999, 1, 2)
+    '''
+    if max(counters) - min(counters) <= COUNTER_MODULUS // 2:
+        return counters
+    return [c + COUNTER_MODULUS if c < COUNTER_MODULUS // 2 else c for c in counters]
+
+def burstOrder(burst, counterOf, subSecOf = None, nameOf = None):
+    '''
+    :param burst: items shot in the same second, of the same file type
+    :return: the items in shooting order (see the module header)
+    '''
+    fractions = [0.0] * len(burst)
+    if subSecOf is not None:
+        subSecs = [_subSecFraction(subSecOf(item)) for item in burst]
+        # only usable if every shot has one
+        if None not in subSecs:
+            fractions = subSecs
+    counters = _unwrapCounters([counterOf(item) for item in burst])
+    names = [nameOf(item) if nameOf is not None else "" for item in burst]
+    order = sorted(range(len(burst)), key = lambda i: (fractions[i], counters[i], names[i]))
+    return [burst[i] for i in order]
+
+def sequenceBursts(items, secondOf, typeOf, counterOf, subSecOf = None, nameOf = None, dayOf = None):
+    '''
+    set item.seq for every item: 0, 1, 2 ... in shooting order within a burst of 2 or more shots
+    of the same file type in the same second, NO_SEQ (-1) for a single shot
+    :param items: list of stills - sorted in place, into (second, file type, shooting order)
+    :param secondOf: item -> its time, to the second (a datetime, or a sortable string)
+    :param typeOf: item -> file type, or a tuple of whatever else must match too for shots to be one
+            burst (eg (camera ID name prefix, file type) - shots whose names differ anyway aren't numbered)
+    :param counterOf: item -> the number in its file name
+    :param subSecOf: optional item -> EXIF SubSecTimeOriginal string
+    :param nameOf: optional item -> path/ name, the last tie break
+    :param dayOf: optional item -> its day folder name
+    :return: the distinct dayOf() values, in date order ([] without dayOf)
+    '''
+    items.sort(key = lambda item: (secondOf(item), typeOf(item)))
+    keys = [(secondOf(item), typeOf(item)) for item in items]
+
+    days = []
+    start = 0
+    n = len(items)
+    while start < n:
+        end = start + 1
+        while end < n and keys[end] == keys[start]:
+            end += 1
+
+        if end - start == 1:
+            items[start].seq = NO_SEQ
+        else:
+            items[start:end] = burstOrder(items[start:end], counterOf, subSecOf, nameOf)
+            for seq in range(end - start):
+                items[start + seq].seq = seq
+
+        # sorted by time, so a new day is always different from the last one seen
+        if dayOf is not None:
+            day = dayOf(items[start])
+            if not days or days[-1] != day:
+                days.append(day)
+        start = end
+
+    return days
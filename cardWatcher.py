@@ -0,0 +1,338 @@
+# Name: cardWatcher.py
+#
+# Purpose:
+# Watch mode: import cards as they're plugged in, with no dialog - and keep importing from them as
+# new files turn up (tethered shooting), so a shot is in the archive seconds after it's taken.
+#   - watches a mount root (eg /media/$USER) for new volumes. One with a DCIM folder is imported once
+#     nothing on it has changed for `settle` seconds - a card still being mounted, or a tree still
+#     being written, isn't started on half done
+#   - every folder on an imported volume is then watched too, and the files that turn up there are
+#     handed on to the same import once the volume has settled again - just those, the card isn't walked
+#     again. When the volume goes (the card's taken out) its import is done
+#   - inotify (through ctypes, Linux only), else polling the folders every POLL_SECONDS
+# A "volume" is just a folder in the mount root, so any local folder can stand in for /media/$USER.
+# The import itself is whatever functions it's given - see the main script's `watch` command.
+#
+
+# standard Python imports
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import traceback
+
+# seconds without a change on a volume before it's imported
+WATCH_SETTLE = 3.0
+
+# seconds a new folder in the mount root is given to turn into a card (be mounted, get a DCIM)
+MOUNT_WAIT = 30.0
+
+# seconds between scans when polling
+POLL_SECONDS = 2.0
+
+# inotify (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# struct inotify_event, before the name
+_EVENT = struct.Struct('iIII')
+
+
+class inotifyWatch():
+    '''
+    folder watches with inotify. Raises OSError where there isn't any
+    '''
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        self.ctypes = ctypes
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno = True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, "No inotify here")
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1: " + os.strerror(ctypes.get_errno()))
+        self.paths = {}         # watch descriptor: folder
+        self.wds = {}           # folder: watch descriptor
+
+    def add(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            e = self.ctypes.get_errno()
+            raise OSError(e, os.strerror(e), path)
+        self.paths[wd] = path
+        self.wds[path] = wd
+
+    def watching(self, path):
+        return path in self.wds
+
+    def read(self, timeout):
+        '''
+        wait up to timeout seconds for changes
+        :return: list of (watched folder, name, is a folder) - folder None if events were lost
+                 (the kernel's queue overflowed), so anything may have changed
+        '''
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = b''
+        while True:
+            try:
+                chunk = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not chunk:
+                break
+            data += chunk
+
+        events = []
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0')
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                events.append((None, '', False))
+            elif mask & IN_IGNORED:
+                # the folder's gone (deleted, or the card unmounted)
+                path = self.paths.pop(wd, None)
+                self.wds.pop(path, None)
+            elif wd in self.paths:
+                events.append((self.paths[wd], os.fsdecode(name), bool(mask & IN_ISDIR)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+class pollWatch():
+    '''
+    the same as inotifyWatch, by listing the watched folders every so often
+    '''
+    def __init__(self, interval = POLL_SECONDS):
+        self.interval = interval
+        # folder: {name: (is a folder, size, mtimeNs)}
+        self.snapshots = {}
+
+    def _list(self, path):
+        listing = {}
+        with os.scandir(path) as entries:
+            for entry in entries:
+                st = entry.stat(follow_symlinks = False)
+                listing[entry.name] = (entry.is_dir(follow_symlinks = False), st.st_size, st.st_mtime_ns)
+        return listing
+
+    def add(self, path):
+        self.snapshots[path] = self._list(path)
+
+    def watching(self, path):
+        return path in self.snapshots
+
+    def read(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        events = []
+        for path, old in list(self.snapshots.items()):
+            try:
+                new = self._list(path)
+            except OSError:
+                del self.snapshots[path]
+                continue
+            for name, state in new.items():
+                # like inotify, a folder only when it's new - not each time something in it changes
+                if old.get(name) != state and not (state[0] and name in old):
+                    events.append((path, name, state[0]))
+            for name, state in old.items():
+                if name not in new:
+                    events.append((path, name, state[0]))
+            self.snapshots[path] = new
+        return events
+
+    def close(self):
+        pass
+
+class cardWatcher():
+    def __init__(self, mountRoot, ingest, settle = WATCH_SETTLE, poll = False, done = None):
+        '''
+            :param mountRoot: folder the cards are mounted in (eg /media/$USER), or any folder of folders
+            :param ingest: called as ingest(volume path, paths) to import from a card - from this thread,
+                    so the watcher waits for it. paths is None for the whole card (the first time, or
+                    after events were lost), else the files and folders changed on it since
+            :param settle: seconds without a change before a volume is imported
+            :param poll: poll rather than use inotify
+            :param done: optional, called as done(volume path) once an imported volume has gone, or
+                    the watcher stops
+        '''
+        self.root = os.path.abspath(mountRoot)
+        self.ingest = ingest
+        self.done = done
+        self.settle = settle
+        self.watch = None
+        if not poll:
+            try:
+                self.watch = inotifyWatch()
+            except (OSError, AttributeError):
+                print("No inotify here (" + str(sys.exc_info()[1]) + ") - polling every %g seconds" % POLL_SECONDS)
+        if self.watch is None:
+            self.watch = pollWatch()
+        # volume: (time of its last change, time it was first seen) - waiting to settle
+        self.pending = {}
+        # volume: the paths changed on it since it was imported, None for anything
+        self.changes = {}
+        # volumes imported at least once
+        self.volumes = set()
+        self.runs = 0
+
+    def isCard(self, volume):
+        return os.path.isdir(os.path.join(volume, 'DCIM'))
+
+    def volumeOf(self, path):
+        '''
+        :return: the volume (folder in the mount root) path is in
+        '''
+        return os.path.join(self.root, os.path.relpath(path, self.root).split(os.sep)[0])
+
+    def watchTree(self, volume):
+        '''
+        watch every folder on a volume, for files added to it later
+        '''
+        for dirName, dirs, files in os.walk(volume):
+            if not self.watch.watching(dirName):
+                try:
+                    self.watch.add(dirName)
+                except OSError:
+                    # eg gone already, or out of inotify watches
+                    print(traceback.format_exc())
+
+    def changed(self, volume, now, path = None):
+        '''
+        note a change on a volume, and what changed if known (path None for anything)
+        '''
+        self.pending[volume] = (now, self.pending.get(volume, (now, now))[1])
+        if volume in self.volumes:
+            paths = self.changes.get(volume, set())
+            if path is None or paths is None:
+                self.changes[volume] = None
+            else:
+                paths.add(path)
+                self.changes[volume] = paths
+
+    def start(self):
+        '''
+        watch the mount root, and check the volumes already in it (only new files are imported from
+        a card imported before)
+        '''
+        self.watch.add(self.root)
+        now = time.monotonic()
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    self.pending[entry.path] = (now - self.settle, now)
+
+    def step(self, timeout = 1.0):
+        '''
+        wait up to timeout seconds for changes, then import any volume that has settled
+        :return: number of volumes imported
+        '''
+        now = time.monotonic()
+        if self.pending:
+            timeout = max(0.0, min(timeout, min(last for last, first in self.pending.values()) + self.settle - now))
+        events = self.watch.read(timeout)
+        now = time.monotonic()
+        for path, name, isDir in events:
+            if path is None:
+                # events were lost - check everything
+                for volume in self.volumes:
+                    self.changed(volume, now)
+                with os.scandir(self.root) as entries:
+                    for entry in entries:
+                        if entry.is_dir():
+                            self.changed(entry.path, now)
+            elif path == self.root:
+                if isDir:
+                    self.changed(os.path.join(self.root, name), now)
+            else:
+                self.changed(self.volumeOf(path), now, os.path.join(path, name))
+
+        count = 0
+        for volume, (last, first) in list(self.pending.items()):
+            if now - last < self.settle:
+                continue
+            if not self.isCard(volume):
+                if volume in self.volumes:
+                    # taken out
+                    del self.pending[volume]
+                    self.closeVolume(volume)
+                # not mounted yet? Give it a while
+                elif now - first >= MOUNT_WAIT or not os.path.isdir(volume):
+                    del self.pending[volume]
+                continue
+            del self.pending[volume]
+            if self.importVolume(volume):
+                count += 1
+        return count
+
+    def importVolume(self, volume):
+        '''
+        import a volume that has settled: all of it the first time, after that what's changed on it
+        :return: True if there was anything to import
+        '''
+        paths = None
+        if volume in self.volumes:
+            paths = self.changes.pop(volume, None)
+            if paths is not None and not paths:
+                return False
+        # watched first, so files added while it's being imported aren't missed
+        if paths is None:
+            self.watchTree(volume)
+        else:
+            for path in paths:
+                if os.path.isdir(path):
+                    self.watchTree(path)
+        print('\nImporting ' + (volume if paths is None else '%d new files or folders on %s' % (len(paths), volume)))
+        try:
+            self.ingest(volume, paths)
+        except:
+            print(traceback.format_exc())
+        self.volumes.add(volume)
+        self.runs += 1
+        return True
+
+    def closeVolume(self, volume):
+        '''
+        an imported volume's gone - its import is done
+        '''
+        self.volumes.discard(volume)
+        self.changes.pop(volume, None)
+        if self.done is not None:
+            try:
+                self.done(volume)
+            except:
+                print(traceback.format_exc())
+
+    def run(self):
+        '''
+        watch until interrupted (Ctrl-C)
+        '''
+        self.start()
+        print('Watching ' + self.root + ' for cards. Ctrl-C to stop')
+        try:
+            while True:
+                self.step()
+        except KeyboardInterrupt:
+            print('\nStopped watching - %d imports' % self.runs)
+        finally:
+            for volume in sorted(self.volumes):
+                self.closeVolume(volume)
+            self.watch.close()
@@ -0,0 +1,294 @@
+# Name: copyEngine.py
+#
+# Purpose:
+# Copy one media file as fast as the devices allow, without wrecking the page cache.
+#   - in-kernel copy first: os.copy_file_range, then os.sendfile (no trip through Python)
+#   - else large reads into a page aligned buffer
+#   - preallocates the destination (posix_fallocate), so big clips aren't fragmented
+#   - tells the kernel the read is sequential, and drops the pages already copied
+#     (POSIX_FADV_DONTNEED), so a 100GB ingest doesn't evict everything else
+#   - keeps the same timestamps/ mode bits as shutil.copy2 (via shutil.copystat)
+#   - can hash the data on the way through, so the copy can be checked without re-reading the card.
+#     With the in-kernel copy, each chunk is hashed from the destination's page cache just after it's
+#     copied (before its pages are dropped), so hashing doesn't turn the fast copy off
+#   - can carry on from part way through a file, and checkpoint a long copy as it goes (see transferJournal)
+#   - when the source is on the same file system (eg re-organising an old dump on the archive disk),
+#     can give the file its new name without copying any data: a reflink (FICLONE - btrfs, XFS),
+#     a hardlink, or a move - see shareFile
+# The fast calls only exist on Linux (and some on other unixes) - everything falls back cleanly elsewhere.
+#
+
+# specialised, non-standard lib imports:
+# fcntl (for the reflink ioctl) is only on unixes
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# standard Python imports
+import os
+import mmap
+import errno
+import shutil
+import hashlib
+
+# bytes per read/ write or per in-kernel copy call
+CHUNK_BYTES = 8 * 1024 * 1024
+
+# only preallocate/ give cache hints for files at least this big - not worth the syscalls for a JPEG
+HINT_MIN_BYTES = 1024 * 1024
+
+# with a checkpoint function, the copy is synced to disk and checkpointed every this many bytes
+CHECKPOINT_BYTES = 256 * 1024 * 1024
+
+# bytes hashed just before a checkpoint, to check the copy and the source still match when resuming
+TAIL_BYTES = 1024 * 1024
+
+# ioctl to reflink a whole file (FICLONE in linux/fs.h)
+FICLONE = 0x40049409
+
+# ways to give a file on the same file system its new name: 'copy' copies the data anyway
+TRANSFER_MODES = ['copy', 'reflink', 'link', 'move']
+
+# errors meaning 'this fast path doesn't work here', rather than a real I/O problem
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSUP,
+                    errno.EBADF, errno.EPERM, errno.ENOTSOCK}
+
+
+def _fadvise(fd, offset, length, advice):
+    # cache hints are only hints - never fail a copy over them
+    try:
+        os.posix_fadvise(fd, offset, length, advice)
+    except (AttributeError, OSError):
+        pass
+
+def _preallocate(fd, size):
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        # eg not supported by the file system (FAT on some kernels) - just write it normally
+        pass
+
+def tailDigest(fd, offset):
+    '''
+    :param fd: an open file, readable. Its position isn't moved
+    :return: hex digest of the TAIL_BYTES (or fewer, at the start of a file) before offset
+    '''
+    start = max(0, offset - TAIL_BYTES)
+    if hasattr(os, 'pread'):
+        data = os.pread(fd, offset - start, start)
+    else:
+        pos = os.lseek(fd, 0, os.SEEK_CUR)
+        os.lseek(fd, start, os.SEEK_SET)
+        data = os.read(fd, offset - start)
+        os.lseek(fd, pos, os.SEEK_SET)
+    return hashlib.blake2b(data, digest_size = 16).hexdigest()
+
+class _checkpointer():
+    '''
+    progress callback for the copy loops, that also syncs & checkpoints every CHECKPOINT_BYTES
+    '''
+    def __init__(self, fdout, offset, progress, checkpoint):
+        self.fdout = fdout
+        self.offset = offset
+        self.last = offset          # offset of the last checkpoint (or where the copy was resumed from)
+        self.progress = progress
+        self.checkpoint = checkpoint
+
+    def __call__(self, n):
+        self.offset += n
+        if self.progress is not None:
+            self.progress(n)
+        if self.offset - self.last >= CHECKPOINT_BYTES:
+            os.fsync(self.fdout)
+            self.checkpoint(self.offset, tailDigest(self.fdout, self.offset))
+            self.last = self.offset
+
+def _hashBack(fdout, hasher, offset, n):
+    '''
+    hash n bytes of the destination from offset - just copied, so read from the page cache
+    '''
+    while n > 0:
+        data = os.pread(fdout, min(n, CHUNK_BYTES), offset)
+        if not data:
+            raise OSError(errno.EIO, "Copy is shorter than what was copied to it")
+        hasher.update(data)
+        offset += len(data)
+        n -= len(data)
+
+def _kernelCopy(fdin, fdout, size, offset, progress, hasher = None):
+    '''
+    copy from the current file positions with copy_file_range, then sendfile
+    :param hasher: updated with each chunk, read back from fdout (which must be readable)
+    :return: the offset reached. Less than size means the rest must be copied by hand
+    '''
+    for copyCall in (getattr(os, 'copy_file_range', None), getattr(os, 'sendfile', None)):
+        if copyCall is None:
+            continue
+        try:
+            while offset < size:
+                if copyCall is os.sendfile:
+                    n = os.sendfile(fdout, fdin, None, min(CHUNK_BYTES, size - offset))
+                else:
+                    n = os.copy_file_range(fdin, fdout, min(CHUNK_BYTES, size - offset))
+                if n == 0:
+                    # some file systems report 0 instead of an error
+                    break
+                if hasher is not None:
+                    _hashBack(fdout, hasher, offset, n)
+                offset += n
+                _dropCopied(fdin, fdout, offset, size)
+                if progress is not None:
+                    progress(n)
+        except OSError as e:
+            if e.errno not in _FALLBACK_ERRNOS:
+                raise
+        if offset >= size:
+            break
+    return offset
+
+def _dropCopied(fdin, fdout, offset, size):
+    '''
+    every so often, drop the pages behind the copy from the page cache
+    For the destination this also starts writeback of that range.
+    '''
+    if size >= HINT_MIN_BYTES and offset % (8 * CHUNK_BYTES) < CHUNK_BYTES:
+        _fadvise(fdin, 0, offset, getattr(os, 'POSIX_FADV_DONTNEED', 0))
+        _fadvise(fdout, 0, offset, getattr(os, 'POSIX_FADV_DONTNEED', 0))
+
+def _bufferedCopy(fin, fout, size, offset, progress, hasher = None):
+    '''
+    copy the rest of the file with large reads into a reused, page aligned buffer
+    :return: the offset reached
+    '''
+    # an anonymous mmap is page aligned, unlike a bytearray
+    buf = mmap.mmap(-1, CHUNK_BYTES)
+    view = memoryview(buf)
+    try:
+        while True:
+            n = fin.readinto(view)
+            if not n:
+                break
+            if hasher is not None:
+                hasher.update(view[:n])
+            # an unbuffered write may take less than asked for
+            written = 0
+            while written < n:
+                written += fout.write(view[written:n])
+            offset += n
+            _dropCopied(fin.fileno(), fout.fileno(), offset, size)
+            if progress is not None:
+                progress(n)
+    finally:
+        view.release()
+        buf.close()
+    return offset
+
+def copyFile(src, dst, progress = None, useKernelCopy = True, hasher = None, resumeFrom = 0, checkpoint = None):
+    '''
+    copy src to dst (a file name, not a dir), keeping the same metadata shutil.copy2 does
+    A partly written dst is removed if the copy fails - unless it has been checkpointed.
+    :param progress: optional function, called with the number of bytes in each chunk as it is copied
+    :param useKernelCopy: False forces the buffered copy
+    :param hasher: optional hash object (eg from importManifest.newHasher), updated with every
+            byte copied - in the buffered copy as it passes through, after the kernel copy by
+            reading each chunk back from the destination's page cache
+    :param resumeFrom: carry on copying from this offset, into an existing dst whose first resumeFrom
+            bytes are already right (the caller checks that - see tailDigest). A hasher must already
+            have been fed those bytes
+    :param checkpoint: optional function, called as checkpoint(offset, tailDigest) each time another
+            CHECKPOINT_BYTES have been copied and synced to disk
+    :return: number of bytes copied
+    '''
+    if hasher is not None and not hasattr(os, 'pread'):
+        # no way to read the copy back without moving its file position
+        useKernelCopy = False
+
+    with open(src, 'rb', buffering = 0) as fin:
+        size = os.fstat(fin.fileno()).st_size
+        ticker = None
+        try:
+            # opened for reading too, for the checkpoint's tail digest
+            with open(dst, 'r+b' if resumeFrom else 'w+b', buffering = 0) as fout:
+                fdin, fdout = fin.fileno(), fout.fileno()
+                if size >= HINT_MIN_BYTES:
+                    _fadvise(fdin, 0, 0, getattr(os, 'POSIX_FADV_SEQUENTIAL', 0))
+                    _preallocate(fdout, size)
+
+                offset = resumeFrom
+                if offset:
+                    fin.seek(offset)
+                    fout.seek(offset)
+                if checkpoint is not None:
+                    ticker = progress = _checkpointer(fdout, offset, progress, checkpoint)
+                if useKernelCopy:
+                    offset = _kernelCopy(fdin, fdout, size, offset, progress, hasher)
+                if offset < size:
+                    # carry on from wherever the fast path got to (the file positions have moved with it)
+                    offset = _bufferedCopy(fin, fout, size, offset, progress, hasher)
+                if offset != size:
+                    # the file changed under us, or preallocation left a longer file
+                    fout.truncate(offset)
+
+                if size >= HINT_MIN_BYTES:
+                    _fadvise(fdin, 0, 0, getattr(os, 'POSIX_FADV_DONTNEED', 0))
+                    _fadvise(fdout, 0, 0, getattr(os, 'POSIX_FADV_DONTNEED', 0))
+        except:
+            # a checkpointed copy is kept, to be resumed
+            if ticker is None or ticker.last == 0:
+                try:
+                    os.remove(dst)
+                except OSError:
+                    pass
+            raise
+
+    # same as copy2
+    shutil.copystat(src, dst)
+    return offset - resumeFrom
+
+def cloneFile(src, dst):
+    '''
+    reflink src to dst: dst shares src's data blocks until one of them is changed, so nothing is
+    copied and no space is used. Keeps the same metadata as copy2
+    Raises OSError where the file system can't (or they're on different file systems)
+    '''
+    if fcntl is None:
+        raise OSError(errno.ENOTSUP, "No reflinks on this system", src)
+    with open(src, 'rb') as fin:
+        try:
+            with open(dst, 'wb') as fout:
+                fcntl.ioctl(fout.fileno(), FICLONE, fin.fileno())
+        except:
+            try:
+                os.remove(dst)
+            except OSError:
+                pass
+            raise
+    shutil.copystat(src, dst)
+
+def shareFile(src, dst, mode):
+    '''
+    give src the name dst as well, on the same file system, without copying any data
+    :param mode: 'reflink'; 'link' for a hardlink (src and dst are then the same file); or 'move',
+            which is a hardlink for now - the caller removes src once it's done with dst - or a
+            rename where hardlinks aren't supported (eg FAT)
+    :return: the mode actually used: 'reflink', 'link' or 'move' (src is gone already). None if the
+             file system can't reflink - copy it instead
+    '''
+    if mode == 'reflink':
+        try:
+            cloneFile(src, dst)
+            return 'reflink'
+        except OSError as e:
+            # ENOTTY: the ioctl isn't known at all
+            if e.errno not in _FALLBACK_ERRNOS and e.errno != errno.ENOTTY:
+                raise
+        return None
+    try:
+        os.link(src, dst)
+        return 'link'
+    except OSError as e:
+        if mode != 'move' or e.errno not in _FALLBACK_ERRNOS:
+            raise
+    os.rename(src, dst)
+    return 'move'
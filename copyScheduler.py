@@ -0,0 +1,206 @@
+# Name: copyScheduler.py
+#
+# Purpose:
+# Run several file copies at once, without swamping any one device.
+#   - at most `workers` copies in flight overall
+#   - at most perSourceDevice copies reading from one device (eg a card reader),
+#     and perDestDevice copies writing to one device. Devices are told apart by st_dev
+#   - big files (video) and small files (stills) are interleaved, so a run of 4GB clips
+#     doesn't hold up the JPEGs, or the other way round
+# Keeps a running total of bytes copied, for the aggregate MB/s. Each copy's time, and the bytes per
+# device, also go to the run metrics (see runMetrics.py)
+#
+
+# standard Python imports
+import os
+import time
+import shutil
+import threading
+import traceback
+from collections import deque
+
+# local modules
+import runMetrics
+
+# default limits
+COPY_WORKERS = 4
+COPY_PER_SOURCE_DEVICE = 2
+COPY_PER_DEST_DEVICE = 4
+
+# files from this size up count as 'large' for interleaving
+LARGE_FILE_BYTES = 64 * 1024 * 1024
+
+# max copies waiting to start, before submit() blocks the caller
+MAX_PENDING = 256
+
+
+class copyJob():
+    def __init__(self, src, dst, size, onDone, srcDev, dstDev, copyFunc = None):
+        self.src = src
+        self.dst = dst
+        self.size = size
+        self.onDone = onDone        # called as onDone(job, error). error is None on success
+        self.srcDev = srcDev
+        self.dstDev = dstDev
+        self.large = size >= LARGE_FILE_BYTES
+        self.copyFunc = copyFunc    # this job's own copyFunc, else the scheduler's
+        self.result = None          # whatever copyFunc returned
+
+class copyScheduler():
+    def __init__(self, workers = COPY_WORKERS, perSourceDevice = COPY_PER_SOURCE_DEVICE,
+                 perDestDevice = COPY_PER_DEST_DEVICE, deviceLimits = None, copyFunc = shutil.copy2):
+        '''
+            start the copy workers
+            :param deviceLimits: optional {path: max copies} to override the limit for the device
+                    holding path (eg {'E:/': 1} for a slow card reader)
+            :param copyFunc: does the actual copy, called as copyFunc(src, dst). Its return value
+                    is kept in job.result
+        '''
+        self.perSourceDevice = perSourceDevice
+        self.perDestDevice = perDestDevice
+        self.copyFunc = copyFunc
+        self.deviceLimits = {}
+        for path, limit in (deviceLimits or {}).items():
+            self.deviceLimits[os.stat(path).st_dev] = limit
+
+        # st_dev per dir, so we don't stat every file
+        self.devCache = {}
+        # jobs waiting to start: small and large kept apart for interleaving
+        self.pending = {False: deque(), True: deque()}
+        self.pendingCount = 0
+        # copies running now, per device and per size class
+        self.srcActive = {}
+        self.dstActive = {}
+        self.largeActive = 0
+        self.smallActive = 0
+
+        self.bytesCopied = 0
+        self.filesCopied = 0
+        self.startTime = time.time()
+        self.endTime = None
+        self.closing = False
+        self.cond = threading.Condition()
+        self.metrics = runMetrics.getMetrics()
+
+        self.threads = [threading.Thread(target = self.metrics.profiled(self.worker), name = 'copy%d' % i,
+                                         daemon = True) for i in range(workers)]
+        for t in self.threads:
+            t.start()
+
+    def __str__(self):
+        return 'copied %d files, %0.1f MB at %0.1f MB/s' % (self.filesCopied, self.bytesCopied / 1e6, self.MBps())
+
+    def dirDevice(self, dirName):
+        '''
+        :return: st_dev of the device dirName is on
+        '''
+        dev = self.devCache.get(dirName)
+        if dev is None:
+            dev = os.stat(dirName or '.').st_dev
+            self.devCache[dirName] = dev
+        return dev
+
+    def submit(self, src, dst, size, onDone, copyFunc = None):
+        '''
+        queue a copy of src to dst. Blocks while MAX_PENDING copies are already waiting
+        :param size: bytes in src (for interleaving and the MB/s)
+        :param onDone: called from a copy thread as onDone(job, error) - error is None on success
+        :param copyFunc: optional copyFunc(src, dst) for just this job, instead of the scheduler's
+        '''
+        job = copyJob(src, dst, size, onDone,
+                      self.dirDevice(os.path.dirname(src)), self.dirDevice(os.path.dirname(dst)), copyFunc)
+        with self.cond:
+            while self.pendingCount >= MAX_PENDING:
+                self.cond.wait()
+            self.pending[job.large].append(job)
+            self.pendingCount += 1
+            self.cond.notify_all()
+
+    def deviceFree(self, job):
+        srcLimit = self.deviceLimits.get(job.srcDev, self.perSourceDevice)
+        dstLimit = self.deviceLimits.get(job.dstDev, self.perDestDevice)
+        return self.srcActive.get(job.srcDev, 0) < srcLimit and self.dstActive.get(job.dstDev, 0) < dstLimit
+
+    def nextJob(self):
+        '''
+        pick the next job to run, or None if nothing can start now. Call with cond held.
+        Prefers the size class with fewer copies running, then takes the oldest job
+        whose devices are under their limits
+        '''
+        preferLarge = self.largeActive < self.smallActive
+        for large in (preferLarge, not preferLarge):
+            jobs = self.pending[large]
+            for i, job in enumerate(jobs):
+                if self.deviceFree(job):
+                    del jobs[i]
+                    self.pendingCount -= 1
+                    return job
+        return None
+
+    def worker(self):
+        while True:
+            with self.cond:
+                job = self.nextJob()
+                while job is None:
+                    if self.closing and self.pendingCount == 0:
+                        return
+                    self.cond.wait()
+                    job = self.nextJob()
+                self.srcActive[job.srcDev] = self.srcActive.get(job.srcDev, 0) + 1
+                self.dstActive[job.dstDev] = self.dstActive.get(job.dstDev, 0) + 1
+                if job.large:
+                    self.largeActive += 1
+                else:
+                    self.smallActive += 1
+                # room in the queue for submit()
+                self.cond.notify_all()
+
+            error = None
+            start = time.perf_counter()
+            try:
+                with self.metrics.timeFile('copy', workerCpu = True):
+                    job.result = (job.copyFunc or self.copyFunc)(job.src, job.dst)
+            except Exception as e:
+                print(traceback.format_exc())
+                error = e
+            end = time.perf_counter()
+            if error is None:
+                self.metrics.transferred(job.srcDev, os.path.dirname(job.src), 'source', job.size, start, end)
+                self.metrics.transferred(job.dstDev, os.path.dirname(job.dst), 'dest', job.size, start, end)
+
+            with self.cond:
+                self.srcActive[job.srcDev] -= 1
+                self.dstActive[job.dstDev] -= 1
+                if job.large:
+                    self.largeActive -= 1
+                else:
+                    self.smallActive -= 1
+                if error is None:
+                    self.bytesCopied += job.size
+                    self.filesCopied += 1
+                self.cond.notify_all()
+
+            try:
+                job.onDone(job, error)
+            except:
+                print(traceback.format_exc())
+
+    def close(self):
+        '''
+        wait for all the submitted copies to finish, and stop the workers
+        '''
+        with self.cond:
+            self.closing = True
+            self.cond.notify_all()
+        for t in self.threads:
+            t.join()
+        self.endTime = time.time()
+
+    def MBps(self):
+        '''
+        :return: aggregate throughput so far (or over the whole run, once closed), in MB/s
+        '''
+        elapsed = (self.endTime or time.time()) - self.startTime
+        if elapsed <= 0:
+            return 0.0
+        return self.bytesCopied / 1e6 / elapsed
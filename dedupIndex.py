@@ -0,0 +1,164 @@
+# Name: dedupIndex.py
+#
+# Purpose:
+# Spot files that are already in the library, or already in this import (the same card in two
+# readers, a card ingested again after more shooting), before any bytes are copied.
+#   - screened by size first: no file is opened unless another file has exactly the same size
+#   - then a partial hash: the first and last PARTIAL_BYTES (the EXIF header and the end of the data)
+#   - only when those match too, a full hash of both files confirms it
+# Hashes are worked out once per file, when first needed, and kept. hashAhead() works out the ones a
+# batch of files is going to need on a pool of threads, so check() doesn't read them one at a time.
+# The library is indexed one day folder at a time (one scandir each, see destIndex), as files for
+# that day turn up - a duplicate shot has the same date, so it would land in the same folder.
+#
+
+# standard Python imports
+import os
+import hashlib
+import threading
+from collections import Counter
+
+# local modules
+import importManifest
+import destIndex
+
+# bytes hashed from each end of a file for the partial hash
+PARTIAL_BYTES = 64 * 1024
+
+
+def partialHash(path, size):
+    '''
+    :return: hex digest of the first and last PARTIAL_BYTES of a file (all of it, if it's small)
+    '''
+    h = hashlib.blake2b(digest_size = 16)
+    with open(path, 'rb') as f:
+        if size <= 2 * PARTIAL_BYTES:
+            h.update(f.read())
+        else:
+            h.update(f.read(PARTIAL_BYTES))
+            f.seek(size - PARTIAL_BYTES)
+            h.update(f.read(PARTIAL_BYTES))
+    return h.hexdigest()
+
+class dedupCandidate():
+    __slots__ = ('path', 'size', 'inLibrary', 'partial', 'full')
+
+    def __init__(self, path, size, inLibrary):
+        self.path = path
+        self.size = size
+        self.inLibrary = inLibrary  # False for a file earlier in this import (path is then its source)
+        self.partial = None         # worked out when first needed
+        self.full = None
+
+class dedupIndex():
+    def __init__(self, algo = 'blake2b', skipPrefix = '.', dest = None):
+        '''
+            :param algo: full hash to confirm a match with (see importManifest.HASH_ALGOS). Use the
+                    manifest's, and the digest of a match can go straight into the manifest
+            :param skipPrefix: names in the library to leave out (hidden/ temporary files)
+            :param dest: the destIndex to list the library folders with - shared with the naming, so
+                    each is only listed once. None makes one
+        '''
+        self.algo = algo
+        self.skipPrefix = skipPrefix
+        self.dest = dest or destIndex.destIndex()
+        # size: [dedupCandidate]
+        self.bySize = {}
+        self.folders = set()
+        self.lock = threading.Lock()
+        self.partialHashes = 0
+        self.fullHashes = 0
+
+    def __str__(self):
+        return '%d sizes indexed in %d folders, %d partial & %d full hashes' % (
+            len(self.bySize), len(self.folders), self.partialHashes, self.fullHashes)
+
+    def addFolder(self, folder):
+        '''
+        index the files already in a library folder (once per folder - later calls do nothing)
+        '''
+        if folder in self.folders:
+            return
+        self.folders.add(folder)
+        for name, size in self.dest.files(folder, self.skipPrefix):
+            self.bySize.setdefault(size, []).append(dedupCandidate(os.path.join(folder, name), size, True))
+
+    def _partial(self, c):
+        if c.partial is None:
+            c.partial = partialHash(c.path, c.size)
+            self.partialHashes += 1
+        return c.partial
+
+    def _full(self, c):
+        if c.full is None:
+            c.full = importManifest.hashFile(c.path, self.algo)
+            self.fullHashes += 1
+        return c.full
+
+    def hashAhead(self, files, pool):
+        '''
+        work out the hashes check() is going to want for a batch of files, on pool's threads: the partial
+        hash of each file another one has the same size as (in the library, checked before, or in the
+        batch), then the full hash of those whose partial hashes match too
+        A file that can't be read is left for check() to fail on
+        :param files: [(path, size, library folder it would be copied to)]
+        :param pool: a concurrent.futures executor
+        :return: {path: dedupCandidate} - pass each to check() as known
+        '''
+        with self.lock:
+            for path, size, folder in files:
+                self.addFolder(folder)
+            batch = {path: dedupCandidate(path, size, False) for path, size, folder in files}
+            inBatch = Counter(c.size for c in batch.values())
+            sizes = {c.size for c in batch.values() if c.size in self.bySize or inBatch[c.size] > 1}
+            # everything of those sizes: the batch's files, and those in the index
+            same = [c for c in batch.values() if c.size in sizes] + \
+                   [c for size in sizes for c in self.bySize.get(size, [])]
+        self._hashAll(pool, [c for c in same if c.partial is None], 'partial')
+
+        groups = Counter((c.size, c.partial) for c in same if c.partial is not None)
+        self._hashAll(pool, [c for c in same if c.full is None and groups[(c.size, c.partial)] > 1], 'full')
+        return batch
+
+    def _hashAll(self, pool, candidates, kind):
+        '''
+        set the partial or full hash of each candidate, hashing them on pool's threads
+        '''
+        def hashOne(c):
+            try:
+                if kind == 'partial':
+                    return partialHash(c.path, c.size)
+                return importManifest.hashFile(c.path, self.algo)
+            except OSError:
+                return None
+
+        digests = list(pool.map(hashOne, candidates))
+        with self.lock:
+            for c, digest in zip(candidates, digests):
+                if digest is None or getattr(c, kind) is not None:
+                    continue
+                setattr(c, kind, digest)
+                if kind == 'partial':
+                    self.partialHashes += 1
+                else:
+                    self.fullHashes += 1
+
+    def check(self, path, size, folder, known = None):
+        '''
+        look for a file with the same content as path, in the library folder it's going to and
+        among the files checked before it. If there isn't one, path is added to the index, so
+        later copies of it are found
+        :param folder: the library folder path would be copied to
+        :param known: path's dedupCandidate from hashAhead(), with the hashes it worked out. None to
+                hash it here as needed
+        :return: the matching dedupCandidate (its full hash is set), or None
+        '''
+        with self.lock:
+            self.addFolder(folder)
+            new = known or dedupCandidate(path, size, False)
+            others = self.bySize.setdefault(size, [])
+            for c in others:
+                if self._partial(c) == self._partial(new) and self._full(c) == self._full(new):
+                    return c
+            others.append(new)
+            return None
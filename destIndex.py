@@ -0,0 +1,82 @@
+# Name: destIndex.py
+#
+# Purpose:
+# What's already in the destination day folders, held in memory, so deciding where a file goes costs
+# no file system calls - on a NAS mounted archive a stat per file adds up.
+#   - each day folder is listed once (one scandir), the first time a file for it turns up
+#   - sizes & mod times come from the DirEntries, and are only looked up for the names asked about
+#     (then kept in the listing)
+#   - names given out by this import are added as they're used, so later files see them too
+#
+
+# standard Python imports
+import os
+import threading
+
+
+class destIndex():
+    def __init__(self):
+        # folder: {name: DirEntry, or (size, mtimeNs) for files added since it was listed}
+        self.folders = {}
+        self.lock = threading.Lock()
+        self.scans = 0
+
+    def __str__(self):
+        return '%d day folders listed, %d names' % (self.scans, sum(len(n) for n in self.folders.values()))
+
+    def listing(self, folder):
+        '''
+        :return: the {name: entry} of a folder - listed the first time it's asked for
+        '''
+        with self.lock:
+            names = self.folders.get(folder)
+            if names is None:
+                names = {}
+                try:
+                    with os.scandir(folder) as entries:
+                        for entry in entries:
+                            names[entry.name] = entry
+                except FileNotFoundError:
+                    # a new day folder - nothing in it yet
+                    pass
+                self.folders[folder] = names
+                self.scans += 1
+            return names
+
+    def stat(self, folder, name):
+        '''
+        :return: (size, mtimeNs) of a file in folder, or None if there's no such name
+        '''
+        names = self.listing(folder)
+        entry = names.get(name)
+        if entry is None or isinstance(entry, tuple):
+            return entry
+        # a DirEntry: stat it, and keep the result in its place, so the name is only stat'd once
+        st = entry.stat()
+        result = (st.st_size, st.st_mtime_ns)
+        if entry.is_file():
+            with self.lock:
+                # unless the name has been given out meanwhile (see add)
+                if names.get(name) is entry:
+                    names[name] = result
+        return result
+
+    def files(self, folder, skipPrefix = '.'):
+        '''
+        :return: (name, size) of every file in folder, except those whose names start with skipPrefix
+        '''
+        files = []
+        for name, entry in list(self.listing(folder).items()):
+            if name.startswith(skipPrefix):
+                continue
+            if isinstance(entry, tuple):
+                files.append((name, entry[0]))
+            elif entry.is_file():
+                files.append((name, entry.stat().st_size))
+        return files
+
+    def add(self, folder, name, size, mtimeNs):
+        '''
+        note a file given name in folder
+        '''
+        self.listing(folder)[name] = (size, mtimeNs)
@@ -0,0 +1,293 @@
+# Name: exifFast.py
+#
+# Purpose:
+# Get just DateTimeOriginal (and SubSecTimeOriginal) out of a still, without building
+# exifread's whole tag dictionary.
+# Walks the TIFF IFDs directly: IFD0 -> Exif IFD -> the two tags we want.
+#   JPG: the TIFF block is inside the APP1 'Exif' segment, near the start of the file
+#   ARW, CR2, TIF: the file itself is a TIFF
+# Only the bytes needed are read - the first block of the file, plus a seek for anything beyond it.
+# The same walk can find the JPEG preview a RAW (ARW, CR2) carries, so it can be pulled out without
+# decoding the RAW: the biggest baseline JPEG any of its IFDs point to (JPEGInterchangeFormat, or a
+# single JPEG strip as in CR2 IFD0) - not the lossless JPEG some keep the sensor data in.
+# Returns None if anything looks wrong, so the caller can fall back to exifread - which is only
+# imported then (loadExifread), since it is slow to load and most runs never need it.
+#
+
+# standard Python imports
+import re
+import struct
+
+# bytes read from the start of the file in one go. Covers the EXIF of nearly every camera
+HEAD_BYTES = 16 * 1024
+
+# TIFF tags
+TAG_EXIF_IFD = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_SUBSEC_TIME_ORIGINAL = 0x9291
+TAG_COMPRESSION = 0x0103
+TAG_STRIP_OFFSETS = 0x0111
+TAG_STRIP_BYTE_COUNTS = 0x0117
+TAG_SUB_IFDS = 0x014A
+TAG_JPEG_OFFSET = 0x0201
+TAG_JPEG_LENGTH = 0x0202
+
+# Compression value for (old style) JPEG data in strips
+COMPRESSION_OLD_JPEG = 6
+
+# RAW types with an embedded preview worth pulling out
+PREVIEW_TYPES = ['ARW', 'CR2']
+
+# max IFDs followed looking for the preview - RAWs have 2 to 4
+MAX_IFDS = 8
+
+# JPEG start of frame markers for the image kinds a viewer can show (baseline, extended, progressive)
+VIEWABLE_SOF = (0xFFC0, 0xFFC1, 0xFFC2)
+
+# TIFF field type -> size in bytes of one value
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4}
+
+# max entries in one IFD - anything bigger is corrupt
+MAX_IFD_ENTRIES = 1000
+
+EXIF_DATE_RE = re.compile(r'^\d{4}:\d\d:\d\d \d\d:\d\d:\d\d$')
+
+# the exifread module once loaded (None if it isn't installed)
+_exifread = None
+_exifreadTried = False
+
+
+def loadExifread():
+    '''
+    :return: the exifread module, imported on first use, or None if it isn't installed
+    '''
+    global _exifread, _exifreadTried
+    if not _exifreadTried:
+        try:
+            import exifread
+            _exifread = exifread
+        except:
+            print ("exifread was not found - stills exifFast can't read will be named from their mod time")
+            _exifread = None
+        _exifreadTried = True
+    return _exifread
+
+
+class tiffReader():
+    '''
+    reads values out of a TIFF structure in an open file, starting at base
+    (0 for a plain TIFF/ RAW, the start of the TIFF header inside a JPEG's APP1)
+    The head of the file is kept in memory, reads past it seek
+    '''
+    def __init__(self, f, head, base):
+        self.f = f
+        self.head = head
+        self.base = base
+        order = self.read(0, 2)
+        if order == b'II':
+            self.endian = '<'
+        elif order == b'MM':
+            self.endian = '>'
+        else:
+            raise ValueError("not a TIFF header")
+        magic, self.ifd0 = struct.unpack(self.endian + 'HI', self.read(2, 6))
+        if magic != 42:
+            raise ValueError("bad TIFF magic")
+
+    def read(self, offset, length):
+        '''
+        :param offset: relative to the TIFF header
+        '''
+        start = self.base + offset
+        if start + length <= len(self.head):
+            data = self.head[start:start + length]
+        else:
+            self.f.seek(start)
+            data = self.f.read(length)
+        if len(data) != length:
+            raise ValueError("TIFF offset past end of file")
+        return data
+
+    def readIFD(self, offset):
+        '''
+        :return: ({tag: (type, count, raw 4 byte value/ offset field)}, offset of the next IFD)
+        '''
+        count = struct.unpack(self.endian + 'H', self.read(offset, 2))[0]
+        if count > MAX_IFD_ENTRIES:
+            raise ValueError("IFD too big")
+        raw = self.read(offset + 2, count * 12 + 4)
+        entries = {}
+        for i in range(count):
+            tag, fieldType, n = struct.unpack(self.endian + 'HHI', raw[i * 12:i * 12 + 8])
+            entries[tag] = (fieldType, n, raw[i * 12 + 8:i * 12 + 12])
+        nextIFD = struct.unpack(self.endian + 'I', raw[count * 12:count * 12 + 4])[0]
+        return entries, nextIFD
+
+    def valueBytes(self, entry):
+        '''
+        :return: the raw bytes of an entry's value - inline if they fit in 4 bytes, else at the offset
+        '''
+        fieldType, n, field = entry
+        length = TYPE_SIZES.get(fieldType, 1) * n
+        if length <= 4:
+            return field[:length]
+        return self.read(struct.unpack(self.endian + 'I', field)[0], length)
+
+    def ascii(self, entry):
+        return self.valueBytes(entry).split(b'\0', 1)[0].decode('ascii', 'replace').strip()
+
+    def integers(self, entry):
+        '''
+        :return: all the values of a SHORT or LONG entry
+        '''
+        fieldType, n = entry[0], entry[1]
+        return list(struct.unpack(self.endian + ('H' if fieldType == 3 else 'I') * n, self.valueBytes(entry)))
+
+    def integer(self, entry):
+        '''
+        :return: the first value of a SHORT or LONG entry
+        '''
+        fieldType = entry[0]
+        if fieldType == 3:
+            return struct.unpack(self.endian + 'H', entry[2][:2])[0]
+        return struct.unpack(self.endian + 'I', entry[2])[0]
+
+def openTiff(f):
+    '''
+    find the TIFF structure in a still image file
+    :param f: file opened 'rb'
+    :return: a tiffReader
+    '''
+    head = f.read(HEAD_BYTES)
+    if head[:2] in (b'II', b'MM'):
+        return tiffReader(f, head, 0)
+    if head[:2] != b'\xff\xd8':
+        raise ValueError("not a JPEG or TIFF")
+
+    # JPEG - walk the segments to the APP1 Exif one
+    pos = 2
+    while True:
+        if pos + 4 > len(head):
+            raise ValueError("no Exif segment in the head of the file")
+        marker, length = struct.unpack('>HH', head[pos:pos + 4])
+        if marker in (0xFFDA, 0xFFD9):
+            raise ValueError("no Exif segment")
+        if marker == 0xFFE1 and head[pos + 4:pos + 10] == b'Exif\0\0':
+            return tiffReader(f, head, pos + 10)
+        pos += 2 + length
+
+def hasPreview(fileName):
+    '''
+    :return: True for the RAW types findPreview knows
+    '''
+    return fileName[fileName.rfind('.') + 1:].upper() in PREVIEW_TYPES
+
+def _viewableJpeg(tiff, offset, length):
+    '''
+    :return: True if there's a JPEG a viewer can show at offset - walks its segment headers to the frame
+    '''
+    if length < 4 or tiff.read(offset, 2) != b'\xff\xd8':
+        return False
+    pos = offset + 2
+    for i in range(64):
+        marker, segLength = struct.unpack('>HH', tiff.read(pos, 4))
+        if marker in VIEWABLE_SOF:
+            return True
+        # any other frame type (eg lossless RAW data), or the image data itself
+        if (0xFFC3 <= marker <= 0xFFCF and marker not in (0xFFC4, 0xFFC8, 0xFFCC)) or marker in (0xFFDA, 0xFFD9):
+            return False
+        pos += 2 + segLength
+    return False
+
+def _findPreview(tiff, ifd0, nextIFD):
+    '''
+    :return: (offset in the file, length) of the biggest viewable JPEG the IFDs point to, or None
+    '''
+    ifds = [ifd0]
+    if TAG_SUB_IFDS in ifd0:
+        for offset in tiff.integers(ifd0[TAG_SUB_IFDS])[:MAX_IFDS]:
+            ifds.append(tiff.readIFD(offset)[0])
+    seen = {tiff.ifd0}
+    while nextIFD and nextIFD not in seen and len(ifds) < MAX_IFDS:
+        seen.add(nextIFD)
+        ifd, nextIFD = tiff.readIFD(nextIFD)
+        ifds.append(ifd)
+
+    candidates = []
+    for ifd in ifds:
+        if TAG_JPEG_OFFSET in ifd and TAG_JPEG_LENGTH in ifd:
+            candidates.append((tiff.integer(ifd[TAG_JPEG_LENGTH]), tiff.integer(ifd[TAG_JPEG_OFFSET])))
+        elif TAG_COMPRESSION in ifd and tiff.integer(ifd[TAG_COMPRESSION]) == COMPRESSION_OLD_JPEG and \
+                TAG_STRIP_OFFSETS in ifd and TAG_STRIP_BYTE_COUNTS in ifd and ifd[TAG_STRIP_OFFSETS][1] == 1:
+            candidates.append((tiff.integer(ifd[TAG_STRIP_BYTE_COUNTS]), tiff.integer(ifd[TAG_STRIP_OFFSETS])))
+    for length, offset in sorted(candidates, reverse = True):
+        if _viewableJpeg(tiff, offset, length):
+            return (tiff.base + offset, length)
+    return None
+
+def findPreview(fileName):
+    '''
+    :return: (offset, length) of the embedded JPEG preview in a RAW, or None if it hasn't got one
+    '''
+    try:
+        with open(fileName, 'rb') as f:
+            tiff = openTiff(f)
+            ifd0, nextIFD = tiff.readIFD(tiff.ifd0)
+            return _findPreview(tiff, ifd0, nextIFD)
+    except (OSError, ValueError, struct.error):
+        return None
+
+def readPreview(fileName, location):
+    '''
+    :param location: (offset, length) from findPreview/ readStillInfo
+    :return: the preview's bytes - a complete JPEG file
+    '''
+    offset, length = location
+    with open(fileName, 'rb') as f:
+        f.seek(offset)
+        data = f.read(length)
+    if len(data) != length or data[:2] != b'\xff\xd8':
+        raise ValueError("No preview in " + fileName + " at %d" % offset)
+    return data
+
+def readDateTimeOriginal(fileName):
+    '''
+    :return: (DateTimeOriginal, SubSecTimeOriginal) strings as exifread would give them
+             ('yyyy:mm:dd hh:mm:ss', '' if there is no subsec), or None if the fast path can't read it
+    '''
+    info = readStillInfo(fileName)
+    if info is None:
+        return None
+    return info[:2]
+
+def readStillInfo(fileName, preview = False):
+    '''
+    :param preview: look for the embedded preview too, in the same walk (see findPreview)
+    :return: (DateTimeOriginal, SubSecTimeOriginal, preview (offset, length) or None), or None if the
+             fast path can't read the date
+    '''
+    location = None
+    try:
+        with open(fileName, 'rb') as f:
+            tiff = openTiff(f)
+            ifd0, nextIFD = tiff.readIFD(tiff.ifd0)
+            if preview:
+                try:
+                    location = _findPreview(tiff, ifd0, nextIFD)
+                except (OSError, ValueError, struct.error):
+                    pass
+            if TAG_EXIF_IFD not in ifd0:
+                return None
+            exifIFD, nextIFD = tiff.readIFD(tiff.integer(ifd0[TAG_EXIF_IFD]))
+            if TAG_DATETIME_ORIGINAL not in exifIFD:
+                return None
+            dateTime = tiff.ascii(exifIFD[TAG_DATETIME_ORIGINAL])
+            subSec = ""
+            if TAG_SUBSEC_TIME_ORIGINAL in exifIFD:
+                subSec = tiff.ascii(exifIFD[TAG_SUBSEC_TIME_ORIGINAL])
+    except (OSError, ValueError, struct.error):
+        return None
+
+    if not EXIF_DATE_RE.match(dateTime):
+        return None
+    return dateTime, subSec, location
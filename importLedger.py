@@ -0,0 +1,179 @@
+# Name: importLedger.py
+#
+# Purpose:
+# Remember which files have already been ingested from which card, so that putting the
+# same card back in only copies what is new.
+#
+# Each entry is keyed by (card id, path relative to the card root, size, mtime_ns) and
+# records where the file was copied to. A file is skipped on a re-run if its entry matches
+# and the copy is still where we put it.
+# The card id is the volume's file system UUID/ serial where we can get it, so the same
+# card is recognised whichever drive letter/ mount point it turns up on.
+#
+# Stored in an SQLite db in the user data dir. Run this file directly to look at it/ clear it:
+#   python importLedger.py stats
+#   python importLedger.py forget [card root ...]
+#
+
+# standard Python imports
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import threading
+
+
+def defaultLedgerPath():
+    '''
+    :return: the db file name in the per-user data dir for this platform
+    '''
+    if sys.platform.startswith('win'):
+        dataRoot = os.environ.get('APPDATA', os.path.expanduser('~/AppData/Roaming'))
+    elif sys.platform == 'darwin':
+        dataRoot = os.path.expanduser('~/Library/Application Support')
+    else:
+        dataRoot = os.environ.get('XDG_DATA_HOME', os.path.expanduser('~/.local/share'))
+    return os.path.join(dataRoot, 'PhotoTransfer', 'importLedger.sqlite')
+
+def _windowsVolumeSerial(mediaSource):
+    import ctypes
+    volume = ctypes.create_unicode_buffer(261)
+    if not ctypes.windll.kernel32.GetVolumePathNameW(os.path.abspath(mediaSource), volume, 261):
+        return None
+    serial = ctypes.c_uint32()
+    if not ctypes.windll.kernel32.GetVolumeInformationW(volume.value, None, 0, ctypes.byref(serial),
+                                                         None, None, None, 0):
+        return None
+    return 'vol-%08X' % serial.value
+
+def _linuxVolumeUUID(mediaSource):
+    # find the block device the source is on, and its entry in /dev/disk/by-uuid
+    dev = os.stat(mediaSource).st_dev
+    byUUID = '/dev/disk/by-uuid'
+    for uuid in os.listdir(byUUID):
+        try:
+            if os.stat(os.path.join(byUUID, uuid)).st_rdev == dev:
+                return 'uuid-' + uuid
+        except OSError:
+            pass
+    return None
+
+def cardIdentity(mediaSource):
+    '''
+    :return: a string identifying the card/ volume mediaSource is on. Falls back to the
+             source's absolute path when the volume can't be identified
+    '''
+    try:
+        if sys.platform.startswith('win'):
+            volumeId = _windowsVolumeSerial(mediaSource)
+        elif sys.platform.startswith('linux'):
+            volumeId = _linuxVolumeUUID(mediaSource)
+        else:
+            volumeId = None
+    except (OSError, AttributeError, ImportError):
+        volumeId = None
+
+    if volumeId is None:
+        return 'path-' + os.path.abspath(mediaSource)
+    # the same volume may be ingested from different sub folders - keep them apart
+    mountRoot = os.path.abspath(mediaSource)
+    while not os.path.ismount(mountRoot) and os.path.dirname(mountRoot) != mountRoot:
+        mountRoot = os.path.dirname(mountRoot)
+    return volumeId + ':' + os.path.relpath(os.path.abspath(mediaSource), mountRoot).replace(os.sep, '/')
+
+class importLedger():
+    def __init__(self, dbPath = None):
+        '''
+            open (and create if needed) the ledger db
+        '''
+        if dbPath is None:
+            dbPath = defaultLedgerPath()
+        if dbPath != ':memory:':
+            os.makedirs(os.path.dirname(dbPath), exist_ok = True)
+        self.dbPath = dbPath
+        # the pipeline checks from the scan thread and records from the main thread
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(dbPath, check_same_thread = False)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS imported (
+                            card TEXT NOT NULL,
+                            relpath TEXT NOT NULL,
+                            size INTEGER NOT NULL,
+                            mtime_ns INTEGER NOT NULL,
+                            dest TEXT NOT NULL,
+                            imported REAL NOT NULL,
+                            PRIMARY KEY (card, relpath, size, mtime_ns))''')
+        self.db.commit()
+
+    def __str__(self):
+        with self.lock:
+            files, cards = self.db.execute('SELECT COUNT(*), COUNT(DISTINCT card) FROM imported').fetchone()
+        return self.dbPath + '\t files:' + str(files) + '\t cards:' + str(cards)
+
+    def importedTo(self, card, relpath, size, mtimeNs):
+        '''
+        :return: where this file was copied to, or None if it hasn't been
+        '''
+        with self.lock:
+            row = self.db.execute('SELECT dest FROM imported WHERE card=? AND relpath=? AND size=? AND mtime_ns=?',
+                                  (card, relpath, size, mtimeNs)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def isImported(self, card, relpath, size, mtimeNs):
+        '''
+        :return: True if this file has been ingested before and its copy is still there
+        '''
+        dest = self.importedTo(card, relpath, size, mtimeNs)
+        return dest is not None and os.path.isfile(dest)
+
+    def recordMany(self, entries):
+        '''
+        :param entries: list of (card, relpath, size, mtimeNs, dest) for files just copied
+        '''
+        now = time.time()
+        with self.lock:
+            self.db.executemany('INSERT OR REPLACE INTO imported VALUES (?,?,?,?,?,?)',
+                                [tuple(e) + (now,) for e in entries])
+            self.db.commit()
+
+    def forget(self, card = None):
+        '''
+        :param card: a card id, or None for everything
+        :return: number of entries removed
+        '''
+        with self.lock:
+            if card is None:
+                cur = self.db.execute('DELETE FROM imported')
+            else:
+                cur = self.db.execute('DELETE FROM imported WHERE card=?', (card,))
+            self.db.commit()
+        return cur.rowcount
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description = "Inspect or clear the PhotoTransfer import ledger")
+    parser.add_argument('--db', help = "ledger file (default: %(default)s)", default = defaultLedgerPath())
+    sub = parser.add_subparsers(dest = 'command', required = True)
+    sub.add_parser('stats', help = "show the ledger location and size")
+    fgt = sub.add_parser('forget', help = "forget imports, so they are copied again")
+    fgt.add_argument('sources', nargs = '*', help = "card roots to forget. Default: everything")
+    args = parser.parse_args()
+
+    ledger = importLedger(args.db)
+    if args.command == 'stats':
+        print(ledger)
+    elif args.command == 'forget':
+        if args.sources:
+            removed = sum(ledger.forget(cardIdentity(s)) for s in args.sources)
+        else:
+            removed = ledger.forget()
+        print('Removed %d entries' % removed)
+    ledger.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+# Name: importManifest.py
+#
+# Purpose:
+# Checksums for copied media, so a card can be formatted knowing the copies are good.
+#   - the copy path hashes the data as it streams through, or reads each chunk back from the copy's
+#     page cache after an in-kernel copy (no second read of the card either way - see copyEngine)
+#   - each import writes a JSON manifest next to its day folders, listing every file copied
+#     with its size and hash
+#   - verify mode re-hashes a destination tree against its manifests, with parallel readers
+#
+# Hashes: xxh64 (needs https://pypi.org/project/xxhash/ - much faster), or blake2b (built in)
+#
+# Usage:
+#   python importManifest.py verify <manifest or destination root> [--workers N]
+#
+
+# specialised, non-standard lib imports:
+# xxhash is optional - blake2b is used without it
+try:
+    import xxhash
+except:
+    xxhash = None
+
+# standard Python imports
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+# manifest files are named MANIFEST_PREFIX + timestamp + MANIFEST_SUFFIX
+MANIFEST_PREFIX = "import-"
+MANIFEST_SUFFIX = ".manifest.json"
+
+# bytes per read when verifying
+VERIFY_CHUNK_BYTES = 8 * 1024 * 1024
+
+# parallel readers for verify
+VERIFY_WORKERS = 4
+
+HASH_ALGOS = ['xxh64', 'blake2b']
+
+
+def defaultAlgo():
+    '''
+    :return: the fastest hash available here
+    '''
+    if xxhash is not None:
+        return 'xxh64'
+    return 'blake2b'
+
+def newHasher(algo):
+    '''
+    :param algo: one of HASH_ALGOS
+    :return: a new hash object, with update() & hexdigest()
+    '''
+    if algo == 'xxh64':
+        if xxhash is None:
+            raise ValueError("xxh64 needs the xxhash module - use blake2b, or pip install xxhash")
+        return xxhash.xxh64()
+    elif algo == 'blake2b':
+        return hashlib.blake2b()
+    raise ValueError("Unknown hash " + str(algo) + ", use one of " + str(HASH_ALGOS))
+
+def updateFromFile(h, fileName, length = None):
+    '''
+    feed a hash object the first length bytes of a file (all of it for None)
+    '''
+    buf = bytearray(VERIFY_CHUNK_BYTES)
+    view = memoryview(buf)
+    with open(fileName, 'rb', buffering = 0) as f:
+        left = length
+        while left is None or left > 0:
+            n = f.readinto(view if left is None or left >= len(view) else view[:left])
+            if not n:
+                break
+            h.update(view[:n])
+            if left is not None:
+                left -= n
+
+def hashFile(fileName, algo):
+    '''
+    :return: hex digest of the whole file
+    '''
+    h = newHasher(algo)
+    updateFromFile(h, fileName)
+    return h.hexdigest()
+
+def writeManifest(destRoot, entries, algo, source = ""):
+    '''
+    write a manifest for the files copied to destRoot in this import
+    :param entries: list of (full destination path, size, hex digest, source path) tuples
+    :param source: the card/ folder the files came from
+    :return: the manifest file name, or None if there was nothing to write
+    '''
+    if not entries:
+        return None
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    manifestName = os.path.join(destRoot, MANIFEST_PREFIX + stamp + MANIFEST_SUFFIX)
+    # several imports in the same second
+    n = 1
+    while os.path.exists(manifestName):
+        manifestName = os.path.join(destRoot, MANIFEST_PREFIX + stamp + '-%d' % n + MANIFEST_SUFFIX)
+        n += 1
+
+    manifest = {'created': time.strftime("%Y-%m-%d %H:%M:%S"),
+                'source': source,
+                'hash': algo,
+                'files': [{'path': os.path.relpath(dest, destRoot).replace(os.sep, '/'),
+                           'size': size, 'hash': digest, 'source': src}
+                          for dest, size, digest, src in entries]}
+    with open(manifestName, 'w') as f:
+        json.dump(manifest, f, indent = 1)
+    return manifestName
+
+def readManifest(manifestName):
+    with open(manifestName) as f:
+        return json.load(f)
+
+def findManifests(destRoot):
+    '''
+    :return: all the manifest files directly in destRoot
+    '''
+    return sorted(os.path.join(destRoot, n) for n in os.listdir(destRoot)
+                  if n.startswith(MANIFEST_PREFIX) and n.endswith(MANIFEST_SUFFIX))
+
+def verifyManifest(manifestName, workers = VERIFY_WORKERS):
+    '''
+    re-hash every file in a manifest
+    :return: (number of files checked, list of (path, problem) for missing/ changed files)
+    '''
+    manifest = readManifest(manifestName)
+    destRoot = os.path.dirname(os.path.abspath(manifestName))
+    algo = manifest['hash']
+
+    def check(entry):
+        fileName = os.path.join(destRoot, entry['path'])
+        try:
+            if os.path.getsize(fileName) != entry['size']:
+                return (fileName, 'size differs')
+            if hashFile(fileName, algo) != entry['hash']:
+                return (fileName, 'hash differs')
+        except OSError as e:
+            return (fileName, str(e))
+        return None
+
+    # each reader works on a different file - the hashes release the GIL while they run
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        problems = [p for p in pool.map(check, manifest['files']) if p is not None]
+    return len(manifest['files']), problems
+
+def main():
+    parser = argparse.ArgumentParser(description = "Verify copied media against import manifests")
+    sub = parser.add_subparsers(dest = 'command', required = True)
+    ver = sub.add_parser('verify', help = "re-hash files and compare with their manifest")
+    ver.add_argument('target', help = "a manifest file, or a destination root holding manifests")
+    ver.add_argument('--workers', type = int, default = VERIFY_WORKERS, help = "parallel readers")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.target):
+        manifests = findManifests(args.target)
+    else:
+        manifests = [args.target]
+
+    checked = 0
+    problemCount = 0
+    start_time = time.time()
+    for m in manifests:
+        n, problems = verifyManifest(m, args.workers)
+        checked += n
+        problemCount += len(problems)
+        for fileName, problem in problems:
+            print(fileName + ': ' + problem)
+
+    print('Checked %d files in %d manifests, %d problems. Took %0.3f seconds' %
+          (checked, len(manifests), problemCount, time.time() - start_time))
+    sys.exit(1 if problemCount else 0)
+
+if __name__ == '__main__':
+    main()
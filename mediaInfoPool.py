@@ -0,0 +1,238 @@
+# Name: mediaInfoPool.py
+#
+# Purpose:
+# Run MediaInfo in a few long lived worker processes, instead of a new MediaInfo() per file
+# in the main program.
+#   - each worker opens the library once, set to its cheapest parse (ParseSpeed)
+#   - each file gets a timeout. A worker that hangs or dies on a corrupt clip is killed and
+#     restarted, and the file is retried, then given up on - the ingest carries on either way
+#   - probeMany(paths) spreads a batch over the workers
+# Only needed for clips videoProbe can't read itself.
+#
+
+# specialised, non-standard lib: MediaInfoDLL3 is only loaded when first needed (see _mediaInfoDLL),
+# and multiprocessing only when the pool starts - neither is paid for by runs that don't need MediaInfo
+
+# standard Python imports
+import time
+import atexit
+import threading
+
+# worker processes in the shared pool
+MI_WORKERS = 2
+
+# seconds one file may take before its worker is killed
+MI_TIMEOUT = 30.0
+
+# extra attempts after a timeout/ crash
+MI_RETRIES = 1
+
+# MediaInfo ParseSpeed option: 0 is the quickest (headers only), 1 reads the whole file
+MI_PARSE_SPEED = "0"
+
+# how the workers are started. Not fork: the pool is started from a program already running
+# copy & metadata threads, and a forked child can inherit a lock one of them was holding.
+# spawn where there's no forkserver (Windows)
+MI_START_METHODS = ["forkserver", "spawn"]
+
+# the MediaInfo General stream fields we hand back
+VIDEO_TAG_FIELDS = ["Encoded_Date", "File_Modified_Date", "Duration", "FrameRate"]
+
+
+# the MediaInfoDLL3 module once loaded (None if it isn't installed)
+_MediaInfoDLL3 = None
+_loadTried = False
+
+def _mediaInfoDLL():
+    '''
+    :return: the MediaInfoDLL3 module, imported on first use, or None if it can't be loaded
+    '''
+    global _MediaInfoDLL3, _loadTried
+    if not _loadTried:
+        try:
+            import MediaInfoDLL3
+            _MediaInfoDLL3 = MediaInfoDLL3
+        except:
+            _MediaInfoDLL3 = None
+        _loadTried = True
+    return _MediaInfoDLL3
+
+def available():
+    '''
+    :return: True if the MediaInfo library can be loaded
+    '''
+    return _mediaInfoDLL() is not None
+
+def _worker(conn, parseSpeed):
+    '''
+    worker process: one MediaInfo handle, reused for every file sent down conn
+    '''
+    MediaInfoDLL3 = _mediaInfoDLL()
+    MI = MediaInfoDLL3.MediaInfo()
+    MI.Option("ParseSpeed", parseSpeed)
+    while True:
+        try:
+            srcname = conn.recv()
+        except EOFError:
+            return
+        if srcname is None:
+            return
+        try:
+            MI.Open(srcname)
+            tags = {}
+            for field in VIDEO_TAG_FIELDS:
+                tags[field] = MI.Get(MediaInfoDLL3.Stream.General, 0, field)
+            MI.Close()
+            conn.send(tags)
+        except Exception as e:
+            conn.send(e)
+
+def _startContext():
+    '''
+    :return: the multiprocessing context for the workers - the first of MI_START_METHODS there is
+    '''
+    import multiprocessing
+    methods = multiprocessing.get_all_start_methods()
+    for method in MI_START_METHODS:
+        if method in methods:
+            return multiprocessing.get_context(method)
+    return multiprocessing.get_context()
+
+class _workerProcess():
+    def __init__(self, parseSpeed):
+        context = _startContext()
+        self.conn, childConn = context.Pipe()
+        self.process = context.Process(target = _worker, args = (childConn, parseSpeed), daemon = True)
+        self.process.start()
+        childConn.close()
+        # the job this worker is on: (index into the batch, deadline)
+        self.job = None
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+class mediaInfoPool():
+    def __init__(self, workers = MI_WORKERS, timeout = MI_TIMEOUT, retries = MI_RETRIES,
+                 parseSpeed = MI_PARSE_SPEED):
+        '''
+            start the MediaInfo worker processes
+            :param timeout: seconds per file before its worker is killed
+            :param retries: extra attempts per file after a timeout or crash
+        '''
+        if not available():
+            raise RuntimeError("MediaInfo library not found")
+        self.timeout = timeout
+        self.retries = retries
+        self.parseSpeed = parseSpeed
+        self.workers = [_workerProcess(parseSpeed) for i in range(workers)]
+        # one batch at a time - callers in different threads take turns
+        self.lock = threading.Lock()
+        # files given up on, and why
+        self.failures = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for w in self.workers:
+            w.stop()
+        self.workers = []
+
+    def restart(self, w):
+        '''
+        replace a hung/ dead worker with a fresh one
+        '''
+        w.kill()
+        fresh = _workerProcess(self.parseSpeed)
+        self.workers[self.workers.index(w)] = fresh
+        return fresh
+
+    def probeMany(self, paths):
+        '''
+        get the General tags for a batch of files, spread over the workers
+        :return: list of tag dicts in the same order as paths, None for files that failed/ timed out
+        '''
+        with self.lock:
+            return self._probeMany(paths)
+
+    def _probeMany(self, paths):
+        from multiprocessing.connection import wait
+        results = [None] * len(paths)
+        attempts = [0] * len(paths)
+        todo = list(range(len(paths)))
+        todo.reverse()
+
+        while todo or any(w.job is not None for w in self.workers):
+            # give every idle worker a file
+            for w in self.workers:
+                if w.job is None and todo:
+                    i = todo.pop()
+                    attempts[i] += 1
+                    w.job = (i, time.monotonic() + self.timeout)
+                    w.conn.send(paths[i])
+
+            busy = [w for w in self.workers if w.job is not None]
+            nextDeadline = min(w.job[1] for w in busy)
+            ready = wait([w.conn for w in busy], max(0, nextDeadline - time.monotonic()))
+
+            for w in list(busy):
+                i, deadline = w.job
+                if w.conn in ready:
+                    try:
+                        result = w.conn.recv()
+                    except EOFError:
+                        # the worker died (eg MediaInfo crashed on the file)
+                        result = None
+                        w = self.restart(w)
+                    w.job = None
+                    if isinstance(result, dict):
+                        results[i] = result
+                        continue
+                    problem = 'worker crashed' if result is None else str(result)
+                elif time.monotonic() >= deadline:
+                    w = self.restart(w)
+                    w.job = None
+                    problem = 'timed out after %0.0fs' % self.timeout
+                else:
+                    continue
+
+                if attempts[i] <= self.retries:
+                    todo.append(i)
+                else:
+                    print("MediaInfo couldn't read " + paths[i] + ": " + problem)
+                    self.failures.append((paths[i], problem))
+
+        return results
+
+# one pool per program run, started on first use
+_sharedPool = None
+_sharedLock = threading.Lock()
+
+def getPool():
+    '''
+    :return: the shared mediaInfoPool, or None if MediaInfo isn't installed
+    '''
+    global _sharedPool
+    if not available():
+        return None
+    with _sharedLock:
+        if _sharedPool is None:
+            _sharedPool = mediaInfoPool()
+            atexit.register(_sharedPool.close)
+    return _sharedPool
@@ -0,0 +1,239 @@
+# Name: metaCache.py
+#
+# Purpose:
+# Remember the raw metadata tags read from each media file, so that re-running over
+# the same card/ folder (eg after a failed copy) doesn't parse every file again.
+#
+# Stored in an SQLite db in the user cache dir, keyed by (absolute path, size, mtime_ns)
+# so any change to a file makes its old entry miss.
+# Least recently used entries are evicted once the cache holds more than MAX_ENTRIES.
+#
+# Run this file directly to look at or invalidate the cache:
+#   python metaCache.py stats
+#   python metaCache.py invalidate [path ...]
+#
+
+# standard Python imports
+import os
+import sys
+import time
+import json
+import sqlite3
+import argparse
+import threading
+
+# max number of files remembered. Each row is ~200 bytes
+MAX_ENTRIES = 500000
+
+# how many stores between eviction checks
+EVICT_EVERY = 1000
+
+# set to False to always parse files
+USE_META_CACHE = True
+
+
+def defaultCachePath():
+    '''
+    :return: the db file name in the per-user cache dir for this platform
+    '''
+    if sys.platform.startswith('win'):
+        cacheRoot = os.environ.get('LOCALAPPDATA', os.path.expanduser('~/AppData/Local'))
+    elif sys.platform == 'darwin':
+        cacheRoot = os.path.expanduser('~/Library/Caches')
+    else:
+        cacheRoot = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+    return os.path.join(cacheRoot, 'PhotoTransfer', 'metaCache.sqlite')
+
+def fileKey(srcname, size = None, mtimeNs = None):
+    '''
+    :param size, mtimeNs: the file's stat info, if the caller already has it (eg from a DirEntry)
+    :return: the cache key (abs path, size, mtime_ns) for a file
+    '''
+    if size is None or mtimeNs is None:
+        statbuf = os.stat(srcname)
+        size, mtimeNs = statbuf.st_size, statbuf.st_mtime_ns
+    return (os.path.abspath(srcname), size, mtimeNs)
+
+class metaCache():
+    def __init__(self, dbPath = None, maxEntries = MAX_ENTRIES):
+        '''
+            open (and create if needed) the cache db
+        '''
+        if dbPath is None:
+            dbPath = defaultCachePath()
+        if dbPath != ':memory:':
+            os.makedirs(os.path.dirname(dbPath), exist_ok = True)
+        self.dbPath = dbPath
+        self.maxEntries = maxEntries
+        self.hits = 0
+        self.misses = 0
+        # eviction scans the table, so only do it every EVICT_EVERY new entries
+        self.storedSinceEvict = 0
+        # lookups can come from the metadata worker threads
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(dbPath, check_same_thread = False)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS tags (
+                            path TEXT NOT NULL,
+                            size INTEGER NOT NULL,
+                            mtime_ns INTEGER NOT NULL,
+                            tags TEXT NOT NULL,
+                            last_used REAL NOT NULL,
+                            PRIMARY KEY (path, size, mtime_ns))''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS tags_last_used ON tags (last_used)')
+        self.db.commit()
+
+    def __str__(self):
+        return self.dbPath + '\t entries:' + str(self.count()) + '\t hits:' + str(self.hits) + \
+            '\t misses:' + str(self.misses)
+
+    def lookupMany(self, keys):
+        '''
+        :param keys: list of keys from fileKey()
+        :return: list of the tags dicts stored for each key, None where there is no entry
+        '''
+        results = []
+        now = time.time()
+        with self.lock:
+            for key in keys:
+                row = self.db.execute('SELECT tags FROM tags WHERE path=? AND size=? AND mtime_ns=?',
+                                      key).fetchone()
+                if row is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    results.append(json.loads(row[0]))
+            # one transaction for the whole batch of LRU updates
+            self.db.executemany('UPDATE tags SET last_used=? WHERE path=? AND size=? AND mtime_ns=?',
+                                [(now,) + tuple(k) for k, r in zip(keys, results) if r is not None])
+            self.db.commit()
+        return results
+
+    def lookup(self, key):
+        '''
+        :param key: from fileKey()
+        :return: the tags dict stored for key, or None
+        '''
+        return self.lookupMany([key])[0]
+
+    def storeMany(self, items):
+        '''
+        add/ replace a batch of entries, then evict if the cache is over size
+        :param items: list of (key, tags dict) tuples
+        '''
+        now = time.time()
+        with self.lock:
+            # a file that changed leaves a stale row behind under its old size/ mtime
+            self.db.executemany('DELETE FROM tags WHERE path=?', [(k[0],) for k, t in items])
+            self.db.executemany('INSERT OR REPLACE INTO tags VALUES (?,?,?,?,?)',
+                                [tuple(k) + (json.dumps(t), now) for k, t in items])
+            self.db.commit()
+        self.storedSinceEvict += len(items)
+        if self.storedSinceEvict >= EVICT_EVERY:
+            self.evict()
+
+    def store(self, key, tags):
+        self.storeMany([(key, tags)])
+
+    def count(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM tags').fetchone()[0]
+
+    def evict(self, maxEntries = None):
+        '''
+        drop the least recently used entries until at most maxEntries remain
+        :return: number of entries removed
+        '''
+        if maxEntries is None:
+            maxEntries = self.maxEntries
+        with self.lock:
+            cur = self.db.execute('''DELETE FROM tags WHERE rowid IN
+                                     (SELECT rowid FROM tags ORDER BY last_used DESC LIMIT -1 OFFSET ?)''',
+                                  (maxEntries,))
+            self.db.commit()
+        self.storedSinceEvict = 0
+        return cur.rowcount
+
+    def invalidate(self, path = None):
+        '''
+        forget cached tags
+        :param path: a file, or a dir (everything under it is dropped). None clears the whole cache
+        :return: number of entries removed
+        '''
+        with self.lock:
+            if path is None:
+                cur = self.db.execute('DELETE FROM tags')
+            else:
+                path = os.path.abspath(path)
+                prefix = path.rstrip(os.sep) + os.sep
+                # plain string compare rather than LIKE, so _ and % in names are safe
+                cur = self.db.execute('DELETE FROM tags WHERE path=? OR substr(path, 1, ?)=?',
+                                      (path, len(prefix), prefix))
+            self.db.commit()
+        return cur.rowcount
+
+    def close(self):
+        if self.storedSinceEvict:
+            self.evict()
+        with self.lock:
+            self.db.close()
+
+# one cache per program run, opened on first use
+_sharedCache = None
+
+def getCache():
+    '''
+    :return: the shared metaCache, or None if caching is off or the db can't be opened
+    '''
+    global _sharedCache, USE_META_CACHE
+    if not USE_META_CACHE:
+        return None
+    if _sharedCache is None:
+        try:
+            _sharedCache = metaCache()
+        except (OSError, sqlite3.Error) as e:
+            print("Metadata cache unavailable (" + str(e) + "), parsing all files")
+            USE_META_CACHE = False
+            return None
+    return _sharedCache
+
+def cachedRead(srcname, readFunc, cache = None):
+    '''
+    get the tags for srcname from the cache, else via readFunc(srcname), and remember them
+    :param readFunc: function returning a tags dict for a file
+    :param cache: a metaCache, defaults to the shared one
+    '''
+    if cache is None:
+        cache = getCache()
+    if cache is None:
+        return readFunc(srcname)
+
+    key = fileKey(srcname)
+    tags = cache.lookup(key)
+    if tags is None:
+        tags = readFunc(srcname)
+        cache.store(key, tags)
+    return tags
+
+def main():
+    parser = argparse.ArgumentParser(description = "Inspect or clear the PhotoTransfer metadata cache")
+    parser.add_argument('--db', help = "cache file (default: %(default)s)", default = defaultCachePath())
+    sub = parser.add_subparsers(dest = 'command', required = True)
+    sub.add_parser('stats', help = "show the cache location and size")
+    inv = sub.add_parser('invalidate', help = "forget cached tags")
+    inv.add_argument('paths', nargs = '*', help = "files or dirs to forget. Default: everything")
+    args = parser.parse_args()
+
+    cache = metaCache(args.db)
+    if args.command == 'stats':
+        print(cache)
+    elif args.command == 'invalidate':
+        if args.paths:
+            removed = sum(cache.invalidate(p) for p in args.paths)
+        else:
+            removed = cache.invalidate()
+        print('Removed %d entries' % removed)
+    cache.close()
+
+if __name__ == '__main__':
+    main()
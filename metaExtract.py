@@ -0,0 +1,240 @@
+# Name: metaExtract.py
+#
+# Purpose:
+# Pull the raw date/time tags out of media files, one file at a time or fanned out
+# over a pool of workers.
+#   stills: exifFast (falling back to exifread), in a thread pool (it is mostly waiting on card I/O)
+#   video:  videoProbe in the same thread pool. Anything it can't read goes to MediaInfo,
+#           in the mediaInfoPool worker processes (a MediaInfo parse is CPU bound, and one bad
+#           file can't take the main program down with it)
+#
+# Only the raw tag strings are returned here. Turning them into names, dates and
+# FPS suffixes stays with mediaItem.updateMediaTags() in Rename&TransferMedia.py
+#
+
+# standard Python imports
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+# local modules
+import metaCache
+import exifFast
+import videoProbe
+import mediaInfoPool
+import runMetrics
+
+# default number of workers for each pool. Card readers don't gain much past this
+META_WORKERS = 8
+
+
+def readStillTags(srcname, preview = False):
+    '''
+    get the raw EXIF DateTimeOriginal from a still image
+    Tries the exifFast IFD walk first, and only calls on exifread if that can't read the file
+    :param srcname: fully qualified file name
+    :param preview: for RAWs (exifFast.hasPreview), also find where their embedded JPEG preview is
+    :return: dict with 'DateTimeOriginal' - the exif string, or "" if it couldn't be read,
+             and 'SubSecTimeOriginal' ("" if not there). With preview, and a RAW, 'Preview' too:
+             [offset, length], or None if it hasn't got one
+    '''
+    preview = preview and exifFast.hasPreview(srcname)
+    fast = exifFast.readStillInfo(srcname, preview)
+    if fast is not None:
+        tags = {'DateTimeOriginal': fast[0], 'SubSecTimeOriginal': fast[1]}
+        if preview:
+            tags['Preview'] = list(fast[2]) if fast[2] else None
+        return tags
+
+    runMetrics.getMetrics().count('exifreadFallback')
+    exifread = exifFast.loadExifread()
+    tags = {}
+    if exifread is not None:
+        try:
+            with open(srcname, 'rb') as f:
+                tags = exifread.process_file(f, stop_tag='EXIF SubSecTimeOriginal', details=False)
+        except Exception:
+            # the caller falls back to the mod time
+            pass
+
+    tags = {'DateTimeOriginal': str(tags.get('EXIF DateTimeOriginal', "")),
+            'SubSecTimeOriginal': str(tags.get('EXIF SubSecTimeOriginal', ""))}
+    if preview:
+        location = exifFast.findPreview(srcname)
+        tags['Preview'] = list(location) if location else None
+    return tags
+
+def readVideoTags(srcname):
+    '''
+    get the raw MediaInfo General stream tags for a video file
+    The container headers are read directly by videoProbe where possible, MediaInfo is only
+    needed (and only has to be installed) for files it can't handle
+    :param srcname: fully qualified file name
+    :return: dict of mediaInfoPool.VIDEO_TAG_FIELDS, as the strings MediaInfo returns them ("" if missing)
+    '''
+    tags = videoProbe.probeVideo(srcname)
+    if tags is not None:
+        return tags
+
+    runMetrics.getMetrics().count('mediaInfoFallback')
+    pool = mediaInfoPool.getPool()
+    if pool is None:
+        raise RuntimeError("Can't read " + srcname + " without the MediaInfo library")
+    tags = pool.probeMany([srcname])[0]
+    if tags is None:
+        raise RuntimeError("MediaInfo couldn't read " + srcname)
+    return tags
+
+def readMediaTags(srcname, StillVideo, preview = False):
+    '''
+    get the raw tags for one file
+    :param StillVideo: 'S' or 'V', as in mediaItem
+    :param preview: find RAW previews too (see readStillTags)
+    :return: dict of tags, or None for unknown media types
+    '''
+    if StillVideo == 'S':
+        return readStillTags(srcname, preview)
+    elif StillVideo == 'V':
+        return readVideoTags(srcname)
+    return None
+
+def readMediaTagsCached(srcname, StillVideo):
+    '''
+    as readMediaTags(), but via the metadata cache
+    '''
+    if StillVideo == 'S':
+        return metaCache.cachedRead(srcname, readStillTags)
+    elif StillVideo == 'V':
+        return metaCache.cachedRead(srcname, readVideoTags)
+    return None
+
+def _readFast(job, preview = False):
+    '''
+    the in-process part of reading a (srcname, StillVideo) job: stills, and the video containers
+    videoProbe understands
+    :return: tags dict, or None (video left for MediaInfo, or the file can't be opened)
+    '''
+    srcname, StillVideo = job
+    try:
+        if StillVideo == 'S':
+            return readStillTags(srcname, preview)
+        elif StillVideo == 'V':
+            return videoProbe.probeVideo(srcname)
+    except OSError as e:
+        print("Couldn't read " + srcname + ": " + str(e))
+    return None
+
+def _readFastTimed(job, preview = False):
+    '''
+    _readFast() in a pool thread, recording its latency & CPU in the run metrics
+    '''
+    with runMetrics.getMetrics().timeFile('metadata', workerCpu = True):
+        return _readFast(job, preview)
+
+class tagExtractor():
+    def __init__(self, workers = META_WORKERS, serial = False, useCache = True, previews = False):
+        '''
+            reads tags for batches of files, keeping its worker pool open between batches
+            (so a streaming caller doesn't pay for a new pool on every batch)
+            :param workers: max number of reader threads
+            :param serial: do everything in the calling thread, in order. Simpler to debug/ profile
+            :param useCache: get unchanged files from the metadata cache, and add newly read ones
+            :param previews: find where RAWs keep their JPEG preview, in the same walk (see readStillTags)
+        '''
+        self.workers = workers
+        self.serial = serial or workers <= 1
+        self.previews = previews
+        self.cache = None
+        if useCache:
+            self.cache = metaCache.getCache()
+        # started when there is work for it
+        self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def extract(self, jobs):
+        '''
+        get the raw tags for a batch of files
+        :param jobs: list of (srcname, StillVideo) tuples, or (srcname, StillVideo, size, mtimeNs) if the
+                caller already has the file's stat info
+        :return: a list of tag dicts, in the same order as jobs. None for files that couldn't be read
+        '''
+        if self.cache is None:
+            return self._read([j[:2] for j in jobs])
+
+        keys = [metaCache.fileKey(*j[0:1] + j[2:4]) for j in jobs]
+        results = self.cache.lookupMany(keys)
+
+        # only parse the files the cache doesn't know about - or RAWs cached without their preview
+        missIdx = [i for i, tags in enumerate(results) if (tags is None and jobs[i][1] in ('S', 'V')) or
+                   (tags is not None and self.previews and 'Preview' not in tags and jobs[i][1] == 'S' and
+                    exifFast.hasPreview(jobs[i][0]))]
+        metrics = runMetrics.getMetrics()
+        metrics.count('metaCacheHits', len(jobs) - len(missIdx))
+        metrics.count('metaCacheMisses', len(missIdx))
+        if missIdx:
+            missTags = self._read([jobs[i][:2] for i in missIdx])
+            for i, tags in zip(missIdx, missTags):
+                # (a RAW that can't be read again keeps its cached tags)
+                if tags is not None:
+                    results[i] = tags
+            self.cache.storeMany([(keys[i], results[i]) for i in missIdx if results[i] is not None])
+
+        return results
+
+    def _read(self, jobs):
+        '''
+        parse a batch of (srcname, StillVideo) files, without the cache
+        '''
+        results = [None] * len(jobs)
+
+        if self.serial:
+            metrics = runMetrics.getMetrics()
+            for i, (srcname, StillVideo) in enumerate(jobs):
+                try:
+                    with metrics.timeFile('metadata'):
+                        results[i] = readMediaTags(srcname, StillVideo, self.previews)
+                except RuntimeError as e:
+                    # no MediaInfo, or it couldn't make sense of the file
+                    print(str(e))
+                except OSError as e:
+                    # as in _readFast: this file is left out, the rest carry on
+                    print("Couldn't read " + srcname + ": " + str(e))
+            return results
+
+        # map() hands the results back in submission order, so the merge is deterministic
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers = self.workers)
+        for i, tags in enumerate(self.pool.map(functools.partial(_readFastTimed, preview = self.previews), jobs)):
+            results[i] = tags
+
+        # MediaInfo for the clips videoProbe couldn't read, in its worker processes
+        leftIdx = [i for i, j in enumerate(jobs) if j[1] == 'V' and results[i] is None]
+        if leftIdx:
+            runMetrics.getMetrics().count('mediaInfoFallback', len(leftIdx))
+            pool = mediaInfoPool.getPool()
+            if pool is None:
+                for i in leftIdx:
+                    print("Can't read " + jobs[i][0] + " without the MediaInfo library")
+            else:
+                for i, tags in zip(leftIdx, pool.probeMany([jobs[i][0] for i in leftIdx])):
+                    results[i] = tags
+
+        return results
+
+def extractMediaTags(jobs, workers = META_WORKERS, serial = False, useCache = True):
+    '''
+    get the raw tags for many files at once, via a tagExtractor
+    :param jobs: list of (srcname, StillVideo) tuples, or (srcname, StillVideo, size, mtimeNs)
+    :return: a list of tag dicts, in the same order as jobs. None for files that couldn't be read
+    '''
+    with tagExtractor(workers, serial, useCache) as extractor:
+        return extractor.extract(jobs)
@@ -0,0 +1,303 @@
+# Name: renameEngine.py
+#
+# Purpose:
+# Rename a whole folder's worth of files in one go, safely.
+#   - plan: take every (old name, new name) pair at once, and order them so no rename lands on a
+#     name another file still has to move away from. Chains (a -> b, b -> c) are done from the
+#     end, cycles (a -> b, b -> a: eg re-running over files already renamed) cost one temporary
+#     move each. A new name taken by a file outside the plan is a conflict - that pair is left alone
+#   - apply: renames go through a descriptor on the folder (renameat), not full paths
+#   - journal: the plan is written to the folder before the first rename, and each rename is
+#     logged as it's done. An interrupted run can then be rolled forward (finish the plan) or
+#     back (undo it) straight from the journal, without reading any metadata again
+#
+# Usage:
+#   python renameEngine.py forward <folder>     finish an interrupted rename
+#   python renameEngine.py back <folder>        undo it
+#
+
+# standard Python imports
+import os
+import sys
+import json
+import argparse
+
+# the journal, in the folder being renamed
+JOURNAL_NAME = ".ptrename-journal"
+
+# names for files moved out of the way to break a cycle: TEMP_PREFIX + n + '-' + old name
+TEMP_PREFIX = ".ptrename-"
+
+
+class renamePlan():
+    def __init__(self):
+        self.ops = []           # (from name, to name) in the order they must be done
+        self.conflicts = []     # (old name, new name, reason) pairs left out
+        self.unchanged = 0      # pairs already named right
+
+def planRenames(pairs, existing):
+    '''
+    work out the order to rename a folder in
+    :param pairs: (old name, new name) list - names only, all in the same folder
+    :param existing: every name in the folder now (eg from its DirEntries)
+    :return: a renamePlan
+    '''
+    plan = renamePlan()
+    existing = set(existing)
+    moves = {}          # old -> new
+    targets = {}        # new -> old
+    for old, new in pairs:
+        if old == new:
+            plan.unchanged += 1
+        elif new in targets:
+            plan.conflicts.append((old, new, 'same new name as ' + targets[new]))
+        else:
+            moves[old] = new
+            targets[new] = old
+
+    # a new name held by a file that isn't moving can't be used - and then that pair's old name
+    # stays put too, which can block another pair, and so on
+    blocked = [old for old, new in moves.items() if new in existing and new not in moves]
+    while blocked:
+        old = blocked.pop()
+        new = moves.pop(old)
+        del targets[new]
+        plan.conflicts.append((old, new, 'already exists'))
+        if old in targets:
+            blocked.append(targets[old])
+
+    # a rename can go as soon as nothing is left on its new name
+    ready = [old for old, new in moves.items() if new not in moves]
+    tempCount = 0
+    while moves:
+        while ready:
+            old = ready.pop()
+            new = moves.pop(old)
+            plan.ops.append((old, new))
+            # old is free now - whoever wanted it can go
+            if old in targets:
+                waiting = targets.pop(old)
+                if waiting in moves:
+                    ready.append(waiting)
+        if not moves:
+            break
+        # everything left is in cycles: move one file aside, unwind the cycle, then put it in place
+        old = next(iter(moves))
+        temp = TEMP_PREFIX + str(tempCount) + '-' + old
+        while temp in existing:
+            tempCount += 1
+            temp = TEMP_PREFIX + str(tempCount) + '-' + old
+        tempCount += 1
+        plan.ops.append((old, temp))
+        new = moves.pop(old)
+        moves[temp] = new
+        targets[new] = temp
+        if old in targets:
+            ready.append(targets.pop(old))
+    return plan
+
+#
+# the journal
+#
+def _writeJournalHeader(dirName, ops):
+    journal = open(os.path.join(dirName, JOURNAL_NAME), 'w')
+    journal.write(json.dumps({'ops': ops}) + '\n')
+    journal.flush()
+    os.fsync(journal.fileno())
+    return journal
+
+def readJournal(dirName):
+    '''
+    :return: (ops, set of the op indexes logged as done), or None if there's no journal
+    '''
+    try:
+        with open(os.path.join(dirName, JOURNAL_NAME)) as f:
+            lines = f.read().split('\n')
+    except FileNotFoundError:
+        return None
+    ops = [tuple(op) for op in json.loads(lines[0])['ops']]
+    done = set()
+    for line in lines[1:]:
+        # the last line may be cut short
+        if line.strip().isdigit():
+            done.add(int(line))
+    return ops, done
+
+def pendingJournal(dirName):
+    '''
+    :return: True if a rename of dirName was interrupted
+    '''
+    return os.path.exists(os.path.join(dirName, JOURNAL_NAME))
+
+#
+# applying
+#
+def _openDir(dirName):
+    '''
+    :return: a descriptor on dirName for renameat, or None where that isn't supported (Windows)
+    '''
+    if os.rename not in os.supports_dir_fd:
+        return None
+    return os.open(dirName, os.O_RDONLY)
+
+def _rename(dirName, dirFd, src, dst):
+    if dirFd is None:
+        os.rename(os.path.join(dirName, src), os.path.join(dirName, dst))
+    else:
+        os.rename(src, dst, src_dir_fd = dirFd, dst_dir_fd = dirFd)
+
+def _exists(dirName, dirFd, name):
+    try:
+        if dirFd is None:
+            os.stat(os.path.join(dirName, name))
+        else:
+            os.stat(name, dir_fd = dirFd)
+        return True
+    except FileNotFoundError:
+        return False
+
+def _runOps(dirName, ops, todo, journal):
+    '''
+    do the ops with indexes in todo, in order, logging each one to the journal
+    A failed op leaves its file where it is, so any later op onto that name is skipped (not overwritten)
+    :return: (number done, list of (from, to, error))
+    '''
+    dirFd = _openDir(dirName)
+    count = 0
+    errors = []
+    stuck = set()
+    try:
+        for i in todo:
+            src, dst = ops[i]
+            if dst in stuck:
+                errors.append((src, dst, dst + " couldn't be moved out of the way"))
+                stuck.add(src)
+                continue
+            try:
+                _rename(dirName, dirFd, src, dst)
+            except OSError as e:
+                errors.append((src, dst, str(e)))
+                stuck.add(src)
+                continue
+            journal.write('%d\n' % i)
+            journal.flush()
+            count += 1
+    finally:
+        if dirFd is not None:
+            os.close(dirFd)
+    return count, errors
+
+def _finish(dirName, journal, errors):
+    # the journal is only kept when something still needs sorting out
+    journal.close()
+    if not errors:
+        os.remove(os.path.join(dirName, JOURNAL_NAME))
+
+def applyPlan(dirName, plan):
+    '''
+    do a plan's renames in dirName, with a journal
+    :return: (number of renames done, list of (from, to, error)). If there were errors the journal
+             is kept, for recover() to finish or undo the rest
+    '''
+    if not plan.ops:
+        return 0, []
+    if pendingJournal(dirName):
+        raise RuntimeError("An earlier rename of " + dirName + " was interrupted - recover it first")
+    journal = _writeJournalHeader(dirName, plan.ops)
+    count, errors = _runOps(dirName, plan.ops, range(len(plan.ops)), journal)
+    _finish(dirName, journal, errors)
+    return count, errors
+
+def recover(dirName, forward = True):
+    '''
+    finish (forward) or undo (back) an interrupted rename of dirName, from its journal
+    :return: (number of renames done, list of (from, to, error))
+    '''
+    state = readJournal(dirName)
+    if state is None:
+        return 0, []
+    ops, done = state
+
+    # the op after the last one logged may have happened just before the interruption
+    nextOp = max(done) + 1 if done else 0
+    if nextOp < len(ops):
+        dirFd = _openDir(dirName)
+        try:
+            src, dst = ops[nextOp]
+            if not _exists(dirName, dirFd, src) and _exists(dirName, dirFd, dst):
+                done.add(nextOp)
+        finally:
+            if dirFd is not None:
+                os.close(dirFd)
+
+    if forward:
+        journal = open(os.path.join(dirName, JOURNAL_NAME), 'a')
+        count, errors = _runOps(dirName, ops, [i for i in range(len(ops)) if i not in done], journal)
+    else:
+        # undo what was done, last first. The undo replaces the journal as a plan of its own,
+        # so an interrupted undo can be recovered in turn
+        undo = [(ops[i][1], ops[i][0]) for i in sorted(done, reverse = True)]
+        journal = _writeJournalHeader(dirName, undo)
+        count, errors = _runOps(dirName, undo, range(len(undo)), journal)
+    _finish(dirName, journal, errors)
+    return count, errors
+
+def printErrors(errors):
+    for src, dst, error in errors:
+        print("Oh no. Rename " + src + " to " + dst + " failed: " + error)
+
+def renameFolder(dirName, pairs, existing):
+    '''
+    plan & apply the renames for a folder, printing a summary
+    :param pairs, existing: as for planRenames
+    :return: (number renamed, number of errors - failed renames & conflicts)
+    '''
+    plan = planRenames(pairs, existing)
+    for old, new, reason in plan.conflicts:
+        print("Not renaming " + old + " to " + new + ": " + reason)
+    count, errors = applyPlan(dirName, plan)
+    printErrors(errors)
+    if errors:
+        print("The rename journal was kept: python renameEngine.py forward|back " + dirName)
+
+    tempMoves = sum(1 for src, dst in plan.ops if dst.startswith(TEMP_PREFIX))
+    print('%d renamed, %d already named%s' % (count - tempMoves, plan.unchanged,
+                                              ', %d cycles broken' % tempMoves if tempMoves else ''))
+    return count - tempMoves, len(errors) + len(plan.conflicts)
+
+def recoverFolder(dirName, forward = True):
+    '''
+    recover an interrupted rename of dirName, if there is one, printing a summary
+    :return: True if there was one to recover
+    '''
+    if not pendingJournal(dirName):
+        return False
+    print("An earlier rename of " + dirName + " was interrupted - " + ("finishing" if forward else "undoing") + " it")
+    count, errors = recover(dirName, forward)
+    printErrors(errors)
+    print('%d files renamed, %d errors' % (count, len(errors)))
+    return True
+
+def recoverBeforeRename(dirName):
+    '''
+    finish an interrupted rename of dirName, if there is one, before the folder is renamed again
+    :return: True if it can be renamed - False if the interrupted rename couldn't be finished (its journal is kept)
+    '''
+    if recoverFolder(dirName) and pendingJournal(dirName):
+        print("Not renaming " + dirName + " - sort out the errors above, and rerun")
+        return False
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description = "Recover an interrupted folder rename from its journal")
+    parser.add_argument('direction', choices = ['forward', 'back'], help = "finish the rename, or undo it")
+    parser.add_argument('folder')
+    args = parser.parse_args()
+
+    if not recoverFolder(args.folder, args.direction == 'forward'):
+        print('No interrupted rename in ' + args.folder)
+    # the journal is kept if anything is still wrong
+    sys.exit(1 if pendingJournal(args.folder) else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+# Name: runMetrics.py
+#
+# Purpose:
+# Timings and counters for one run (a card copy, or a folder rename), to find where a slow import went.
+#   - wall & CPU time per phase: scan, metadata, sequence, mkdir, copy (and rename)
+#   - per-file latency histograms for metadata reads and copies
+#   - bytes, files and MB/s per source/ destination device
+#   - counts of fallbacks (mod time instead of EXIF/ encoded date, exifread, MediaInfo, ...)
+# At the end of the run it all goes to a JSON report (in the user data dir by default).
+# Optionally the run can be profiled (cProfile, per thread, merged into one .prof file) and/ or
+# traced for memory (tracemalloc peak and top allocating lines, in the report).
+#
+# The stages and helper modules record into the shared run - getMetrics() - so nothing has to be
+# passed around. Phases in the ingest pipeline overlap (they run in their own threads), so their
+# wall times add up to more than the run.
+#
+# Usage:
+#   python -m pstats <report>.prof       to browse a profile
+#
+
+# standard Python imports
+import os
+import sys
+import json
+import time
+import threading
+
+# reports are named REPORT_PREFIX + run name + timestamp + REPORT_SUFFIX
+REPORT_PREFIX = "run-"
+REPORT_SUFFIX = ".report.json"
+
+# upper edges of the latency histogram buckets, in ms. The last bucket is everything slower
+LATENCY_BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# lines listed in the report's memory section
+MEMORY_TOP_LINES = 20
+
+
+def defaultReportDir():
+    '''
+    :return: the reports folder in the per-user data dir for this platform
+    '''
+    if sys.platform.startswith('win'):
+        dataRoot = os.environ.get('APPDATA', os.path.expanduser('~/AppData/Roaming'))
+    elif sys.platform == 'darwin':
+        dataRoot = os.path.expanduser('~/Library/Application Support')
+    else:
+        dataRoot = os.environ.get('XDG_DATA_HOME', os.path.expanduser('~/.local/share'))
+    return os.path.join(dataRoot, 'PhotoTransfer', 'reports')
+
+class _phaseTimer():
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.addPhase(self.name, time.perf_counter() - self.wall, time.thread_time() - self.cpu)
+
+class _fileTimer():
+    def __init__(self, metrics, kind, workerCpu):
+        self.metrics = metrics
+        self.kind = kind
+        self.workerCpu = workerCpu
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.addLatency(self.kind, time.perf_counter() - self.wall)
+        if self.workerCpu:
+            self.metrics.addPhase(self.kind, 0.0, time.thread_time() - self.cpu, calls = 0)
+
+class runMetrics():
+    def __init__(self, name = "run", profile = False, traceMemory = False):
+        '''
+            start collecting for a run
+            :param name: what sort of run (eg 'copy', 'renameStills'), used in the report name
+            :param profile: profile the run with cProfile (the calling thread, and threads started via profiled())
+            :param traceMemory: trace allocations with tracemalloc
+        '''
+        self.name = name
+        self.lock = threading.Lock()
+        self.started = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.startWall = time.perf_counter()
+        self.startCpu = time.process_time()
+        # phase: {'wall', 'cpu', 'calls'}
+        self.phases = {}
+        # kind: list of seconds per file
+        self.latencies = {}
+        # (st_dev, role): {'path', 'role', 'bytes', 'files', 'first', 'last'}
+        self.devices = {}
+        self.counts = {}
+
+        self.profiles = []
+        if profile:
+            # the profiler is only loaded when asked for, to keep startup quick
+            import cProfile
+            self.profiles.append(cProfile.Profile())
+            self.profiles[0].enable()
+        self.traceMemory = traceMemory
+        if traceMemory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    def phase(self, name):
+        '''
+        :return: a context manager timing its block as (part of) phase name, in the calling thread
+        '''
+        return _phaseTimer(self, name)
+
+    def addPhase(self, name, wall, cpu, calls = 1):
+        with self.lock:
+            p = self.phases.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+            p['wall'] += wall
+            p['cpu'] += cpu
+            p['calls'] += calls
+
+    def timeFile(self, kind, workerCpu = False):
+        '''
+        :return: a context manager recording its block as one file's latency for kind ('metadata', 'copy')
+        :param workerCpu: also add the block's CPU to phase kind - for work done in pool threads,
+                which the phase timer (in the stage's own thread) doesn't see
+        '''
+        return _fileTimer(self, kind, workerCpu)
+
+    def addLatency(self, kind, seconds):
+        with self.lock:
+            self.latencies.setdefault(kind, []).append(seconds)
+
+    def count(self, name, n = 1):
+        '''
+        add n to the counter name (eg 'stillModTime' for a still named from its mod time)
+        '''
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def transferred(self, device, path, role, nBytes, start, end):
+        '''
+        record a copy read from (role 'source') or written to (role 'dest') a device
+        :param device: st_dev of the device
+        :param path: a folder on the device, to name it in the report
+        :param start, end: time.perf_counter() when the copy started and finished
+        '''
+        with self.lock:
+            d = self.devices.get((device, role))
+            if d is None:
+                d = {'path': path, 'role': role, 'bytes': 0, 'files': 0, 'first': start, 'last': end}
+                self.devices[(device, role)] = d
+            d['bytes'] += nBytes
+            d['files'] += 1
+            d['first'] = min(d['first'], start)
+            d['last'] = max(d['last'], end)
+
+    def profiled(self, target):
+        '''
+        :return: target wrapped to run under its own profiler if this run is profiled
+                 (cProfile only sees the thread it was enabled in), else target itself
+        '''
+        if not self.profiles:
+            return target
+
+        def run(*args, **kwargs):
+            import cProfile
+            prof = cProfile.Profile()
+            with self.lock:
+                self.profiles.append(prof)
+            prof.enable()
+            try:
+                return target(*args, **kwargs)
+            finally:
+                prof.disable()
+        return run
+
+    def latencyStats(self, seconds):
+        '''
+        :return: dict of count, mean, percentiles & histogram (ms) for a list of latencies
+        '''
+        ms = sorted(s * 1000 for s in seconds)
+        n = len(ms)
+        if n == 0:
+            return {'count': 0}
+        buckets = {}
+        i = 0
+        for edge in LATENCY_BUCKETS_MS:
+            start = i
+            while i < n and ms[i] <= edge:
+                i += 1
+            buckets['<=%gms' % edge] = i - start
+        buckets['>%gms' % LATENCY_BUCKETS_MS[-1]] = n - i
+        return {'count': n, 'meanMs': sum(ms) / n,
+                'p50Ms': ms[n // 2], 'p90Ms': ms[int(n * 0.9)], 'p99Ms': ms[int(n * 0.99)], 'maxMs': ms[-1],
+                'buckets': buckets}
+
+    def report(self):
+        '''
+        :return: the run so far, as a JSON-able dict
+        '''
+        with self.lock:
+            devices = []
+            for (device, role), d in sorted(self.devices.items(), key = lambda kv: (kv[0][1], kv[0][0])):
+                elapsed = d['last'] - d['first']
+                devices.append({'device': device, 'path': d['path'], 'role': role, 'bytes': d['bytes'],
+                                'files': d['files'], 'MBps': d['bytes'] / 1e6 / elapsed if elapsed > 0 else 0.0})
+            return {'run': self.name,
+                    'started': self.started,
+                    'wall': time.perf_counter() - self.startWall,
+                    'cpu': time.process_time() - self.startCpu,
+                    'phases': {name: dict(p) for name, p in self.phases.items()},
+                    'latency': {kind: self.latencyStats(s) for kind, s in self.latencies.items()},
+                    'devices': devices,
+                    'counts': dict(self.counts)}
+
+    def finish(self, reportDir = None, extra = None):
+        '''
+        stop profiling/ tracing, and write the JSON report (and .prof file if profiling)
+        :param reportDir: folder for the report, default defaultReportDir()
+        :param extra: dict of anything else to put in the report (eg file & error counts)
+        :return: the report file name
+        '''
+        report = self.report()
+        report['finished'] = time.strftime("%Y-%m-%d %H:%M:%S")
+        report.update(extra or {})
+
+        reportDir = reportDir or defaultReportDir()
+        os.makedirs(reportDir, exist_ok = True)
+        stampName = os.path.join(reportDir, REPORT_PREFIX + self.name + '-' + time.strftime("%Y%m%d-%H%M%S"))
+        baseName = stampName
+        # several runs in the same second
+        n = 1
+        while os.path.exists(baseName + REPORT_SUFFIX):
+            baseName = stampName + '-%d' % n
+            n += 1
+
+        if self.profiles:
+            import pstats
+            self.profiles[0].disable()
+            stats = pstats.Stats(self.profiles[0])
+            for prof in self.profiles[1:]:
+                stats.add(prof)
+            stats.dump_stats(baseName + '.prof')
+            report['profile'] = baseName + '.prof'
+            self.profiles = []
+
+        if self.traceMemory:
+            import tracemalloc
+        if self.traceMemory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics('lineno')[:MEMORY_TOP_LINES]
+            tracemalloc.stop()
+            report['memory'] = {'currentBytes': current, 'peakBytes': peak,
+                                'top': [{'line': str(s.traceback[0]), 'bytes': s.size, 'blocks': s.count}
+                                        for s in top]}
+
+        with open(baseName + REPORT_SUFFIX, 'w') as f:
+            json.dump(report, f, indent = 1)
+        return baseName + REPORT_SUFFIX
+
+# the run being recorded. There is always one, so modules can record without checking
+_current = runMetrics()
+
+def getMetrics():
+    '''
+    :return: the shared runMetrics for the current run
+    '''
+    return _current
+
+def startRun(name, profile = False, traceMemory = False):
+    '''
+    start a new shared run, replacing the last one
+    :return: the new runMetrics
+    '''
+    global _current
+    _current = runMetrics(name, profile, traceMemory)
+    return _current
+
+def useRun(metrics):
+    '''
+    make an earlier run the shared one again - for an import that carries on after another has
+    started (eg two cards being watched, see the main script's copySession)
+    :return: metrics
+    '''
+    global _current
+    _current = metrics
+    return _current
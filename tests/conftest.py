@@ -0,0 +1,52 @@
+# Name: conftest.py
+#
+# Purpose:
+# Shared fixtures for the tests: the program's modules on the path, Rename&TransferMedia.py loaded
+# as a module, and the metadata cache, import ledger, transfer journal and run reports kept in a
+# temp folder instead of the user's own.
+#
+# Usage:
+#   python -m pytest -q
+#
+
+# standard Python imports
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+from benchmarks import loadMain
+
+
+@pytest.fixture(scope = 'session', autouse = True)
+def userDirs(tmp_path_factory):
+    '''
+    point the per-user cache & data folders at a temp folder for the whole run
+    '''
+    root = tmp_path_factory.mktemp('user')
+    patch = pytest.MonkeyPatch()
+    patch.setenv('XDG_CACHE_HOME', str(root / 'cache'))
+    patch.setenv('XDG_DATA_HOME', str(root / 'data'))
+    yield root
+    patch.undo()
+
+@pytest.fixture(scope = 'session')
+def main():
+    '''
+    :return: Rename&TransferMedia.py, loaded as a module
+    '''
+    return loadMain()
+
+@pytest.fixture
+def destRoots(tmp_path):
+    '''
+    :return: (stills root, video root) - empty folders, with the trailing / the pipeline expects
+    '''
+    roots = (os.path.join(str(tmp_path), 'P', ''), os.path.join(str(tmp_path), 'V', ''))
+    for root in roots:
+        os.makedirs(root)
+    return roots
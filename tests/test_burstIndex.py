@@ -0,0 +1,77 @@
+# Name: test_burstIndex.py
+#
+# Purpose:
+# Burst numbering (burstIndex, through nameStills): which shots are one burst, and their order in
+# it - sub-second time, then the file counter (across a wrap), then the path.
+#
+
+
+def still(main, folder, name, dateTime = "2016:05:04 09:00:00", subSec = "", prefix = ""):
+    item = main.mediaItem(folder, name)
+    item.updateMediaTags({'DateTimeOriginal': dateTime, 'SubSecTimeOriginal': subSec})
+    item.namePrefix = prefix
+    return item
+
+def names(items):
+    return sorted(item.newName for item in items)
+
+def testTwoCamerasInOneSecond(main):
+    # camera IDs: the names differ anyway, so neither shot is a burst
+    stills = [still(main, '/cardA/DCIM/100MSDCF/', 'DSC00001.JPG', prefix = 'A_'),
+              still(main, '/cardB/DCIM/100CANON/', 'IMG_0001.JPG', prefix = 'B_')]
+    assert main.nameStills(stills, '/archive/') == ['2016_05_04']
+    assert names(stills) == ['A_2016-05-04 09-00-00.JPG', 'B_2016-05-04 09-00-00.JPG']
+    assert [s.newPath for s in stills] == ['/archive/2016_05_04/'] * 2
+
+def testTwoCamerasInOneSecondNoIds(main):
+    # no IDs: they'd have the same name, so they are numbered - by path, as the counters are the same
+    stills = [still(main, '/cardB/DCIM/100CANON/', 'IMG_0001.JPG'),
+              still(main, '/cardA/DCIM/100MSDCF/', 'DSC00001.JPG')]
+    main.nameStills(stills, '/archive/')
+    assert {s.origPath: s.newName for s in stills} == {'/cardA/DCIM/100MSDCF/': '2016-05-04 09-00-00-00.JPG',
+                                                       '/cardB/DCIM/100CANON/': '2016-05-04 09-00-00-01.JPG'}
+
+def testBurstPerCamera(main):
+    stills = [still(main, '/cardA/', 'DSC00002.JPG', prefix = 'A_'),
+              still(main, '/cardA/', 'DSC00001.JPG', prefix = 'A_'),
+              still(main, '/cardB/', 'DSC00001.JPG', prefix = 'B_')]
+    main.nameStills(stills, '/archive/')
+    assert {(s.namePrefix, s.origName): s.seq for s in stills} == {('A_', 'DSC00001.JPG'): 0,
+                                                                   ('A_', 'DSC00002.JPG'): 1,
+                                                                   ('B_', 'DSC00001.JPG'): -1}
+
+def seqs(stills):
+    return {s.origName: s.seq for s in stills}
+
+def testSubSecOrder(main):
+    # the sub-second time wins over the counter - and "5" is half a second, after "45"
+    stills = [still(main, '/card/', 'DSC00001.JPG', subSec = '5'),
+              still(main, '/card/', 'DSC00002.JPG', subSec = '45'),
+              still(main, '/card/', 'DSC00003.JPG', subSec = '10')]
+    main.nameStills(stills, '/archive/')
+    assert seqs(stills) == {'DSC00003.JPG': 0, 'DSC00002.JPG': 1, 'DSC00001.JPG': 2}
+
+def testCounterWithoutEverySubSec(main):
+    # one shot has no sub-second time, so none of them are used
+    stills = [still(main, '/card/', 'DSC00002.JPG', subSec = '10'),
+              still(main, '/card/', 'DSC00001.JPG', subSec = '20'),
+              still(main, '/card/', 'DSC00003.JPG')]
+    main.nameStills(stills, '/archive/')
+    assert seqs(stills) == {'DSC00001.JPG': 0, 'DSC00002.JPG': 1, 'DSC00003.JPG': 2}
+
+def testCounterWrap(main):
+    # the counter rolled over 9999 -> 0001 in the burst
+    stills = [still(main, '/card/', name) for name in ['DSC00002.JPG', 'DSC09999.JPG', 'DSC00001.JPG', 'DSC09998.JPG']]
+    main.nameStills(stills, '/archive/')
+    assert seqs(stills) == {'DSC09998.JPG': 0, 'DSC09999.JPG': 1, 'DSC00001.JPG': 2, 'DSC00002.JPG': 3}
+
+def testPathLastAndFileTypesApart(main):
+    # same sub-second and counter: by path. The ARW of each pair is a burst of its own
+    stills = [still(main, '/cardB/', 'DSC00001.JPG', subSec = '10'),
+              still(main, '/cardA/', 'DSC00001.JPG', subSec = '10'),
+              still(main, '/cardA/', 'DSC00001.ARW', subSec = '10')]
+    main.nameStills(stills, '/archive/')
+    assert {s.origPath + s.origName: s.newName for s in stills} == {
+        '/cardA/DSC00001.JPG': '2016-05-04 09-00-00-00.JPG',
+        '/cardB/DSC00001.JPG': '2016-05-04 09-00-00-01.JPG',
+        '/cardA/DSC00001.ARW': '2016-05-04 09-00-00.ARW'}
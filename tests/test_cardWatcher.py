@@ -0,0 +1,50 @@
+# Name: test_cardWatcher.py
+#
+# Purpose:
+# Watch mode (cardWatcher, polling): a card is imported whole once, after that only the files and
+# folders that turn up on it are handed on - and its import is done when it's taken out.
+#
+
+# standard Python imports
+import os
+import shutil
+
+import cardWatcher
+
+
+def touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path, 'wb') as f:
+        f.write(b'\xff\xd8\xff\xd9')
+
+def testOnlyNewPathsAfterTheFirstImport(tmp_path):
+    root = str(tmp_path / 'media')
+    volume = os.path.join(root, 'card')
+    touch(os.path.join(volume, 'DCIM', '100MSDCF', 'DSC00001.JPG'))
+    ingested = []
+    done = []
+    watcher = cardWatcher.cardWatcher(root, lambda volume, paths: ingested.append((volume, paths)),
+                                      settle = 0, poll = True, done = done.append)
+    watcher.watch.interval = 0
+    watcher.start()
+    assert watcher.step(0) == 1
+    assert ingested == [(volume, None)]
+
+    # a shot in a folder already there, and a new folder with one in it
+    new = [os.path.join(volume, 'DCIM', '100MSDCF', 'DSC00002.JPG'), os.path.join(volume, 'DCIM', '101MSDCF')]
+    touch(new[0])
+    touch(os.path.join(new[1], 'DSC00003.JPG'))
+    assert watcher.step(0) == 1
+    assert ingested[1] == (volume, set(new))
+    # the new folder's watched now
+    touch(os.path.join(new[1], 'DSC00004.JPG'))
+    assert watcher.step(0) == 1
+    assert ingested[2] == (volume, {os.path.join(new[1], 'DSC00004.JPG')})
+    assert watcher.step(0) == 0
+    assert done == []
+
+    # taken out
+    shutil.rmtree(volume)
+    assert watcher.step(0) == 0
+    assert done == [volume]
+    assert len(ingested) == 3
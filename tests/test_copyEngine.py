@@ -0,0 +1,92 @@
+# Name: test_copyEngine.py
+#
+# Purpose:
+# copyEngine.copyFile: the copy is exact, and its checksum is the file's, whichever way it was copied -
+# also when it's carried on from part way, or from a checkpoint an interrupted copy left.
+#
+
+# standard Python imports
+import os
+
+import pytest
+
+import copyEngine
+import importManifest
+
+
+@pytest.fixture
+def src(tmp_path, monkeypatch):
+    '''
+    :return: a file of a few chunks and a bit, with small chunks so the copy loops go round
+    '''
+    monkeypatch.setattr(copyEngine, 'CHUNK_BYTES', 64 * 1024)
+    name = str(tmp_path / 'src.bin')
+    with open(name, 'wb') as f:
+        f.write(os.urandom(5 * 64 * 1024 + 1234))
+    return name
+
+def readAll(name):
+    with open(name, 'rb') as f:
+        return f.read()
+
+@pytest.mark.parametrize('useKernelCopy', [True, False])
+def testHashWhileCopying(src, tmp_path, useKernelCopy):
+    dst = str(tmp_path / 'dst.bin')
+    hasher = importManifest.newHasher('blake2b')
+    copied = copyEngine.copyFile(src, dst, useKernelCopy = useKernelCopy, hasher = hasher)
+    assert copied == os.path.getsize(src)
+    assert readAll(dst) == readAll(src)
+    assert hasher.hexdigest() == importManifest.hashFile(src, 'blake2b')
+    assert os.stat(dst).st_mtime_ns == os.stat(src).st_mtime_ns
+
+@pytest.mark.parametrize('useKernelCopy', [True, False])
+def testResume(src, tmp_path, useKernelCopy):
+    data = readAll(src)
+    dst = str(tmp_path / 'dst.bin')
+    done = 2 * 64 * 1024 + 100
+    with open(dst, 'wb') as f:
+        f.write(data[:done])
+    hasher = importManifest.newHasher('blake2b')
+    hasher.update(data[:done])
+    copied = copyEngine.copyFile(src, dst, useKernelCopy = useKernelCopy, hasher = hasher, resumeFrom = done)
+    assert copied == len(data) - done
+    assert readAll(dst) == data
+    assert hasher.hexdigest() == importManifest.hashFile(src, 'blake2b')
+
+class pulled(Exception):
+    pass
+
+@pytest.mark.parametrize('useKernelCopy', [True, False])
+def testCheckpointKept(src, tmp_path, monkeypatch, useKernelCopy):
+    monkeypatch.setattr(copyEngine, 'CHECKPOINT_BYTES', 2 * 64 * 1024)
+    dst = str(tmp_path / 'dst.bin')
+    checkpoints = []
+    chunks = []
+
+    def cardPulled(n):
+        chunks.append(n)
+        if len(chunks) == 4:
+            raise pulled()
+
+    with pytest.raises(pulled):
+        copyEngine.copyFile(src, dst, cardPulled, useKernelCopy,
+                            checkpoint = lambda offset, tail: checkpoints.append((offset, tail)))
+    # the copy's kept, and right up to the last checkpoint
+    assert [offset for offset, tail in checkpoints] == [2 * 64 * 1024]
+    offset, tail = checkpoints[-1]
+    with open(src, 'rb') as fSrc, open(dst, 'rb') as fDst:
+        assert copyEngine.tailDigest(fSrc.fileno(), offset) == tail == copyEngine.tailDigest(fDst.fileno(), offset)
+
+    copied = copyEngine.copyFile(src, dst, useKernelCopy = useKernelCopy, resumeFrom = offset)
+    assert copied == os.path.getsize(src) - offset
+    assert readAll(dst) == readAll(src)
+
+def testNoCheckpointNoCopy(src, tmp_path):
+    dst = str(tmp_path / 'dst.bin')
+
+    def cardPulled(n):
+        raise pulled()
+
+    with pytest.raises(pulled):
+        copyEngine.copyFile(src, dst, cardPulled, checkpoint = lambda offset, tail: None)
+    assert not os.path.exists(dst)
@@ -0,0 +1,85 @@
+# Name: test_copyScheduler.py
+#
+# Purpose:
+# copyScheduler: no more copies at once on a device than its limit, and big and small files taken
+# in turn, so neither kind holds the other up.
+#
+
+# standard Python imports
+import os
+import time
+import threading
+
+import copyScheduler
+
+
+class concurrency():
+    '''
+    a copyFunc that copies nothing, but notes how many copies were running at once
+    '''
+    def __init__(self, seconds = 0.05):
+        self.seconds = seconds
+        self.lock = threading.Lock()
+        self.running = 0
+        self.most = 0
+        self.done = []
+
+    def __call__(self, src, dst):
+        with self.lock:
+            self.running += 1
+            self.most = max(self.most, self.running)
+        time.sleep(self.seconds)
+        with self.lock:
+            self.running -= 1
+            self.done.append(src)
+
+def runJobs(tmp_path, scheduler, count):
+    errors = []
+    for i in range(count):
+        scheduler.submit(os.path.join(str(tmp_path), 'src%d' % i), os.path.join(str(tmp_path), 'dst%d' % i), 1,
+                         lambda job, error: errors.append(error))
+    scheduler.close()
+    return errors
+
+def testPerSourceDevice(tmp_path):
+    copier = concurrency()
+    scheduler = copyScheduler.copyScheduler(4, perSourceDevice = 2, copyFunc = copier)
+    assert runJobs(tmp_path, scheduler, 8) == [None] * 8
+    assert copier.most == 2
+    assert len(copier.done) == scheduler.filesCopied == 8
+
+def testDeviceLimit(tmp_path):
+    # a slow card reader, on its own limit
+    copier = concurrency()
+    scheduler = copyScheduler.copyScheduler(4, deviceLimits = {str(tmp_path): 1}, copyFunc = copier)
+    assert runJobs(tmp_path, scheduler, 4) == [None] * 4
+    assert copier.most == 1
+
+def testFailedCopyReported(tmp_path):
+    def fails(src, dst):
+        raise OSError(5, "Input/output error", src)
+    scheduler = copyScheduler.copyScheduler(2, copyFunc = fails)
+    errors = runJobs(tmp_path, scheduler, 2)
+    assert [type(e) for e in errors] == [OSError, OSError]
+    assert scheduler.filesCopied == 0
+
+def testLargeAndSmallInTurn(tmp_path):
+    # no workers: jobs are only queued, and picked here one at a time
+    scheduler = copyScheduler.copyScheduler(0)
+    src = os.path.join(str(tmp_path), '')
+    for name, size in [('clip1', copyScheduler.LARGE_FILE_BYTES), ('clip2', copyScheduler.LARGE_FILE_BYTES),
+                       ('still1', 10), ('still2', 10)]:
+        scheduler.submit(src + name, src + name + '.copy', size, None)
+
+    def start():
+        job = scheduler.nextJob()
+        if job.large:
+            scheduler.largeActive += 1
+        else:
+            scheduler.smallActive += 1
+        return os.path.basename(job.src)
+
+    # whichever kind has fewer copies running goes next (stills on a tie), oldest first in each kind
+    assert [start() for i in range(4)] == ['still1', 'clip1', 'still2', 'clip2']
+    assert scheduler.nextJob() is None
+    scheduler.close()
@@ -0,0 +1,52 @@
+# Name: test_copySession.py
+#
+# Purpose:
+# A card kept open after it's copied (watch mode): files that turn up on it later go into the same
+# import - numbered on from the first lot, with one manifest per destination root and one run report.
+#
+
+# standard Python imports
+import os
+import glob
+from datetime import datetime
+
+import importManifest
+import runMetrics
+from benchmarks.cardGenerator import cardSpec, generateCard, mp4File, jpegFile
+
+
+def testAddedFilesJoinTheImport(main, tmp_path, destRoots):
+    card = str(tmp_path / 'card')
+    written = generateCard(card, cardSpec(100, stillBytes = 2048, videoBytes = 16 * 1024))
+    reportDir = str(tmp_path / 'reports')
+    session = main.setupDirCopy(progress = None, reportDir = reportDir, mediaSources = [card],
+                                stillRootDestination = destRoots[0], videoRootDestination = destRoots[1],
+                                keepOpen = True)
+    assert session.copyCount == written['stills'] + written['videos']
+    assert glob.glob(os.path.join(reportDir, '*')) == []
+
+    # shot later, after the card was copied
+    later = datetime(2016, 5, 9, 12, 0, 0)
+    new = [os.path.join(card, 'PRIVATE/M4ROOT/CLIP/C0100.MP4'), os.path.join(card, 'DCIM/109MSDCF/DSC09999.JPG')]
+    with open(new[0], 'wb') as f:
+        f.write(mp4File(later, 5, 25, 16 * 1024))
+    with open(new[1], 'wb') as f:
+        f.write(jpegFile(later, '00', 2048))
+    # another run meanwhile (eg a second card) mustn't take the session's metrics
+    runMetrics.startRun('other')
+    assert session.add(new) == 2
+
+    videos = sorted(os.path.basename(f) for f in glob.glob(destRoots[1] + '*/*'))
+    assert len(videos) == written['videos'] + 1
+    assert [v for v in videos if v.startswith('V0_')] == [videos[0]]
+    assert 'V%d_16-05-09 12-00-00.MP4' % written['videos'] in videos
+
+    assert session.close() == 0
+    for root in destRoots:
+        manifests = glob.glob(os.path.join(root, importManifest.MANIFEST_PREFIX + '*'))
+        assert len(manifests) == 1
+        copied = [f for f in glob.glob(root + '*/*') if os.path.isfile(f)]
+        assert len(importManifest.readManifest(manifests[0])['files']) == len(copied)
+    reports = glob.glob(os.path.join(reportDir, '*' + runMetrics.REPORT_SUFFIX))
+    assert len(reports) == 1
+    assert '"copied": %d' % (session.copyCount) in open(reports[0]).read()
@@ -0,0 +1,80 @@
+# Name: test_dedupIndex.py
+#
+# Purpose:
+# dedupIndex: a file is only hashed once another has its size, only hashed in full once their
+# partial hashes match, and matched against the library folder as well as the files before it.
+#
+
+# standard Python imports
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import dedupIndex
+
+# bigger than the two ends the partial hash reads
+BIG = 3 * dedupIndex.PARTIAL_BYTES
+
+
+def write(folder, name, data):
+    os.makedirs(folder, exist_ok = True)
+    path = os.path.join(folder, name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+def check(index, path, folder):
+    return index.check(path, os.path.getsize(path), folder)
+
+def testEscalation(tmp_path):
+    card = str(tmp_path / 'card')
+    day = os.path.join(str(tmp_path / 'library'), '2016_05_04', '')
+    index = dedupIndex.dedupIndex()
+    data = os.urandom(BIG)
+
+    # sizes of their own: nothing is read
+    a = write(card, 'a.ARW', data)
+    assert check(index, a, day) is None
+    assert check(index, write(card, 'b.JPG', b'b' * 1000), day) is None
+    assert (index.partialHashes, index.fullHashes) == (0, 0)
+
+    # the same size, different ends: the partial hash tells them apart
+    assert check(index, write(card, 'c.ARW', os.urandom(BIG)), day) is None
+    assert (index.partialHashes, index.fullHashes) == (2, 0)
+
+    # the same ends, different middle: only the full hash does
+    middle = data[:BIG // 2] + bytes([data[BIG // 2] ^ 1]) + data[BIG // 2 + 1:]
+    assert check(index, write(card, 'd.ARW', middle), day) is None
+    assert (index.partialHashes, index.fullHashes) == (3, 2)
+
+    # a copy, whatever it's called
+    match = check(index, write(card, 'e.ARW', data), day)
+    assert match.path == a and not match.inLibrary and match.full is not None
+    assert (index.partialHashes, index.fullHashes) == (4, 3)
+
+def testInLibrary(tmp_path):
+    day = os.path.join(str(tmp_path / 'library'), '2016_05_04', '')
+    data = os.urandom(1000)
+    there = write(day, '2016-05-04 09-00-00.JPG', data)
+    # half copied - not a match
+    write(day, '.ptcopy-0-DSC00001.JPG', data)
+    index = dedupIndex.dedupIndex()
+    match = check(index, write(str(tmp_path / 'card'), 'DSC00001.JPG', data), day)
+    assert os.path.abspath(match.path) == os.path.abspath(there) and match.inLibrary
+
+def testHashAhead(tmp_path):
+    card = str(tmp_path / 'card')
+    day = os.path.join(str(tmp_path / 'library'), '2016_05_04', '')
+    data = os.urandom(BIG)
+    files = [(write(card, name, content), len(content), day)
+             for name, content in [('a.ARW', data), ('b.ARW', os.urandom(BIG)), ('c.ARW', data), ('d.JPG', b'd' * 10)]]
+    index = dedupIndex.dedupIndex()
+    with ThreadPoolExecutor(2) as pool:
+        known = index.hashAhead(files, pool)
+    # the lone size isn't read, the two that differ stop at the partial hash
+    assert (index.partialHashes, index.fullHashes) == (3, 2)
+    assert known[files[3][0]].partial is None
+
+    # check() has nothing left to hash
+    matches = [index.check(path, size, folder, known[path]) for path, size, folder in files]
+    assert [m and m.path for m in matches] == [None, None, files[0][0], None]
+    assert (index.partialHashes, index.fullHashes) == (3, 2)
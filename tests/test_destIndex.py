@@ -0,0 +1,30 @@
+# Name: test_destIndex.py
+#
+# Purpose:
+# destIndex: names in a day folder are looked up in its listing, and each is stat'd at most once.
+#
+
+# standard Python imports
+import os
+
+import destIndex
+
+
+def testStatIsKept(tmp_path):
+    folder = str(tmp_path)
+    with open(os.path.join(folder, 'a.JPG'), 'wb') as f:
+        f.write(b'x' * 10)
+    os.mkdir(os.path.join(folder, 'sub'))
+    index = destIndex.destIndex()
+    first = index.stat(folder, 'a.JPG')
+    assert first == (10, os.stat(os.path.join(folder, 'a.JPG')).st_mtime_ns)
+
+    # from the listing now - not the disk
+    os.remove(os.path.join(folder, 'a.JPG'))
+    assert index.stat(folder, 'a.JPG') == first
+    assert index.stat(folder, 'b.JPG') is None
+    assert index.files(folder) == [('a.JPG', 10)]
+
+    index.add(folder, 'b.JPG', 5, 1)
+    assert index.stat(folder, 'b.JPG') == (5, 1)
+    assert index.scans == 1
@@ -0,0 +1,89 @@
+# Name: test_exifFast.py
+#
+# Purpose:
+# exifFast: the IFD walk gets DateTimeOriginal & SubSecTimeOriginal out of JPEGs and TIFF based
+# raws (either byte order, wherever in the file the IFDs are), and gives up on anything odd - so
+# metaExtract.readStillTags falls back to exifread, or to no date at all.
+#
+
+# standard Python imports
+from datetime import datetime
+
+import pytest
+
+import exifFast
+import metaExtract
+import runMetrics
+from benchmarks.cardGenerator import jpegFile, rawFile, tiffBlock
+
+SHOT = datetime(2016, 5, 4, 9, 30, 15)
+
+
+def write(tmp_path, name, data):
+    path = str(tmp_path / name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+@pytest.mark.parametrize('name, data', [
+    ('a.JPG', jpegFile(SHOT, '25', 4096)),
+    ('a.ARW', rawFile(SHOT, '25', 4096, 'ARW')),
+    ('a.CR2', rawFile(SHOT, '25', 4096, 'CR2')),
+    # big endian
+    ('a.TIF', rawFile(SHOT, '25', 4096, 'TIF')),
+    # IFDs past the first block read
+    ('b.TIF', tiffBlock(SHOT, '25', headerExtra = b'\0' * (exifFast.HEAD_BYTES + 100)))],
+    ids = ['JPG', 'ARW', 'CR2', 'TIF', 'farTIF'])
+def testIFDWalk(tmp_path, name, data):
+    assert exifFast.readDateTimeOriginal(write(tmp_path, name, data)) == ('2016:05:04 09:30:15', '25')
+
+def testNoSubSec(tmp_path):
+    assert exifFast.readDateTimeOriginal(write(tmp_path, 'a.JPG', jpegFile(SHOT, '', 4096))) == \
+        ('2016:05:04 09:30:15', '')
+
+@pytest.mark.parametrize('data', [
+    b'not an image',
+    # cut short in IFD0
+    jpegFile(SHOT, '25', 4096)[:40],
+    # no Exif segment
+    b'\xff\xd8\xff\xda\x00\x02' + b'\0' * 100,
+    # a date that isn't one
+    jpegFile(SHOT, '25', 4096).replace(b'2016:05:04', b'2016-05-04')],
+    ids = ['notAnImage', 'cutShort', 'noExif', 'badDate'])
+def testGivesUp(tmp_path, data):
+    assert exifFast.readDateTimeOriginal(write(tmp_path, 'a.JPG', data)) is None
+
+class fakeExifread():
+    '''
+    stands in for the exifread module
+    '''
+    def __init__(self, tags = None):
+        self.tags = tags
+        self.calls = 0
+
+    def process_file(self, f, stop_tag = None, details = True):
+        self.calls += 1
+        if self.tags is None:
+            raise ValueError("can't read it either")
+        return self.tags
+
+def testExifreadFallback(tmp_path, monkeypatch):
+    odd = write(tmp_path, 'a.JPG', b'not an image')
+    exifread = fakeExifread({'EXIF DateTimeOriginal': '2016:05:04 09:30:15', 'EXIF SubSecTimeOriginal': '7'})
+    monkeypatch.setattr(exifFast, 'loadExifread', lambda: exifread)
+    metrics = runMetrics.startRun('test')
+    assert metaExtract.readStillTags(odd) == {'DateTimeOriginal': '2016:05:04 09:30:15', 'SubSecTimeOriginal': '7'}
+    assert metrics.counts['exifreadFallback'] == 1
+
+    # read by the fast path - exifread isn't asked
+    assert metaExtract.readStillTags(write(tmp_path, 'b.JPG', jpegFile(SHOT, '25', 4096))) == \
+        {'DateTimeOriginal': '2016:05:04 09:30:15', 'SubSecTimeOriginal': '25'}
+    assert exifread.calls == 1
+
+def testNoDateAnywhere(tmp_path, monkeypatch):
+    odd = write(tmp_path, 'a.JPG', b'not an image')
+    monkeypatch.setattr(exifFast, 'loadExifread', lambda: fakeExifread())
+    assert metaExtract.readStillTags(odd) == {'DateTimeOriginal': '', 'SubSecTimeOriginal': ''}
+    # exifread not installed
+    monkeypatch.setattr(exifFast, 'loadExifread', lambda: None)
+    assert metaExtract.readStillTags(odd) == {'DateTimeOriginal': '', 'SubSecTimeOriginal': ''}
@@ -0,0 +1,56 @@
+# Name: test_importLedger.py
+#
+# Purpose:
+# importLedger: a file copied from a card is skipped next time - unless it's changed on the card,
+# its copy has gone, or the card's been forgotten - and an ingest of the same card again copies
+# only what's new.
+#
+
+# standard Python imports
+import os
+import glob
+
+import importLedger
+from benchmarks.cardGenerator import cardSpec, generateCard
+
+
+def testSkipAndReimport(tmp_path):
+    ledger = importLedger.importLedger(':memory:')
+    dest = str(tmp_path / 'DSC00001.JPG')
+    with open(dest, 'wb') as f:
+        f.write(b'x')
+    ledger.recordMany([('card1', 'DCIM/DSC00001.JPG', 1, 100, dest)])
+    assert ledger.isImported('card1', 'DCIM/DSC00001.JPG', 1, 100)
+    # changed on the card, or another card
+    assert not ledger.isImported('card1', 'DCIM/DSC00001.JPG', 1, 101)
+    assert not ledger.isImported('card2', 'DCIM/DSC00001.JPG', 1, 100)
+    # the copy's gone from the library
+    os.remove(dest)
+    assert ledger.importedTo('card1', 'DCIM/DSC00001.JPG', 1, 100) == dest
+    assert not ledger.isImported('card1', 'DCIM/DSC00001.JPG', 1, 100)
+    assert ledger.forget('card1') == 1
+    assert ledger.importedTo('card1', 'DCIM/DSC00001.JPG', 1, 100) is None
+
+def testCardIdentityOfAFolder(tmp_path):
+    # the same folder gives the same identity, another folder a different one
+    assert importLedger.cardIdentity(str(tmp_path)) == importLedger.cardIdentity(str(tmp_path) + '/')
+    os.mkdir(str(tmp_path / 'other'))
+    assert importLedger.cardIdentity(str(tmp_path)) != importLedger.cardIdentity(str(tmp_path / 'other'))
+
+def testIngestAgainCopiesOnlyNewFiles(main, tmp_path, destRoots):
+    card = str(tmp_path / 'card')
+    written = generateCard(card, cardSpec(20, stillBytes = 2048, videoBytes = 16 * 1024))
+    files = written['stills'] + written['videos']
+    ledger = importLedger.importLedger(str(tmp_path / 'ledger.sqlite'))
+    assert main.ingestPipeline(*destRoots, ledger = ledger, checkSpace = False).run(card) == files
+
+    ingest = main.ingestPipeline(*destRoots, ledger = ledger, checkSpace = False)
+    assert ingest.run(card) == 0
+    assert ingest.skipCount == files
+
+    # one copy deleted from the library: that file is copied again
+    os.remove(sorted(glob.glob(destRoots[0] + '*/*.JPG'))[0])
+    ingest = main.ingestPipeline(*destRoots, ledger = ledger, checkSpace = False)
+    assert ingest.run(card) == 1
+    assert ingest.skipCount == files - 1
+    ledger.close()
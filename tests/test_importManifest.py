@@ -0,0 +1,69 @@
+# Name: test_importManifest.py
+#
+# Purpose:
+# importManifest verify: copies that still match their manifest pass, and one that's been changed,
+# cut short or lost is reported - by the function and by `python importManifest.py verify`.
+#
+
+# standard Python imports
+import os
+import sys
+
+import pytest
+
+import importManifest
+
+
+@pytest.fixture
+def library(tmp_path):
+    '''
+    :return: (destination root, {name: path}) - three copies and their manifest
+    '''
+    root = str(tmp_path / 'P')
+    os.makedirs(os.path.join(root, '2016_05_04'))
+    paths = {}
+    entries = []
+    for name in ('a.JPG', 'b.JPG', 'c.JPG'):
+        path = os.path.join(root, '2016_05_04', name)
+        with open(path, 'wb') as f:
+            f.write(os.urandom(5000))
+        paths[name] = path
+        entries.append((path, 5000, importManifest.hashFile(path, 'blake2b'), '/card/DCIM/' + name))
+    importManifest.writeManifest(root, entries, 'blake2b', '/card')
+    return root, paths
+
+def verifyRoot(root):
+    manifests = importManifest.findManifests(root)
+    assert len(manifests) == 1
+    checked, problems = importManifest.verifyManifest(manifests[0])
+    return checked, sorted((os.path.basename(path), problem.split(':')[0]) for path, problem in problems)
+
+def testVerify(library):
+    root, paths = library
+    assert verifyRoot(root) == (3, [])
+
+    # one byte changed, one cut short, one gone
+    with open(paths['a.JPG'], 'r+b') as f:
+        byte = f.read(1)
+        f.seek(0)
+        f.write(bytes([byte[0] ^ 1]))
+    with open(paths['b.JPG'], 'r+b') as f:
+        f.truncate(4000)
+    os.remove(paths['c.JPG'])
+    checked, problems = verifyRoot(root)
+    assert checked == 3
+    assert problems[:2] == [('a.JPG', 'hash differs'), ('b.JPG', 'size differs')]
+    assert problems[2][0] == 'c.JPG'
+
+def testVerifyCommand(library, monkeypatch, capsys):
+    root, paths = library
+    monkeypatch.setattr(sys, 'argv', ['importManifest.py', 'verify', root])
+    with pytest.raises(SystemExit) as done:
+        importManifest.main()
+    assert done.value.code == 0
+
+    os.remove(paths['a.JPG'])
+    with pytest.raises(SystemExit) as done:
+        importManifest.main()
+    assert done.value.code == 1
+    assert 'Checked 3 files in 1 manifests, 1 problems' in capsys.readouterr().out
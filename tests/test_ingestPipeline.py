@@ -0,0 +1,134 @@
+# Name: test_ingestPipeline.py
+#
+# Purpose:
+# The ingest pipeline's error & shutdown paths: a copy stage that can't start, or a file that
+# can't be handed to the copier, must not hang the run or lose track of the other files. And a file
+# that's twice in one import gets into the library even if the first one's copy fails.
+#
+
+# standard Python imports
+import os
+import glob
+import shutil
+import threading
+
+import pytest
+
+import copyScheduler
+from benchmarks.cardGenerator import cardSpec, generateCard
+
+# seconds to wait for an ingest before calling it hung
+HANG_SECONDS = 120
+
+
+@pytest.fixture(scope = 'module')
+def card(main, tmp_path_factory):
+    '''
+    :return: (card path, files on it) - more files than the queues between the stages hold, so a
+             stage that stops taking them blocks the one before it
+    '''
+    path = str(tmp_path_factory.mktemp('cards') / 'card')
+    written = generateCard(path, cardSpec(main.PIPELINE_QUEUE_SIZE + 50, stillBytes = 2048, videoBytes = 16 * 1024))
+    return path, written['stills'] + written['videos']
+
+@pytest.fixture(scope = 'module')
+def twinCards(card, tmp_path_factory):
+    '''
+    :return: (card path, the same card copied to another path, files on each)
+    '''
+    path, files = card
+    twin = str(tmp_path_factory.mktemp('cards') / 'twin')
+    shutil.copytree(path, twin)
+    return path, twin, files
+
+def runIngest(ingest, *sources):
+    '''
+    run an ingest in a thread, failing the test if it hasn't finished after HANG_SECONDS
+    :return: number of files copied
+    '''
+    result = []
+    t = threading.Thread(target = lambda: result.append(ingest.run(list(sources))), daemon = True)
+    t.start()
+    t.join(HANG_SECONDS)
+    assert not t.is_alive(), "the ingest hung"
+    assert result, "the ingest failed"
+    return result[0]
+
+def destFiles(destRoots):
+    return [f for root in destRoots for f in glob.glob(root + '*/*') if os.path.isfile(f)]
+
+def tempFiles(destRoots):
+    return [f for root in destRoots for f in glob.glob(root + '*/.*')]
+
+def testCopyStageFailureIsDrained(main, card, destRoots):
+    path, files = card
+    # the scheduler can't be made: the device limit's path doesn't exist
+    ingest = main.ingestPipeline(*destRoots, deviceLimits = {os.path.join(path, 'nonexistent'): 1},
+                                 checkSpace = False)
+    assert runIngest(ingest, path) == 0
+    assert ingest.stageErr == ['copy']
+    # every file is an error, and the progress has got to the end
+    assert len(ingest.stillsFileErr) + len(ingest.vidFileErr) == files
+    assert ingest.progress.filesDone == ingest.progress.totalFiles == files
+    assert destFiles(destRoots) == []
+
+def testCopyStageFailureWithDuplicates(main, twinCards, destRoots):
+    # the files held back as duplicates get a copy stage of their own - which must drain the same way
+    path, twin, files = twinCards
+    ingest = main.ingestPipeline(*destRoots, deviceLimits = {os.path.join(path, 'nonexistent'): 1},
+                                 checkSpace = False, dedup = 'skip')
+    assert runIngest(ingest, path, twin) == 0
+    assert ingest.stageErr == ['copy', 'copy']
+    assert len(ingest.stillsFileErr) + len(ingest.vidFileErr) == 2 * files
+    assert ingest.duplicates == []
+    assert ingest.progress.filesDone == ingest.progress.totalFiles == 2 * files
+    assert destFiles(destRoots) == []
+
+def testSubmitFailureLosesOnlyThatFile(main, card, destRoots, monkeypatch):
+    path, files = card
+    submit = copyScheduler.copyScheduler.submit
+
+    def pulledCard(self, src, dst, size, onDone, copyFunc = None):
+        if src.endswith('0.JPG'):
+            raise FileNotFoundError(2, "No such file or directory", os.path.dirname(src))
+        return submit(self, src, dst, size, onDone, copyFunc)
+    monkeypatch.setattr(copyScheduler.copyScheduler, 'submit', pulledCard)
+
+    ingest = main.ingestPipeline(*destRoots, checkSpace = False)
+    copied = runIngest(ingest, path)
+    failed = ingest.stillsFileErr + ingest.vidFileErr
+    assert failed and all(f.endswith('0.JPG') for f in failed)
+    assert ingest.stageErr == []
+    assert copied + len(failed) == files
+    assert len(destFiles(destRoots)) == copied
+    assert tempFiles(destRoots) == []
+
+def testSameCardTwice(main, twinCards, destRoots):
+    path, twin, files = twinCards
+    ingest = main.ingestPipeline(*destRoots, checkSpace = False, dedup = 'skip')
+    assert runIngest(ingest, path, twin) == files
+    assert len(ingest.duplicates) == files
+    assert all(not inLibrary for item, match, inLibrary in ingest.duplicates)
+    assert len(destFiles(destRoots)) == files
+
+def testDuplicateCopiedWhenTheFirstCopyFails(main, twinCards, destRoots):
+    path, twin, files = twinCards
+    ingest = main.ingestPipeline(*destRoots, checkSpace = False, dedup = 'skip')
+    # the first copy of each file fails - from whichever card it was checked first
+    tried = set()
+    copyOne = ingest.copyOne
+
+    def firstCopyFails(item, src, dst):
+        rel = os.path.relpath(src, twin if src.startswith(twin) else path)
+        if rel not in tried:
+            tried.add(rel)
+            raise OSError(5, "Input/output error", src)
+        return copyOne(item, src, dst)
+    ingest.copyOne = firstCopyFails
+
+    assert runIngest(ingest, path, twin) == files
+    assert len(ingest.stillsFileErr) + len(ingest.vidFileErr) == files
+    assert ingest.duplicates == []
+    assert len(destFiles(destRoots)) == files
+    assert tempFiles(destRoots) == []
+    assert ingest.progress.filesDone == ingest.progress.totalFiles == 2 * files
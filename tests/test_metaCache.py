@@ -0,0 +1,64 @@
+# Name: test_metaCache.py
+#
+# Purpose:
+# metaCache: tags are found again for the same file, missed once it's changed (size or mod time),
+# and the least recently used entries go first when the cache is over size.
+#
+
+# standard Python imports
+import os
+import time
+
+import metaCache
+
+
+def write(tmp_path, name, data = b'x'):
+    path = str(tmp_path / name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+def testChangedFileMisses(tmp_path):
+    cache = metaCache.metaCache(':memory:')
+    path = write(tmp_path, 'a.JPG')
+    reads = []
+
+    def reader(srcname):
+        reads.append(srcname)
+        return {'DateTimeOriginal': '2016:05:04 09:00:%02d' % len(reads)}
+
+    assert metaCache.cachedRead(path, reader, cache) == {'DateTimeOriginal': '2016:05:04 09:00:01'}
+    assert metaCache.cachedRead(path, reader, cache) == {'DateTimeOriginal': '2016:05:04 09:00:01'}
+    assert len(reads) == 1
+
+    # another size, then the same size with another mod time
+    write(tmp_path, 'a.JPG', b'xy')
+    assert metaCache.cachedRead(path, reader, cache)['DateTimeOriginal'] == '2016:05:04 09:00:02'
+    statbuf = os.stat(path)
+    os.utime(path, ns = (statbuf.st_atime_ns, statbuf.st_mtime_ns + 1000000000))
+    assert metaCache.cachedRead(path, reader, cache)['DateTimeOriginal'] == '2016:05:04 09:00:03'
+    assert len(reads) == 3
+    # the stale entries went as the new ones came in
+    assert cache.count() == 1
+    assert (cache.hits, cache.misses) == (1, 3)
+
+def testLeastRecentlyUsedEvicted(tmp_path):
+    cache = metaCache.metaCache(':memory:', maxEntries = 2)
+    keys = [metaCache.fileKey(str(tmp_path / name), 1, 1) for name in ('a', 'b', 'c')]
+    for key in keys[:2]:
+        cache.store(key, {'n': key[0]})
+        time.sleep(0.01)
+    # a is used again, so b is the oldest when c comes in
+    assert cache.lookup(keys[0]) is not None
+    time.sleep(0.01)
+    cache.store(keys[2], {'n': keys[2][0]})
+    assert cache.evict() == 1
+    assert [cache.lookup(key) is not None for key in keys] == [True, False, True]
+
+def testInvalidateFolder(tmp_path):
+    cache = metaCache.metaCache(':memory:')
+    for name in ('DCIM/a.JPG', 'DCIM/b.JPG', 'DCIM_2/c.JPG'):
+        cache.store(metaCache.fileKey(str(tmp_path / name), 1, 1), {})
+    # only what's under the folder - not a folder whose name starts the same
+    assert cache.invalidate(str(tmp_path / 'DCIM')) == 2
+    assert cache.count() == 1
@@ -0,0 +1,130 @@
+# Name: test_renameEngine.py
+#
+# Purpose:
+# renameEngine: the plan's order for chains & cycles, the pairs it leaves out, and a rename that's
+# interrupted being finished or undone from its journal - and the rename asked for carried on with
+# once it has been.
+#
+
+# standard Python imports
+import os
+from datetime import datetime
+
+import renameEngine
+from benchmarks.cardGenerator import jpegFile
+
+
+def folder(tmp_path, names):
+    '''
+    :return: a folder with a file per name, each holding its own name
+    '''
+    path = str(tmp_path)
+    for name in names:
+        with open(os.path.join(path, name), 'w') as f:
+            f.write(name)
+    return path
+
+def contents(path):
+    '''
+    :return: {name: what's in it} for the files in path
+    '''
+    result = {}
+    for name in os.listdir(path):
+        with open(os.path.join(path, name)) as f:
+            result[name] = f.read()
+    return result
+
+def applied(ops, names):
+    '''
+    :return: {name: original name} after doing ops in order, checking none lands on a name in use
+    '''
+    state = {name: name for name in names}
+    for src, dst in ops:
+        assert dst not in state, "%s -> %s overwrites" % (src, dst)
+        state[dst] = state.pop(src)
+    return state
+
+def testChainFromTheEnd():
+    plan = renameEngine.planRenames([('a', 'b'), ('b', 'c'), ('c', 'd')], ['a', 'b', 'c'])
+    assert plan.ops == [('c', 'd'), ('b', 'c'), ('a', 'b')]
+    assert plan.conflicts == []
+
+def testCycleCostsOneTempName():
+    pairs = [('a', 'b'), ('b', 'c'), ('c', 'a'), ('x', 'x')]
+    plan = renameEngine.planRenames(pairs, ['a', 'b', 'c', 'x'])
+    assert plan.unchanged == 1
+    assert len(plan.ops) == 4
+    assert sum(1 for src, dst in plan.ops if dst.startswith(renameEngine.TEMP_PREFIX)) == 1
+    assert applied(plan.ops, ['a', 'b', 'c']) == {'b': 'a', 'c': 'b', 'a': 'c'}
+
+def testTempNameInUse():
+    temp = renameEngine.TEMP_PREFIX + '0-a'
+    plan = renameEngine.planRenames([('a', 'b'), ('b', 'a')], ['a', 'b', temp])
+    assert plan.ops[0] == ('a', renameEngine.TEMP_PREFIX + '1-a')
+    assert applied(plan.ops, ['a', 'b', temp]) == {'b': 'a', 'a': 'b', temp: temp}
+
+def testConflicts():
+    # x is taken by a file that isn't moving, so a stays - and so does c, which wanted a's name
+    pairs = [('a', 'x'), ('c', 'a'), ('d', 'e'), ('f', 'e')]
+    plan = renameEngine.planRenames(pairs, ['a', 'c', 'd', 'f', 'x'])
+    assert sorted(plan.conflicts) == [('a', 'x', 'already exists'), ('c', 'a', 'already exists'),
+                                      ('f', 'e', 'same new name as d')]
+    assert plan.ops == [('d', 'e')]
+
+def testApplySwap(tmp_path):
+    path = folder(tmp_path, ['a', 'b'])
+    plan = renameEngine.planRenames([('a', 'b'), ('b', 'a')], ['a', 'b'])
+    assert renameEngine.applyPlan(path, plan) == (3, [])
+    assert contents(path) == {'a': 'b', 'b': 'a'}
+
+def interrupted(tmp_path, doneOps):
+    '''
+    :return: a folder part way through a 3-cycle: the first doneOps renames done and logged, and
+             the one after done but not logged yet
+    '''
+    path = folder(tmp_path, ['a', 'b', 'c'])
+    plan = renameEngine.planRenames([('a', 'b'), ('b', 'c'), ('c', 'a')], ['a', 'b', 'c'])
+    journal = renameEngine._writeJournalHeader(path, plan.ops)
+    for i, (src, dst) in enumerate(plan.ops[:doneOps + 1]):
+        os.rename(os.path.join(path, src), os.path.join(path, dst))
+        if i < doneOps:
+            journal.write('%d\n' % i)
+    journal.close()
+    return path
+
+def testRecoverForward(tmp_path):
+    path = interrupted(tmp_path, 1)
+    assert renameEngine.pendingJournal(path)
+    count, errors = renameEngine.recover(path, forward = True)
+    assert (count, errors) == (2, [])
+    assert contents(path) == {'b': 'a', 'c': 'b', 'a': 'c'}
+    assert not renameEngine.pendingJournal(path)
+
+def testRecoverBack(tmp_path):
+    path = interrupted(tmp_path, 1)
+    count, errors = renameEngine.recover(path, forward = False)
+    assert (count, errors) == (2, [])
+    assert contents(path) == {'a': 'a', 'b': 'b', 'c': 'c'}
+    assert not renameEngine.pendingJournal(path)
+
+def testRenameCarriesOnAfterRecovery(main, tmp_path):
+    (tmp_path / 'shots').mkdir()
+    path = interrupted(tmp_path / 'shots', 1)
+    with open(os.path.join(path, 'DSC00001.JPG'), 'wb') as f:
+        f.write(jpegFile(datetime(2016, 5, 4, 9, 30, 15), '25', 2048))
+    assert main.setupStillsRename(reportDir = str(tmp_path / 'reports'), stillsPath = path) == 0
+    assert not renameEngine.pendingJournal(path)
+    assert sorted(os.listdir(path)) == ['2016-05-04 09-30-15.JPG', 'a', 'b', 'c']
+
+def testNoRenameUntilRecovered(main, tmp_path):
+    (tmp_path / 'shots').mkdir()
+    path = interrupted(tmp_path / 'shots', 1)
+    # the files the rest of the journal moves have gone
+    for name in os.listdir(path):
+        if name != renameEngine.JOURNAL_NAME:
+            os.remove(os.path.join(path, name))
+    with open(os.path.join(path, 'DSC00001.JPG'), 'wb') as f:
+        f.write(jpegFile(datetime(2016, 5, 4, 9, 30, 15), '25', 2048))
+    assert main.setupStillsRename(reportDir = str(tmp_path / 'reports'), stillsPath = path) == 1
+    assert renameEngine.pendingJournal(path)
+    assert 'DSC00001.JPG' in os.listdir(path)
@@ -0,0 +1,68 @@
+# Name: test_transferJournal.py
+#
+# Purpose:
+# transferJournal: what's kept for an unfinished copy, and an ingest that's cut short before the
+# final names carrying on from its copies rather than copying them again.
+#
+
+# standard Python imports
+import glob
+
+import copyEngine
+import transferJournal
+from benchmarks.cardGenerator import cardSpec, generateCard
+
+KEY = ('uuid-1234:', 'DCIM/100MSDCF/DSC00001.ARW', 3000000, 1462352400000000000)
+
+
+def testEntries(tmp_path):
+    dbPath = str(tmp_path / 'journal.sqlite')
+    journal = transferJournal.transferJournal(dbPath)
+    assert journal.lookup(*KEY) is None
+    journal.checkpoint(KEY, '/archive/.ptcopy-0-DSC00001.ARW', 1000000, 'tail1')
+    entry = journal.lookup(*KEY)
+    assert (entry.state, entry.offset, entry.tail) == (transferJournal.PARTIAL, 1000000, 'tail1')
+    journal.close()
+
+    # kept across runs, and a file that's changed on the card (another mod time) isn't it
+    journal = transferJournal.transferJournal(dbPath)
+    assert journal.lookup(*KEY).offset == 1000000
+    assert journal.lookup(*(KEY[:3] + (KEY[3] + 1,))) is None
+    journal.copied(KEY, '/archive/.ptcopy-0-DSC00001.ARW', 'tail2', 'digest')
+    entry = journal.lookup(*KEY)
+    assert (entry.state, entry.offset, entry.digest) == (transferJournal.COPIED, KEY[2], 'digest')
+
+    journal.finished([KEY])
+    assert journal.lookup(*KEY) is None
+    journal.checkpoint(KEY, '/archive/.ptcopy-0-DSC00001.ARW', 1000000, 'tail1')
+    assert journal.forget('another card') == 0
+    assert journal.forget(KEY[0]) == 1
+    journal.close()
+
+def testIngestCarriesOn(main, tmp_path, destRoots, monkeypatch):
+    card = str(tmp_path / 'card')
+    written = generateCard(card, cardSpec(20, stillBytes = 2048, videoBytes = 16 * 1024))
+    files = written['stills'] + written['videos']
+    journal = transferJournal.transferJournal(str(tmp_path / 'journal.sqlite'))
+
+    # cut short once everything's copied, before the final names
+    ingest = main.ingestPipeline(*destRoots, journal = journal, checkSpace = False)
+    ingest.finalNames = lambda: None
+    ingest.run(card)
+    temps = [f for root in destRoots for f in glob.glob(root + '*/.*')]
+    assert len(temps) == files
+
+    copies = []
+    copyFile = copyEngine.copyFile
+
+    def counted(src, dst, **kwargs):
+        copies.append(src)
+        return copyFile(src, dst, **kwargs)
+    monkeypatch.setattr(copyEngine, 'copyFile', counted)
+    ingest = main.ingestPipeline(*destRoots, journal = journal, checkSpace = False)
+    assert ingest.run(card) == files
+    assert copies == []
+    assert len(ingest.resumed) == files
+    assert [f for root in destRoots for f in glob.glob(root + '*/.*')] == []
+    assert str(journal).endswith('copied: 0 files, 0.0 MB\t partial: 0 files, 0.0 MB')
+    journal.close()
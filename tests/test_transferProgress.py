@@ -0,0 +1,60 @@
+# Name: test_transferProgress.py
+#
+# Purpose:
+# transferProgress: the free space check, and the console bar sharing the console with other output -
+# and giving it back when a run fails part way.
+#
+
+# standard Python imports
+import sys
+
+import pytest
+
+import transferProgress
+from benchmarks.cardGenerator import cardSpec, generateCard
+
+
+def state(bytesDone, finished = False):
+    return transferProgress.progressState(bytesDone, 0, 100, 0, 1, 1.0, 1.0, finished)
+
+def testNothingToWriteNeedsNoRoom(tmp_path):
+    # more margin than any disk has: only a root with something to write is short of room
+    margin = 1 << 62
+    stills = str(tmp_path)
+    assert transferProgress.freeSpaceShortfall({stills: 0}, margin) == []
+    short = transferProgress.freeSpaceShortfall({stills: 1}, margin)
+    assert [(folder, needed) for folder, needed, free in short] == [(stills, margin + 1)]
+
+def testPrintingUnderTheBar(capsys):
+    out = sys.stdout
+    bar = transferProgress.consoleProgress()
+    bar(state(10))
+    assert sys.stdout is out
+    bar.line.write("Oh no. Reading x failed\n")
+    bar(state(50))
+    bar(state(100, finished = True))
+    assert not bar.line.barShown
+
+    lines = capsys.readouterr().out.split('\n')
+    # the message is on its own line, not on the end of the bar
+    assert lines[1] == "Oh no. Reading x failed"
+    assert lines[0].startswith('\r[')
+    assert lines[2].startswith('\r[') and lines[2].count('\r') == 2
+    assert lines[3] == ''
+
+def testRunThatFailsGivesBackTheConsole(main, tmp_path, destRoots, monkeypatch, capsys):
+    card = str(tmp_path / 'card')
+    generateCard(card, cardSpec(10, stillBytes = 2048, videoBytes = 16 * 1024))
+    out = sys.stdout
+
+    def fails(ingest):
+        # printed while the bar's up
+        assert isinstance(sys.stdout, transferProgress.barLine)
+        print("Oh no")
+        raise RuntimeError("cut short")
+    monkeypatch.setattr(main.ingestPipeline, 'copyHeldBack', fails)
+    with pytest.raises(RuntimeError):
+        main.setupDirCopy(reportDir = str(tmp_path / 'reports'), mediaSources = [card],
+                          stillRootDestination = destRoots[0], videoRootDestination = destRoots[1])
+    assert sys.stdout is out
+    assert "Oh no\n" in capsys.readouterr().out
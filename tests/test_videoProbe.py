@@ -0,0 +1,39 @@
+# Name: test_videoProbe.py
+#
+# Purpose:
+# videoProbe.probeMTS: duration and frame rate from the PTS, reading only as much of each end of the
+# clip as it needs.
+#
+
+# standard Python imports
+import io
+
+import pytest
+
+import videoProbe
+from benchmarks.cardGenerator import mtsFile
+
+
+class countingFile(io.FileIO):
+    bytesRead = 0
+
+    def read(self, size = -1):
+        data = super().read(size)
+        countingFile.bytesRead += len(data)
+        return data
+
+@pytest.mark.parametrize('seconds, fps, size, durationMs', [(1, 25, 64 * 1024, '1000'),
+                                                            (30, 50, 20 * 1024 * 1024, '30000'),
+                                                            (0.2, 25, 8000, '200')])
+def testProbeMTS(tmp_path, monkeypatch, seconds, fps, size, durationMs):
+    name = str(tmp_path / '00001.MTS')
+    with open(name, 'wb') as f:
+        f.write(mtsFile(seconds, fps, size))
+    countingFile.bytesRead = 0
+    monkeypatch.setattr(videoProbe, 'open', countingFile, raising = False)
+
+    tags = videoProbe.probeVideo(name)
+    assert tags['Duration'] == durationMs
+    assert tags['FrameRate'] == '%.3f' % fps
+    # a chunk or few from each end (the whole of a small clip, twice), not the whole head & tail blocks
+    assert countingFile.bytesRead <= min(2 * size, 16 * videoProbe.TS_CHUNK_BYTES)
@@ -0,0 +1,167 @@
+# Name: transferJournal.py
+#
+# Purpose:
+# Let a card copy that was cut short (card reader dropped out, machine went to sleep, ...) pick up
+# where it stopped, instead of copying everything again.
+#   - each file copied to its temporary name is recorded as 'copied', with its checksum
+#   - big files are also checkpointed while they copy: every copyEngine.CHECKPOINT_BYTES the
+#     copy is synced to disk and the offset reached recorded, with a hash of the bytes just before it
+#   - on the next run a copied file is kept and a checkpointed one carries on from its offset -
+#     but only if the hash of the tail still matches both the copy and the card
+#   - entries are removed once their files have their final names (and are in the import ledger)
+#
+# Entries are keyed like the import ledger: (card id, path relative to the card root, size, mtime_ns),
+# so a file that changed on the card is copied from scratch.
+#
+# Stored in an SQLite db in the user data dir. Run this file directly to look at it/ clear it:
+#   python transferJournal.py stats
+#   python transferJournal.py forget [card root ...]
+#
+
+# standard Python imports
+import os
+import time
+import sqlite3
+import argparse
+import threading
+
+# local modules
+import importLedger
+
+# entry states
+PARTIAL = 'partial'
+COPIED = 'copied'
+
+
+def defaultJournalPath():
+    '''
+    :return: the db file name, next to the import ledger
+    '''
+    return os.path.join(os.path.dirname(importLedger.defaultLedgerPath()), 'transferJournal.sqlite')
+
+class journalEntry():
+    def __init__(self, dest, state, offset, tail, digest):
+        self.dest = dest            # the temporary copy
+        self.state = state          # PARTIAL or COPIED
+        self.offset = offset        # bytes written & synced (the whole file when COPIED)
+        self.tail = tail            # copyEngine.tailDigest of the bytes before offset
+        self.digest = digest        # checksum of the whole file, when COPIED with hashing on
+
+class transferJournal():
+    def __init__(self, dbPath = None):
+        '''
+            open (and create if needed) the journal db
+        '''
+        if dbPath is None:
+            dbPath = defaultJournalPath()
+        if dbPath != ':memory:':
+            os.makedirs(os.path.dirname(dbPath), exist_ok = True)
+        self.dbPath = dbPath
+        # written from all the copy threads
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(dbPath, check_same_thread = False)
+        # an entry per file copied: WAL keeps each commit cheap (no sync of the whole db every time)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS transfers (
+                            card TEXT NOT NULL,
+                            relpath TEXT NOT NULL,
+                            size INTEGER NOT NULL,
+                            mtime_ns INTEGER NOT NULL,
+                            dest TEXT NOT NULL,
+                            state TEXT NOT NULL,
+                            offset INTEGER NOT NULL,
+                            tail TEXT NOT NULL,
+                            digest TEXT NOT NULL,
+                            updated REAL NOT NULL,
+                            PRIMARY KEY (card, relpath, size, mtime_ns))''')
+        self.db.commit()
+
+    def __str__(self):
+        with self.lock:
+            rows = self.db.execute('SELECT state, COUNT(*), SUM(offset) FROM transfers GROUP BY state').fetchall()
+        states = {state: (files, nBytes) for state, files, nBytes in rows}
+        copied = states.get(COPIED, (0, 0))
+        partial = states.get(PARTIAL, (0, 0))
+        return (self.dbPath + '\t copied: %d files, %0.1f MB\t partial: %d files, %0.1f MB'
+                % (copied[0], copied[1] / 1e6, partial[0], partial[1] / 1e6))
+
+    def lookup(self, card, relpath, size, mtimeNs):
+        '''
+        :return: the journalEntry for this file, or None if there isn't one
+        '''
+        with self.lock:
+            row = self.db.execute('SELECT dest, state, offset, tail, digest FROM transfers '
+                                  'WHERE card=? AND relpath=? AND size=? AND mtime_ns=?',
+                                  (card, relpath, size, mtimeNs)).fetchone()
+        if row is None:
+            return None
+        return journalEntry(*row)
+
+    def _record(self, key, dest, state, offset, tail, digest):
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO transfers VALUES (?,?,?,?,?,?,?,?,?,?)',
+                            tuple(key) + (dest, state, offset, tail, digest, time.time()))
+            self.db.commit()
+
+    def checkpoint(self, key, dest, offset, tail):
+        '''
+        record that the first offset bytes of a file have been copied to dest, and synced
+        :param key: (card, relpath, size, mtimeNs)
+        '''
+        self._record(key, dest, PARTIAL, offset, tail, "")
+
+    def copied(self, key, dest, tail, digest):
+        '''
+        record that a file has been copied to dest in full
+        '''
+        self._record(key, dest, COPIED, key[2], tail, digest)
+
+    def finished(self, keys):
+        '''
+        :param keys: (card, relpath, size, mtimeNs) of files renamed to their final names
+        '''
+        with self.lock:
+            self.db.executemany('DELETE FROM transfers WHERE card=? AND relpath=? AND size=? AND mtime_ns=?',
+                                [tuple(k) for k in keys])
+            self.db.commit()
+
+    def forget(self, card = None):
+        '''
+        :param card: a card id, or None for everything
+        :return: number of entries removed. The temporary copies they point to are left on disk
+        '''
+        with self.lock:
+            if card is None:
+                cur = self.db.execute('DELETE FROM transfers')
+            else:
+                cur = self.db.execute('DELETE FROM transfers WHERE card=?', (card,))
+            self.db.commit()
+        return cur.rowcount
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description = "Inspect or clear the PhotoTransfer transfer journal")
+    parser.add_argument('--db', help = "journal file (default: %(default)s)", default = defaultJournalPath())
+    sub = parser.add_subparsers(dest = 'command', required = True)
+    sub.add_parser('stats', help = "show the journal location and what's in it")
+    fgt = sub.add_parser('forget', help = "forget unfinished copies, so they start again from scratch")
+    fgt.add_argument('sources', nargs = '*', help = "card roots to forget. Default: everything")
+    args = parser.parse_args()
+
+    journal = transferJournal(args.db)
+    if args.command == 'stats':
+        print(journal)
+    elif args.command == 'forget':
+        if args.sources:
+            removed = sum(journal.forget(importLedger.cardIdentity(s)) for s in args.sources)
+        else:
+            removed = journal.forget()
+        print('Removed %d entries' % removed)
+    journal.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+# Name: transferProgress.py
+#
+# Purpose:
+# Byte-weighted progress & ETA for a transfer, and the free space check before it starts.
+#   - the byte & file totals come from the card scan (mediaItem.size)
+#   - copies report each chunk as it lands (copyEngine's progress callback), so a 4GB clip
+#     moves the bar as it goes, not just when it finishes
+#   - throughput is smoothed (exponential moving average), the ETA is what's left at that rate
+#   - observers subscribe with a callback, called with a progressState at most every
+#     PUBLISH_INTERVAL seconds (and once at the end) - a console bar is included, a GUI can add its own
+# Files that fail or are dropped part way are skipped: their bytes come off what's left, without
+# counting towards the throughput.
+#
+
+# standard Python imports
+import os
+import sys
+import time
+import shutil
+import threading
+from datetime import timedelta
+
+# seconds between updates to the observers
+PUBLISH_INTERVAL = 0.5
+
+# weight of the newest throughput sample in the moving average
+RATE_SMOOTHING = 0.3
+
+# extra room wanted on each destination device, over the bytes to copy (manifests, folders, ...)
+FREE_SPACE_MARGIN = 64 * 1024 * 1024
+
+# width of the console bar, in characters
+BAR_WIDTH = 30
+
+
+class progressState():
+    '''
+    one snapshot of a transfer, as handed to the observers
+    '''
+    def __init__(self, bytesDone, bytesSkipped, totalBytes, filesDone, totalFiles, MBps, elapsed, finished):
+        self.bytesDone = bytesDone
+        self.bytesSkipped = bytesSkipped
+        self.totalBytes = totalBytes
+        self.filesDone = filesDone
+        self.totalFiles = totalFiles
+        self.MBps = MBps                # smoothed throughput
+        self.elapsed = elapsed          # seconds since the first byte
+        self.finished = finished
+
+    def fraction(self):
+        '''
+        :return: 0.0 - 1.0 of the bytes dealt with (copied or skipped)
+        '''
+        if self.totalBytes <= 0:
+            return 1.0 if self.finished else 0.0
+        return min(1.0, (self.bytesDone + self.bytesSkipped) / self.totalBytes)
+
+    def bytesLeft(self):
+        return max(0, self.totalBytes - self.bytesDone - self.bytesSkipped)
+
+    def eta(self):
+        '''
+        :return: estimated seconds to go, or None until there is a throughput to go on
+        '''
+        if self.finished:
+            return 0.0
+        if self.MBps <= 0:
+            return None
+        return self.bytesLeft() / 1e6 / self.MBps
+
+    def __str__(self):
+        eta = self.eta()
+        return '%5.1f%% %0.1f/%0.1f MB, %d/%d files, %0.1f MB/s, ETA %s' % (
+            self.fraction() * 100, (self.bytesDone + self.bytesSkipped) / 1e6, self.totalBytes / 1e6,
+            self.filesDone, self.totalFiles, self.MBps,
+            '--:--:--' if eta is None else str(timedelta(seconds = int(eta))))
+
+class transferProgress():
+    def __init__(self, totalBytes = 0, totalFiles = 0):
+        '''
+            :param totalBytes, totalFiles: what's to be transferred, if already known - else use addTotal()
+        '''
+        self.totalBytes = totalBytes
+        self.totalFiles = totalFiles
+        self.bytesDone = 0
+        self.bytesSkipped = 0
+        self.filesDone = 0
+        self.observers = []
+        self.lock = threading.Lock()
+        self.startTime = None
+        # throughput sampling
+        self.rate = 0.0
+        self.sampleTime = None
+        self.sampleBytes = 0
+        self.lastPublish = 0.0
+        self.finished = False
+
+    def subscribe(self, observer):
+        '''
+        :param observer: called as observer(progressState), from whichever thread made progress
+        '''
+        self.observers.append(observer)
+
+    def addTotal(self, nBytes, files = 1):
+        '''
+        add files found by the scan to the totals
+        '''
+        with self.lock:
+            self.totalBytes += nBytes
+            self.totalFiles += files
+
+    def advance(self, nBytes):
+        '''
+        nBytes more have been copied (called per chunk - matches copyEngine's progress callback)
+        '''
+        with self.lock:
+            now = time.monotonic()
+            if self.startTime is None:
+                self.startTime = self.sampleTime = now
+            self.bytesDone += nBytes
+            state = self._sample(now)
+        self._publish(state)
+
+    def fileDone(self):
+        with self.lock:
+            self.filesDone += 1
+            state = self._sample(time.monotonic())
+        self._publish(state)
+
+    def skip(self, nBytes, files = 1):
+        '''
+        take bytes/ files that won't be copied (failed, or dropped before copying) off what's left
+        '''
+        with self.lock:
+            self.bytesSkipped += nBytes
+            self.filesDone += files
+            state = self._sample(time.monotonic())
+        self._publish(state)
+
+    def retract(self, nBytes):
+        '''
+        take back bytes advanced for a copy that then failed (it is skip()ped instead)
+        '''
+        with self.lock:
+            self.bytesDone -= nBytes
+            self.sampleBytes -= nBytes
+
+    def finish(self):
+        '''
+        the transfer is over - tell the observers one last time
+        '''
+        with self.lock:
+            self.finished = True
+            state = self._state(time.monotonic())
+        self._publish(state)
+
+    def _sample(self, now):
+        '''
+        update the smoothed rate, and return a state to publish if it's time to. Call with lock held
+        '''
+        if now - self.lastPublish < PUBLISH_INTERVAL:
+            return None
+        self.lastPublish = now
+        if self.sampleTime is not None and now > self.sampleTime:
+            rate = (self.bytesDone - self.sampleBytes) / 1e6 / (now - self.sampleTime)
+            if self.rate == 0.0:
+                self.rate = rate
+            else:
+                self.rate = RATE_SMOOTHING * rate + (1 - RATE_SMOOTHING) * self.rate
+            self.sampleTime = now
+            self.sampleBytes = self.bytesDone
+        return self._state(now)
+
+    def _state(self, now):
+        elapsed = now - self.startTime if self.startTime is not None else 0.0
+        return progressState(self.bytesDone, self.bytesSkipped, self.totalBytes, self.filesDone, self.totalFiles,
+                             self.rate, elapsed, self.finished)
+
+    def _publish(self, state):
+        if state is None:
+            return
+        for observer in self.observers:
+            observer(state)
+
+class barLine():
+    '''
+    the console under a progress bar: anything written through it (errors, tracebacks) starts on a new line
+    rather than on the end of the bar. The bar is drawn again below it at the next update
+    '''
+    def __init__(self, out):
+        self.out = out
+        self.barShown = False
+
+    def write(self, text):
+        if text and self.barShown:
+            self.endBar()
+        return self.out.write(text)
+
+    def drawBar(self, text):
+        self.out.write('\r' + text)
+        self.out.flush()
+        self.barShown = True
+
+    def endBar(self):
+        '''
+        move off the bar's line, if it's up
+        '''
+        if self.barShown:
+            self.barShown = False
+            self.out.write('\n')
+            self.out.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.out, name)
+
+class consoleProgress():
+    '''
+    observer drawing a one line progress bar on the console, through a barLine of its own.
+    sys.stdout is left alone - a caller wanting other output kept off the bar points it at the
+    observer's line while the transfer runs, and puts it back after (try/finally)
+    '''
+    def __init__(self, out = None):
+        '''
+        :param out: the stream to draw on, default sys.stdout as it is now
+        '''
+        self.line = barLine(sys.stdout if out is None else out)
+
+    def __call__(self, state):
+        done = int(state.fraction() * BAR_WIDTH)
+        self.line.drawBar('[' + '#' * done + '.' * (BAR_WIDTH - done) + '] ' + str(state))
+        if state.finished:
+            self.line.endBar()
+
+def freeSpaceShortfall(needs, margin = FREE_SPACE_MARGIN):
+    '''
+    check there's room for a transfer before it starts
+    :param needs: {destination folder: bytes to be written there}. Folders on the same device are added up,
+            and those with nothing to write (eg no videos on the card) left out
+    :return: list of (folder, bytes needed, bytes free) for each device without enough room
+    '''
+    devices = {}
+    for folder, nBytes in needs.items():
+        if nBytes == 0:
+            continue
+        dev = os.stat(folder).st_dev
+        if dev in devices:
+            devices[dev][1] += nBytes
+        else:
+            devices[dev] = [folder, nBytes]
+
+    short = []
+    for folder, nBytes in devices.values():
+        free = shutil.disk_usage(folder).free
+        if nBytes + margin > free:
+            short.append((folder, nBytes + margin, free))
+    return short
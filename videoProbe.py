@@ -0,0 +1,274 @@
+# Name: videoProbe.py
+#
+# Purpose:
+# Get a clip's start time, duration and frame rate straight from the container headers,
+# without MediaInfo. Gives back the same General stream strings MediaInfo would, so
+# mediaItem.updateMediaTags() doesn't care which one did the work.
+#   MP4/MOV: walk the atoms with seeks (skipping mdat), and read only
+#            mvhd (creation time, duration), mdhd + stts of the video track (frame rate)
+#   MTS/M2TS: read the PES timestamps (PTS, the 90 kHz presentation clock - not the PCR) from the
+#            start and end of the file, a small chunk at a time until there are enough frames.
+#            Duration = last - first, frame rate from the spacing of the video frames
+# Returns None for anything it can't make sense of, so the caller can fall back to MediaInfo.
+#
+
+# standard Python imports
+import os
+import struct
+from datetime import datetime, timedelta, timezone
+
+# MP4 times count from here
+QT_EPOCH = datetime(1904, 1, 1)
+
+# atoms we go down into on the way to the video track's sample table
+MP4_CONTAINERS = {b'moov', b'trak', b'mdia', b'minf', b'stbl'}
+
+# MTS files are read a chunk at a time from each end, until TS_FRAMES video PTS are found (enough
+# for the smallest gap between them to be one frame, with B frames out of order), or up to the
+# HEAD/ TAIL limit for streams that are mostly something else
+TS_CHUNK_BYTES = 16 * 1024
+TS_FRAMES = 8
+TS_HEAD_BYTES = 512 * 1024
+TS_TAIL_BYTES = 256 * 1024
+
+# PTS clock
+PTS_HZ = 90000
+PTS_WRAP = 1 << 33
+
+
+def _fileModified(fileName):
+    '''
+    :return: the mod time, in MediaInfo's File_Modified_Date format (UTC)
+    '''
+    mtime = datetime.fromtimestamp(os.stat(fileName).st_mtime, timezone.utc)
+    return mtime.strftime("UTC %Y-%m-%d %H:%M:%S.") + "%03d" % (mtime.microsecond // 1000)
+
+def _tags(fileName, encodedDate, durationMs, fps):
+    return {"Encoded_Date": encodedDate,
+            "File_Modified_Date": _fileModified(fileName),
+            "Duration": "%d" % round(durationMs),
+            "FrameRate": "%.3f" % fps}
+
+#
+# MP4/ MOV
+#
+def _atoms(f, start, end):
+    '''
+    generator of (type, payload offset, payload size) for the atoms between start and end
+    '''
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(16)
+        if len(header) < 8:
+            return
+        size, atomType = struct.unpack('>I4s', header[:8])
+        headerSize = 8
+        if size == 1:
+            # 64 bit size follows
+            if len(header) < 16:
+                return
+            size = struct.unpack('>Q', header[8:16])[0]
+            headerSize = 16
+        elif size == 0:
+            # runs to the end of the file
+            size = end - pos
+        if size < headerSize:
+            raise ValueError("bad atom size")
+        yield atomType, pos + headerSize, size - headerSize
+        pos += size
+
+def _readAtom(f, offset, size, maxBytes = 4096):
+    f.seek(offset)
+    return f.read(min(size, maxBytes))
+
+def _mvhd(data):
+    '''
+    :return: (creation time in seconds since 1904, timescale, duration)
+    '''
+    if data[0] == 1:
+        created, modified, timescale, duration = struct.unpack('>QQIQ', data[4:32])
+    else:
+        created, modified, timescale, duration = struct.unpack('>IIII', data[4:20])
+    return created, timescale, duration
+
+def probeMP4(fileName):
+    '''
+    :return: dict of MediaInfo style General tags, or None
+    '''
+    fileSize = os.path.getsize(fileName)
+    created = timescale = duration = None
+    fps = None
+    with open(fileName, 'rb') as f:
+        # walk the atoms between start and end. track collects the current trak's timescale & handler
+        def walk(start, end, track):
+            nonlocal created, timescale, duration, fps
+            for atomType, offset, size in _atoms(f, start, end):
+                if atomType == b'mvhd':
+                    created, timescale, duration = _mvhd(_readAtom(f, offset, size))
+                elif atomType == b'trak':
+                    # each track keeps its own mdhd timescale and handler type
+                    walk(offset, offset + size, {})
+                elif atomType in MP4_CONTAINERS:
+                    walk(offset, offset + size, track)
+                elif atomType == b'mdhd':
+                    data = _readAtom(f, offset, size)
+                    if data[0] == 1:
+                        track['timescale'] = struct.unpack('>I', data[20:24])[0]
+                    else:
+                        track['timescale'] = struct.unpack('>I', data[12:16])[0]
+                elif atomType == b'hdlr':
+                    track['video'] = _readAtom(f, offset, size)[8:12] == b'vide'
+                elif atomType == b'stts' and track.get('video') and fps is None:
+                    # (sample count, sample duration) pairs - only the totals are needed
+                    entries = struct.unpack('>I', _readAtom(f, offset + 4, 4))[0]
+                    if entries * 8 > size:
+                        raise ValueError("bad stts")
+                    table = _readAtom(f, offset + 8, entries * 8, entries * 8)
+                    samples = frameTime = 0
+                    for i in range(entries):
+                        count, delta = struct.unpack('>II', table[i * 8:i * 8 + 8])
+                        samples += count
+                        frameTime += count * delta
+                    if frameTime and track.get('timescale'):
+                        fps = samples * track['timescale'] / frameTime
+                if atomType == b'moov':
+                    # everything needed is in moov - don't walk the rest of the file
+                    return
+
+        walk(0, fileSize, {})
+
+    if created is None or not timescale or fps is None:
+        return None
+
+    encodedDate = ""
+    if created:
+        encodedDate = (QT_EPOCH + timedelta(seconds = created)).strftime("UTC %Y-%m-%d %H:%M:%S")
+    return _tags(fileName, encodedDate, duration * 1000 / timescale, fps)
+
+#
+# MTS/ M2TS (AVCHD)
+#
+def _packetSize(data):
+    '''
+    :return: (packet size, offset of the first sync byte) - 192 byte packets for AVCHD .MTS, 188 for plain TS
+    '''
+    for size, first in ((192, 4), (188, 0)):
+        if len(data) >= first + 3 * size and all(data[first + i * size] == 0x47 for i in range(3)):
+            return size, first
+    raise ValueError("not a transport stream")
+
+def _resync(data, size, first):
+    '''
+    :return: offset of the first sync byte in a block read from the middle of a file
+    '''
+    for start in range(first, first + size):
+        if all(start + i * size < len(data) and data[start + i * size] == 0x47 for i in range(3)):
+            return start
+    raise ValueError("lost transport stream sync")
+
+def _pesTimestamps(data, size, start):
+    '''
+    :return: (list of (is video, PTS) for each PES that starts in the block, offset of the first
+             packet that isn't all in the block)
+    '''
+    stamps = []
+    packets = range(start, len(data) - 187, size)
+    for pos in packets:
+        if data[pos] != 0x47 or not data[pos + 1] & 0x40:
+            # not a packet that starts a PES
+            continue
+        payload = pos + 4
+        adaptation = (data[pos + 3] >> 4) & 3
+        if adaptation in (2, 3):
+            payload += 1 + data[pos + 4]
+        if adaptation == 2 or payload + 14 > pos + 188:
+            continue
+        if data[payload:payload + 3] != b'\0\0\1' or not data[payload + 7] & 0x80:
+            continue
+        p = data[payload + 9:payload + 14]
+        pts = ((p[0] >> 1) & 7) << 30 | p[1] << 22 | (p[2] >> 1) << 15 | p[3] << 7 | p[4] >> 1
+        stamps.append((0xE0 <= data[payload + 3] <= 0xEF, pts))
+    return stamps, start + len(packets) * size
+
+def _videoCount(stamps):
+    return sum(1 for isVideo, pts in stamps if isVideo)
+
+def _headStamps(f):
+    '''
+    read from the start of the file, a chunk at a time, until TS_FRAMES video PTS (or TS_HEAD_BYTES)
+    :return: PES timestamps as _pesTimestamps, packet size
+    '''
+    head = bytearray(f.read(TS_CHUNK_BYTES))
+    size, pos = _packetSize(head)
+    stamps = []
+    while True:
+        found, pos = _pesTimestamps(head, size, pos)
+        stamps += found
+        if _videoCount(stamps) >= TS_FRAMES or len(head) >= TS_HEAD_BYTES:
+            return stamps, size
+        chunk = f.read(TS_CHUNK_BYTES)
+        if not chunk:
+            return stamps, size
+        head += chunk
+
+def _tailStamps(f, fileSize, size):
+    '''
+    read back from the end of the file, doubling the block from TS_CHUNK_BYTES, until it holds
+    TS_FRAMES video PTS (or TS_TAIL_BYTES) - the largest PTS is in the last few frames, but not
+    always the last one stored
+    :return: PES timestamps as _pesTimestamps
+    '''
+    tail = b''
+    tailStart = fileSize
+    blockBytes = TS_CHUNK_BYTES
+    while True:
+        start = max(0, fileSize - blockBytes)
+        f.seek(start)
+        tail = f.read(tailStart - start) + tail
+        tailStart = start
+        stamps, pos = _pesTimestamps(tail, size, _resync(tail, size, 0))
+        if _videoCount(stamps) >= TS_FRAMES or blockBytes >= TS_TAIL_BYTES or start == 0:
+            return stamps
+        blockBytes = min(blockBytes * 2, TS_TAIL_BYTES)
+
+def probeMTS(fileName):
+    '''
+    timings from the PES presentation timestamps (PTS, 90 kHz) - the PCR isn't read
+    :return: dict of MediaInfo style General tags, or None
+    '''
+    fileSize = os.path.getsize(fileName)
+    with open(fileName, 'rb') as f:
+        headStamps, size = _headStamps(f)
+        tailStamps = _tailStamps(f, fileSize, size)
+
+    video = sorted(pts for isVideo, pts in headStamps if isVideo)
+    if len(video) < 2 or not tailStamps:
+        return None
+    # frames are stored out of order (B frames) - the smallest gap between presentation times is one frame
+    frameTicks = min(b - a for a, b in zip(video, video[1:]) if b > a)
+    firstPTS = min(pts for isVideo, pts in headStamps)
+    lastPTS = max(pts for isVideo, pts in tailStamps)
+    if lastPTS < firstPTS:
+        # the 33 bit clock wrapped during the clip
+        lastPTS += PTS_WRAP
+    durationMs = (lastPTS - firstPTS + frameTicks) * 1000 / PTS_HZ
+
+    # AVCHD clips carry no encoded date - the caller works back from the mod time, as with MediaInfo
+    return _tags(fileName, "", durationMs, PTS_HZ / frameTicks)
+
+def probeVideo(fileName):
+    '''
+    :return: dict of the MediaInfo General tags used for renaming
+             (Encoded_Date, File_Modified_Date, Duration, FrameRate), or None if this file type/ file
+             can't be read here
+    '''
+    fileType = fileName[fileName.rfind('.')+1:].upper()
+    try:
+        if fileType in ('MP4', 'MOV', 'M4V'):
+            return probeMP4(fileName)
+        elif fileType in ('MTS', 'M2TS', 'TS'):
+            return probeMTS(fileName)
+    except (OSError, ValueError, IndexError, struct.error):
+        pass
+    return None